@@ -0,0 +1,223 @@
+# bench_proxy.py
+# วัดประสิทธิภาพของ SA-MP UDP Proxy แต่ละ engine (fake_server.ENGINES)
+# สร้างเซิร์ฟเวอร์ echo จำลองในเครื่อง → ยิง packet ผ่าน proxy → วัด packets/sec และ latency (p50 / p99)
+#
+# ใช้งาน: python bench_proxy.py --duration 5 --window 32
+#         python bench_proxy.py --flood 200000   (วัด latency ของ client ปกติระหว่างถูก flood)
+#         python bench_proxy.py --flood 200000 --flood-control
+#             (วัดซ้ำโดยยิง flood ใส่ socket ที่ไม่มีใครอ่าน → แยกผลของการแย่ง CPU ในเครื่องออกจากต้นทุนของ proxy)
+# หมายเหตุ: ระหว่างวัดจะปิด stdout ชั่วคราว เพื่อไม่ให้ log ของ proxy ไปปนกับผล
+#           เซิร์ฟเวอร์ echo และ client รันใน process แยก → proxy ไม่ต้องแย่ง GIL กับตัววัด
+
+import argparse
+import contextlib
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import time
+
+import fake_server
+
+PACKET = struct.Struct("<IQ")   # sequence, เวลาที่ส่ง (perf_counter_ns)
+
+
+def echo_server(port, ready, stop):
+    """ เซิร์ฟเวอร์จำลอง (process แยก): ส่ง packet กลับไปหาผู้ส่งทันที """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    port.value = sock.getsockname()[1]
+    ready.set()
+
+    sock.settimeout(0.2)
+    while not stop.is_set():
+        try:
+            data, addr = sock.recvfrom(65535)
+            sock.sendto(data, addr)
+        except socket.timeout:
+            continue
+        except OSError:
+            break
+    sock.close()
+
+
+def run_client(proxy_addr, duration: float, window: int, payload_size: int) -> tuple[int, list]:
+    """
+    ส่ง packet ผ่าน proxy โดยให้มี packet ค้างในระบบไม่เกิน window ตัว
+    คืน (จำนวนที่ได้รับ, รายการ latency หน่วย ns)
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(proxy_addr)
+    sock.settimeout(0.5)
+
+    padding = b"\x00" * max(0, payload_size - PACKET.size)
+    latencies = []
+    seq = 0
+    in_flight = 0
+    deadline = time.perf_counter() + duration
+
+    while time.perf_counter() < deadline:
+        while in_flight < window:
+            sock.send(PACKET.pack(seq, time.perf_counter_ns()) + padding)
+            seq += 1
+            in_flight += 1
+
+        try:
+            data = sock.recv(65535)
+        except socket.timeout:
+            in_flight = 0   # ถือว่า packet ที่ค้างหายไปแล้ว เริ่มรอบใหม่
+            continue
+
+        _, sent_at = PACKET.unpack_from(data)
+        latencies.append(time.perf_counter_ns() - sent_at)
+        in_flight -= 1
+
+    sock.close()
+    return len(latencies), latencies
+
+
+def flood(proxy_addr, rate: float, sources: int, stop):
+    """
+    ยิง packet ขยะใส่ proxy จากหลาย source port (process แยก) ที่อัตราประมาณ rate packet/วินาที
+    ผสม packet 3 แบบ: ใหญ่เกิน, query ผิดรูปแบบ, และ query 'i' ที่ถูกต้อง (ต้องโดน rate limit)
+    """
+    socks = []
+    for _ in range(sources):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.connect(proxy_addr)
+        socks.append(sock)
+
+    packets = (b"\x00" * 4096, b"SAMP\x7f\x00\x00\x01\x61\x1e", b"SAMP\x7f\x00\x00\x01\x61\x1ei")
+    sent = 0
+    started = time.perf_counter()
+
+    while not stop.is_set():
+        # ส่งเป็นชุด แล้วพักให้อัตราเฉลี่ยเท่ากับ rate
+        for _ in range(256):
+            try:
+                socks[sent % sources].send(packets[sent % 3])
+            except OSError:
+                pass
+            sent += 1
+        ahead = sent / rate - (time.perf_counter() - started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    for sock in socks:
+        sock.close()
+
+
+def _client_process(proxy_addr, duration, window, payload_size, results):
+    results.put(run_client(proxy_addr, duration, window, payload_size))
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def bench_engine(name: str, duration: float, window: int, payload_size: int, flood_rate: float = 0,
+                 source_rate: float = 0, flood_control: bool = False) -> dict:
+    port = multiprocessing.Value("i", 0)
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    upstream = multiprocessing.Process(target=echo_server, args=(port, ready, stop), daemon=True)
+    upstream.start()
+    ready.wait()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        proxy = fake_server.ENGINES[name](
+            local_host="127.0.0.1",
+            local_port=0,
+            real_server=("127.0.0.1", port.value),
+            rate_limiter=fake_server.RateLimiter(source_rate=source_rate)
+        )
+        proxy.start()
+        flooder = None
+        flood_stop = multiprocessing.Event()
+        # control: ยิงเท่ากันแต่ใส่ socket ที่ไม่มีใครอ่าน (kernel ทิ้งเองเมื่อ buffer เต็ม)
+        sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if flood_control else None
+        try:
+            if flood_rate > 0:
+                if sink is not None:
+                    sink.bind(("127.0.0.1", 0))
+                    flood_addr = sink.getsockname()
+                else:
+                    flood_addr = ("127.0.0.1", proxy.LOCAL_PORT)
+                flooder = multiprocessing.Process(
+                    target=flood,
+                    args=(flood_addr, flood_rate, 64, flood_stop),
+                    daemon=True
+                )
+                flooder.start()
+            results = multiprocessing.Queue()
+            client = multiprocessing.Process(
+                target=_client_process,
+                args=(("127.0.0.1", proxy.LOCAL_PORT), duration, window, payload_size, results),
+                daemon=True
+            )
+            cpu_started = time.process_time()
+            client.start()
+            received, latencies = results.get()
+            # process นี้มีแค่ proxy ทำงาน → เวลา CPU ที่ใช้คือต้นทุนของ proxy ล้วน ๆ
+            cpu_used = time.process_time() - cpu_started
+            client.join()
+        finally:
+            flood_stop.set()
+            if flooder is not None:
+                flooder.join()
+            if sink is not None:
+                sink.close()
+            filtered = sum(proxy.filtered.values())
+            # เวลาที่ proxy ใช้ forward packet ของ client ปกติ (ไม่รวมเวลารอคิวใน kernel / scheduler)
+            forwarded = sum(session.c2s.packets for session in proxy.sessions)
+            forward_ns = sum(session.c2s.latency_ns for session in proxy.sessions)
+            proxy.stop()
+            stop.set()
+            upstream.join()
+
+    return {
+        "engine": name + (" (control)" if flood_control and flood_rate > 0 else ""),
+        "pps": received / duration,
+        "p50_us": percentile(latencies, 50) / 1000,
+        "p99_us": percentile(latencies, 99) / 1000,
+        # ต่อ packet ไป-กลับ (proxy forward 2 ครั้ง)
+        "cpu_us": cpu_used / received * 1e6 if received else float("nan"),
+        "forward_us": forward_ns / forwarded / 1000 if forwarded else float("nan"),
+        "filtered": filtered,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SA-MP UDP Proxy benchmark")
+    parser.add_argument("--duration", type=float, default=5.0, help="เวลาวัดต่อ engine (วินาที)")
+    parser.add_argument("--window", type=int, default=32, help="จำนวน packet ที่ค้างในระบบได้พร้อมกัน")
+    parser.add_argument("--size", type=int, default=64, help="ขนาด packet (bytes)")
+    parser.add_argument("--engine", action="append", choices=sorted(fake_server.ENGINES),
+                        help="engine ที่ต้องการวัด (ระบุซ้ำได้, ค่าเริ่มต้น = ทุก engine)")
+    parser.add_argument("--rate-per-source", type=float, default=0,
+                        help="จำกัด packet/วินาที ต่อ client (0 = ไม่จำกัด เพื่อไม่ให้ตัววัดโดนจำกัดเอง)")
+    parser.add_argument("--flood", type=float, default=0,
+                        help="ยิง packet ขยะใส่ proxy พร้อมกันที่อัตรานี้ (packet/วินาที, 0 = ไม่ยิง)")
+    parser.add_argument("--flood-control", action="store_true",
+                        help="วัดเพิ่มอีกรอบโดยยิง flood ใส่ socket ที่ไม่มีใครอ่านแทน proxy (ใช้เทียบ)")
+    args = parser.parse_args()
+
+    engines = args.engine or list(fake_server.ENGINES)
+
+    print(f"{'engine':<22}{'packets/s':>12}{'p50 (µs)':>12}{'p99 (µs)':>12}{'CPU µs/pkt':>12}{'fwd µs':>10}{'filtered':>12}")
+    for name in engines:
+        for control in ((False, True) if args.flood_control and args.flood > 0 else (False,)):
+            result = bench_engine(name, args.duration, args.window, args.size, args.flood, args.rate_per_source,
+                                  control)
+            print(f"{result['engine']:<22}{result['pps']:>12.0f}{result['p50_us']:>12.1f}{result['p99_us']:>12.1f}"
+                  f"{result['cpu_us']:>12.1f}{result['forward_us']:>10.2f}{result['filtered']:>12}")
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,30 +4,940 @@
 # แต่ มีข้อเสียคือ อาจจะมี Latency เพิ่มขึ้นเล็กน้อย และอาจจะมีปัญหาเรื่องการเชื่อมต่อหาก Proxy ไม่เสถียร หรือมีการปิด Proxy โดยไม่ตั้งใจ
 # และ หากมีการโจมตีแบบ DDoS หรือ Flooding มาที่ Proxy ก็อาจจะทำให้ Proxy ล่มได้ ดังนั้น ควรใช้ Proxy นี้ในสภาพแวดล้อมที่มีความปลอดภัย และไม่เปิดเผยต่อสาธารณะมากนัก
 
+import os
 import socket
+import select
+import selectors
 import threading
 import argparse
 import time
+import sys
+import ctypes
+import errno
+import struct
+import json
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ======================
+# LOGGING
+# ======================
+LOG_LEVELS = {"off": 0, "error": 1, "info": 2, "debug": 3}
+
+
+class PacketLogger:
+    """
+    Logger ของ proxy ที่ไม่ทำให้ thread forward ต้องรอ I/O
+
+    - ข้อความถูกใส่คิว (deque) แล้ว thread เบื้องหลังเป็นคนเขียนลง stdout / ไฟล์
+    - log ราย packet ทำงานเฉพาะระดับ debug และสุ่มเก็บ 1 ใน sample_every packet
+    - hex dump ตัดที่ max_dump bytes
+    - คิวเต็ม → ทิ้งข้อความเก่าสุด (นับไว้ใน dropped) ไม่ block ผู้เรียก
+    """
+
+    def __init__(self, level="info", sample_every=1, max_dump=64, stream=None, max_queue=10000):
+        self.level = LOG_LEVELS[level] if isinstance(level, str) else level
+        self.sample_every = max(1, sample_every)
+        self.max_dump = max_dump
+        self.stream = stream or sys.stdout
+
+        self.queue = deque(maxlen=max_queue)
+        self.dropped = 0
+        self._counter = 0
+        self._wake = threading.Event()
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def enabled(self, level):
+        return self.level >= LOG_LEVELS[level]
+
+    # ---------- API ----------
+    def error(self, *parts):
+        if self.level >= 1:
+            self._put(("ERROR", parts))
+
+    def info(self, *parts):
+        if self.level >= 2:
+            self._put(("INFO", parts))
+
+    def packet(self, direction, data, addr=None):
+        """ log ราย packet (เรียกเฉพาะเมื่อเปิดระดับ debug, ดู SampUDPProxy.packet_log) """
+        self._counter += 1
+        if self._counter % self.sample_every:
+            return
+        # เก็บแค่ส่วนที่จะ dump → ไม่ copy ทั้ง packet
+        self._put(("PACKET", (direction, len(data), bytes(data[:self.max_dump]), addr)))
+
+    def close(self, timeout=1.0):
+        """ เขียนข้อความที่ค้างอยู่ให้หมดแล้วหยุด thread """
+        writer = self._writer
+        if writer is None:
+            return
+        self._writer = None
+        self._wake.set()
+        writer.join(timeout)
+
+    # ---------- ภายใน ----------
+    def _put(self, item):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append((time.time(), item))
+
+        if self._writer is None:
+            self._start_writer()
+        self._wake.set()
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        me = threading.current_thread()
+        while True:
+            self._wake.wait(0.5)
+            self._wake.clear()
+
+            lines = []
+            while self.queue:
+                timestamp, (kind, payload) = self.queue.popleft()
+                lines.append(self._format(timestamp, kind, payload))
+
+            if lines:
+                try:
+                    self.stream.write("\n".join(lines) + "\n")
+                    self.stream.flush()
+                except (AttributeError, OSError, ValueError):
+                    pass  # ไม่มี / ปิด stdout แล้ว (เช่นรันในโปรแกรม GUI ที่ไม่มี console)
+
+            if self._writer is not me and not self.queue:
+                return
+
+    def _format(self, timestamp, kind, payload):
+        clock = time.strftime("%H:%M:%S", time.localtime(timestamp))
+        if kind != "PACKET":
+            return f"[{clock}] {kind}: " + " ".join(str(part) for part in payload)
+
+        direction, size, head, addr = payload
+        dump = head.hex(" ")
+        if size > len(head):
+            dump += f" ... (+{size - len(head)} bytes)"
+        source = f" {addr[0]}:{addr[1]}" if addr else ""
+        return f"[{clock}] {direction}{source} [{size} bytes] {dump}"
+
+
+# ======================
+# STATS
+# ======================
+# ขอบบนของแต่ละช่อง histogram เวลา forward (microseconds) ช่องสุดท้าย = มากกว่านั้น
+LATENCY_BUCKETS_US = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+_LATENCY_BOUNDS_NS = tuple(bound * 1000 for bound in LATENCY_BUCKETS_US)
+
+
+class TrafficStats:
+    """
+    ตัวนับของทิศทางหนึ่ง: packets, bytes, drops + histogram เวลา forward แบบช่องคงที่
+
+    ไม่มี lock: ทุก object มีผู้เขียนแค่ thread เดียว (thread ที่อ่านทิศทางนั้นของ session นั้น)
+    ผู้อ่าน (stats endpoint) รวมค่าจากทุก object ตอนถูกเรียก (sharded counters)
+    """
+    __slots__ = ("packets", "bytes", "drops", "buckets", "latency_ns")
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+        self.drops = 0
+        self.buckets = [0] * (len(_LATENCY_BOUNDS_NS) + 1)
+        self.latency_ns = 0
+
+    def record(self, size, elapsed_ns):
+        self.packets += 1
+        self.bytes += size
+        self.buckets[bisect_left(_LATENCY_BOUNDS_NS, elapsed_ns)] += 1
+        self.latency_ns += elapsed_ns
+
+    def merge(self, other):
+        self.packets += other.packets
+        self.bytes += other.bytes
+        self.drops += other.drops
+        self.latency_ns += other.latency_ns
+        for i, count in enumerate(other.buckets):
+            self.buckets[i] += count
+        return self
+
+    def as_dict(self):
+        labels = [str(bound) for bound in LATENCY_BUCKETS_US] + ["+Inf"]
+        return {
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "drops": self.drops,
+            "latency_us": {
+                "buckets": dict(zip(labels, self.buckets)),
+                "sum": self.latency_ns / 1000,
+                "count": sum(self.buckets),
+            },
+        }
+
+
+DIRECTIONS = ("c2s", "s2c")
+
+
+def prometheus_text(snapshot):
+    """ แปลง snapshot (SampUDPProxy.snapshot()) เป็น Prometheus text format """
+    # metric เดียวกันต้องอยู่ติดกันเป็นกลุ่ม → เก็บแยกตามชื่อก่อนแล้วค่อยต่อกัน
+    families = {}
+
+    def sample(name, kind, labels, value):
+        lines = families.setdefault(name, [f"# TYPE {name} {kind}"])
+        label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    def traffic(prefix, labels, stats):
+        sample(f"{prefix}_packets_total", "counter", labels, stats["packets"])
+        sample(f"{prefix}_bytes_total", "counter", labels, stats["bytes"])
+        sample(f"{prefix}_drops_total", "counter", labels, stats["drops"])
+
+        name = f"{prefix}_forward_seconds"
+        latency = stats["latency_us"]
+        families.setdefault(name, [f"# TYPE {name} histogram"])
+        cumulative = 0
+        for bound, count in latency["buckets"].items():
+            cumulative += count
+            le = bound if bound == "+Inf" else f"{int(bound) / 1e6:g}"
+            sample(f"{name}_bucket", "histogram", {**labels, "le": le}, cumulative)
+        sample(f"{name}_sum", "histogram", labels, f"{latency['sum'] / 1e6:.9f}")
+        sample(f"{name}_count", "histogram", labels, latency["count"])
+
+    for direction in DIRECTIONS:
+        traffic("samp_proxy", {"direction": direction}, snapshot["directions"][direction])
+
+    for client in snapshot["clients"]:
+        for direction in DIRECTIONS:
+            traffic("samp_proxy_client", {"client": client["addr"], "direction": direction}, client[direction])
+
+    sample("samp_proxy_sessions", "gauge", {}, snapshot["sessions"])
+
+    for reason, count in snapshot.get("filtered", {}).items():
+        sample("samp_proxy_filtered_total", "counter", {"reason": reason}, count)
+
+    for upstream in snapshot.get("upstreams", []):
+        labels = {"upstream": upstream["addr"]}
+        sample("samp_proxy_upstream_up", "gauge", labels, int(upstream["healthy"]))
+        sample("samp_proxy_upstream_sessions", "gauge", labels, upstream["sessions"])
+        if upstream["rtt_ms"] is not None:
+            sample("samp_proxy_upstream_rtt_seconds", "gauge", labels, f"{upstream['rtt_ms'] / 1000:.6f}")
+    sample("samp_proxy_uptime_seconds", "gauge", {}, f"{snapshot['uptime']:.3f}")
+
+    cache = snapshot.get("query_cache")
+    if cache:
+        sample("samp_proxy_query_cache_hits_total", "counter", {}, cache["hits"])
+        sample("samp_proxy_query_cache_misses_total", "counter", {}, cache["misses"])
+
+    lines = []
+    for name, family in families.items():
+        # _bucket / _sum / _count อยู่ใต้ TYPE ของ histogram แม่ ไม่ต้องมี TYPE ของตัวเอง
+        if name.endswith(("_bucket", "_sum", "_count")) and name.rsplit("_", 1)[0] in families:
+            family = family[1:]
+        lines.extend(family)
+
+    return "\n".join(lines) + "\n"
+
+
+class _StatsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        snapshot = self.server.proxy.snapshot()
+
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body = prometheus_text(snapshot).encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path in ("/", "/stats", "/stats.json"):
+            body = json.dumps(snapshot, ensure_ascii=False).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # ไม่ต้อง log ทุกครั้งที่ถูก scrape
+
+
+class StatsServer:
+    """
+    HTTP endpoint สำหรับดูสถิติของ proxy (bind 127.0.0.1 เท่านั้น)
+
+    GET /stats    → JSON
+    GET /metrics  → Prometheus text
+    """
+
+    def __init__(self, proxy, port):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), _StatsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.proxy = proxy
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# ======================
+# SESSIONS
+# ======================
+class Session:
+    """ client หนึ่งตัว: socket ฝั่งเซิร์ฟเวอร์ของตัวเอง + เวลาที่ client ส่ง packet ล่าสุด + สถิติแยกทิศทาง """
+    __slots__ = ("addr", "sock", "upstream", "last_seen", "closed", "c2s", "s2c", "bucket")
+
+    def __init__(self, addr, sock, upstream, last_seen):
+        self.addr = addr
+        self.sock = sock
+        self.upstream = upstream
+        self.last_seen = last_seen
+        self.closed = False
+        self.c2s = TrafficStats()
+        self.s2c = TrafficStats()
+        self.bucket = None      # TokenBucket ของ client นี้ (None = ไม่จำกัด)
+
+
+class SessionTable:
+    """
+    ตาราง NAT: client address → Session (socket ที่ connect ไปเซิร์ฟเวอร์จริงแยกต่อ client)
+    ทำให้หลาย client ใช้ proxy ตัวเดียวกันได้โดยคำตอบไม่สลับกัน
+
+    - เรียงจาก client ที่เงียบนานสุด → ล่าสุด (OrderedDict) หา session ที่หมดอายุได้โดยไม่ต้องวนทั้งตาราง
+    - ไม่มี packet จาก client เกิน idle_timeout วินาที → ถูกลบ
+    - จำนวน session ไม่เกิน max_sessions (เต็มแล้วจะแทนที่ตัวที่เงียบนานสุด)
+    """
+
+    def __init__(self, idle_timeout=60.0, max_sessions=256):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max(1, max_sessions)
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    def get(self, addr, now):
+        """ คืน session ของ client (None = ยังไม่มี) และบันทึกว่าเพิ่งมีการใช้งาน """
+        session = self._sessions.get(addr)
+        if session is not None:
+            session.last_seen = now
+            self._sessions.move_to_end(addr)
+        return session
+
+    def add(self, session):
+        """ เพิ่ม session ใหม่ คืน list ของ session ที่ถูกแทนที่เพราะตารางเต็ม """
+        evicted = []
+        while len(self._sessions) >= self.max_sessions:
+            evicted.append(self._sessions.popitem(last=False)[1])
+        self._sessions[session.addr] = session
+        return evicted
+
+    def expired(self, now):
+        """ ดึง session ที่เงียบเกิน idle_timeout ออกจากตาราง """
+        expired = []
+        deadline = now - self.idle_timeout
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_seen > deadline:
+                break
+            expired.append(self._sessions.popitem(last=False)[1])
+        return expired
+
+    def replace(self, session):
+        """ แทนที่ session ของ client เดิม (ลำดับในตารางไม่เปลี่ยน) """
+        self._sessions[session.addr] = session
+
+    def clear(self):
+        """ ดึงทุก session ออกจากตาราง """
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        return sessions
+
+
+# ======================
+# UPSTREAMS
+# ======================
+def parse_endpoint(text, default_port=7777):
+    """ "ip:port" / "ip" → (ip, port) """
+    host, _, port = text.strip().rpartition(":") if ":" in text else (text.strip(), "", "")
+    return host, int(port or default_port)
+
+
+class Upstream:
+    """ เซิร์ฟเวอร์ปลายทาง 1 ตัว + ผล probe ล่าสุด """
+    __slots__ = ("addr", "header", "srtt", "last_reply", "sent", "received", "healthy")
+
+    def __init__(self, addr, now):
+        self.addr = addr
+        self.srtt = None        # วินาที (None = ยังไม่เคยได้คำตอบ)
+        self.last_reply = now
+        self.sent = 0
+        self.received = 0
+        self.healthy = True
+
+        # header ของ packet ping 'p': "SAMP" + ip + port (little-endian)
+        try:
+            ip = socket.inet_aton(socket.gethostbyname(addr[0]))
+        except OSError:
+            ip = bytes(4)
+        self.header = b"SAMP" + ip + struct.pack("<H", addr[1]) + b"p"
+
+    def __str__(self):
+        return f"{self.addr[0]}:{self.addr[1]}"
+
+
+class UpstreamPool:
+    """
+    รายชื่อเซิร์ฟเวอร์ปลายทาง (เช่น relay หลายภูมิภาค) + thread ที่ probe ด้วย SA-MP ping ('p') เป็นระยะ
+
+    - session ใหม่ → ไปที่ตัวที่ healthy และ RTT (ค่าเฉลี่ยถ่วงน้ำหนัก) ต่ำสุด
+    - ไม่ตอบ ping ติดกันเกิน max_missed รอบ → ไม่ healthy (proxy ย้าย session ออก)
+    - มีตัวเดียว → ไม่ probe (พฤติกรรมเหมือนเดิม)
+    """
+
+    def __init__(self, addrs, log, probe_interval=2.0, probe_timeout=1.0, max_missed=3):
+        now = time.monotonic()
+        self.upstreams = [Upstream(addr, now) for addr in addrs]
+        self.log = log
+        self.probe_interval = probe_interval
+        self.probe_timeout = min(probe_timeout, probe_interval)
+        self.max_missed = max_missed
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.upstreams)
+
+    def best(self):
+        """ ตัวที่ควรใช้สำหรับ session ใหม่ """
+        healthy = [upstream for upstream in self.upstreams if upstream.healthy]
+        if not healthy:
+            # ไม่มีตัวไหนตอบเลย → เลือกตัวที่ตอบล่าสุด
+            return max(self.upstreams, key=lambda upstream: upstream.last_reply)
+        # ยังไม่มีผล probe → ลำดับตามที่ระบุ (min คืนตัวแรกเมื่อค่าเท่ากัน)
+        return min(healthy, key=lambda upstream: upstream.srtt if upstream.srtt is not None else float("inf"))
+
+    def any_down(self):
+        return any(not upstream.healthy for upstream in self.upstreams)
+
+    def start(self):
+        if len(self.upstreams) < 2 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._probe_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(self.probe_timeout + 1)
+        self._thread = None
+
+    # ---------- ภายใน ----------
+    def _probe_loop(self):
+        socks = {}
+        for upstream in self.upstreams:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            try:
+                sock.connect(upstream.addr)
+            except OSError as e:
+                self.log.error(f"Upstream {upstream}: {e}")
+            socks[sock] = upstream
+
+        try:
+            while not self._stop.is_set():
+                started = time.monotonic()
+                self._probe_round(socks)
+                self._stop.wait(max(0.0, self.probe_interval - (time.monotonic() - started)))
+        finally:
+            for sock in socks:
+                sock.close()
+
+    def _probe_round(self, socks):
+        expected = {}
+        sent_at = time.perf_counter()
+
+        for sock, upstream in socks.items():
+            packet = upstream.header + os.urandom(4)
+            try:
+                sock.send(packet)
+            except OSError:
+                continue
+            upstream.sent += 1
+            expected[sock] = packet
+
+        replied = set()
+        deadline = sent_at + self.probe_timeout
+        while expected and len(replied) < len(expected):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            readable, _, _ = select.select(list(expected), [], [], remaining)
+            received_at = time.perf_counter()
+
+            for sock in readable:
+                try:
+                    data = sock.recv(2048)
+                except OSError:
+                    continue  # ICMP unreachable
+                # คำตอบต้อง echo header + token 4 bytes เดิม
+                if sock in replied or data[:len(expected[sock])] != expected[sock]:
+                    continue
+                replied.add(sock)
+                self._update(socks[sock], received_at - sent_at)
+
+        now = time.monotonic()
+        for sock, upstream in socks.items():
+            if sock in replied:
+                continue
+            if upstream.healthy and now - upstream.last_reply > self.probe_interval * self.max_missed:
+                upstream.healthy = False
+                self.log.info(f"Upstream {upstream} DOWN (ไม่ตอบ ping)")
+
+    def _update(self, upstream, rtt):
+        upstream.received += 1
+        upstream.last_reply = time.monotonic()
+        # ค่าเฉลี่ยถ่วงน้ำหนักแบบเดียวกับ TCP (1/8)
+        upstream.srtt = rtt if upstream.srtt is None else upstream.srtt + (rtt - upstream.srtt) / 8
+        if not upstream.healthy:
+            upstream.healthy = True
+            self.log.info(f"Upstream {upstream} UP ({rtt * 1000:.1f} ms)")
+
+
+# ======================
+# QUERY CACHE
+# ======================
+# packet query ของ SA-MP: "SAMP" + ip(4) + port(2) + opcode(1) → คำตอบขึ้นต้นด้วย header 11 bytes เดิม
+QUERY_HEADER_SIZE = 11
+# opcode ที่ตอบจาก cache ได้ ('d' / 'p' ส่งต่อตรง: 'p' ใช้วัด ping จริง)
+QUERY_OPCODES = frozenset(b"irc")
+
+
+class QueryAnswerCache:
+    """
+    Cache คำตอบ query i / r / c ของเซิร์ฟเวอร์จริง เก็บเฉพาะส่วนหลัง header
+
+    - คำตอบอายุ < ttl → proxy ตอบ client เองโดยไม่ส่งต่อ
+    - ไม่มี / หมดอายุ → client ที่ถามระหว่างรอถูกรวมเป็น request เดียว
+      แล้วตอบทุกคนพร้อมกันเมื่อคำตอบกลับมา
+    - request ที่ไม่ได้คำตอบภายใน timeout → query ครั้งถัดไปส่งใหม่
+
+    ใช้ได้จากหลาย thread (engine threaded อ่านคำตอบใน thread ของ session)
+    """
+
+    def __init__(self, ttl=2.0, timeout=1.0):
+        self.ttl = ttl
+        self.timeout = timeout
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._answers = {}   # opcode → (body, fetched_at)
+        self._waiting = {}   # opcode → (sent_at, [(addr, header), ...])
+
+    def fresh(self, opcode, now):
+        """ คืนคำตอบ (ส่วนหลัง header) ถ้ายังไม่หมดอายุ ไม่มี → None """
+        answer = self._answers.get(opcode)
+        if answer is not None and now - answer[1] < self.ttl:
+            self.hits += 1
+            return answer[0]
+        return None
+
+    def wait(self, opcode, addr, header, now):
+        """ ลงชื่อรอคำตอบ คืน True ถ้าผู้เรียกต้องส่ง query ไปเซิร์ฟเวอร์จริง """
+        with self._lock:
+            self.misses += 1
+            pending = self._waiting.get(opcode)
+            if pending is not None and now - pending[0] < self.timeout:
+                pending[1].append((addr, header))
+                return False
+
+            # ยังไม่มี request ค้าง หรือ request เดิมหายไป → ส่งใหม่
+            self._waiting[opcode] = (now, [(addr, header)])
+            return True
+
+    def store(self, data, now):
+        """ บันทึกคำตอบจากเซิร์ฟเวอร์จริง คืน (body, รายชื่อผู้รอ) / None ถ้าไม่ใช่คำตอบ query """
+        if len(data) < QUERY_HEADER_SIZE or data[:4] != b"SAMP" or data[10] not in QUERY_OPCODES:
+            return None
+
+        opcode = data[10]
+        body = bytes(data[QUERY_HEADER_SIZE:])
+
+        with self._lock:
+            self._answers[opcode] = (body, now)
+            pending = self._waiting.pop(opcode, None)
+
+        return body, (pending[1] if pending else [])
+
+    def clear(self):
+        with self._lock:
+            self._answers.clear()
+            self._waiting.clear()
+
+
+# ======================
+# FLOOD PROTECTION
+# ======================
+# opcode query ที่ SA-MP รู้จัก ('x' = RCON) และขนาด packet ขั้นต่ำของแต่ละตัว
+QUERY_MIN_SIZE = {ord("i"): 11, ord("r"): 11, ord("c"): 11, ord("d"): 11, ord("x"): 11, ord("p"): 15}
+FILTER_REASONS = ("oversized", "malformed", "rate_source", "rate_global")
+
+
+class TokenBucket:
+    """ token bucket: เติม rate token/วินาที เก็บได้สูงสุด burst (คำนวณตอนเรียก ไม่มี timer) """
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def allow(self, now):
+        tokens = self.tokens + (now - self.stamp) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        self.stamp = now
+
+        if tokens < 1.0:
+            self.tokens = tokens
+            return False
+
+        self.tokens = tokens - 1.0
+        return True
+
+
+class RateLimiter:
+    """
+    จำกัดอัตรา packet จากฝั่ง client (O(1) ต่อ packet)
+
+    - ต่อแหล่ง (ip, port): session ที่เปิดแล้วถือ bucket ของตัวเอง (ไม่ต้องค้น dict เพิ่ม)
+      แหล่งที่ยังไม่มี session ใช้ bucket ใน dict ที่จำกัดขนาด
+    - รวม (global): ใช้กับแหล่งที่ยังไม่มี session (session ใหม่ / query)
+      → flood จากที่อยู่ปลอมจำนวนมากไม่กระทบ session ที่เล่นอยู่
+      (session ที่เปิดแล้วมีจำนวนจำกัดด้วย max_sessions อยู่แล้ว)
+
+    rate <= 0 = ไม่จำกัดในชั้นนั้น
+    """
+
+    def __init__(self, source_rate=1000.0, source_burst=2000.0, global_rate=20000.0, global_burst=40000.0,
+                 max_sources=4096):
+        self.source_rate = source_rate
+        self.source_burst = source_burst
+        self.max_sources = max_sources
+
+        now = time.monotonic()
+        self.global_bucket = TokenBucket(global_rate, global_burst, now) if global_rate > 0 else None
+        self._sources = {}
+
+    def new_bucket(self, now):
+        """ bucket สำหรับ session ใหม่ (None = ไม่จำกัดต่อแหล่ง) """
+        if self.source_rate <= 0:
+            return None
+        return TokenBucket(self.source_rate, self.source_burst, now)
+
+    def allow_unknown(self, addr, now):
+        """ ตรวจ packet จากแหล่งที่ยังไม่มี session คืนเหตุผลที่ต้องทิ้ง หรือ None ถ้าผ่าน """
+        if self.source_rate > 0:
+            bucket = self._sources.get(addr)
+            # ตารางเต็ม → ไม่สร้างเพิ่ม (เหลือ global เป็นด่านเดียว) ไม่ sweep ตรงนี้เพื่อให้ยังเป็น O(1)
+            if bucket is None and len(self._sources) < self.max_sources:
+                bucket = self._sources[addr] = TokenBucket(self.source_rate, self.source_burst, now)
+            if bucket is not None and not bucket.allow(now):
+                return "rate_source"
+
+        if self.global_bucket is not None and not self.global_bucket.allow(now):
+            return "rate_global"
+        return None
+
+    def claim(self, addr, now):
+        """ ย้าย bucket ของแหล่งนี้ไปให้ session ที่เพิ่งเปิด (ไม่ได้ burst ใหม่ฟรี) """
+        return self._sources.pop(addr, None) or self.new_bucket(now)
+
+    def sweep(self, now):
+        """ ลบ bucket ที่เติมเต็มแล้ว (แหล่งที่เงียบไปนานพอ) """
+        full = [addr for addr, bucket in self._sources.items()
+                if bucket.tokens + (now - bucket.stamp) * bucket.rate >= bucket.burst]
+        for addr in full:
+            del self._sources[addr]
+
+
+# ======================
+# BUFFERS / BATCH I/O
+# ======================
+# ขนาด buffer รับ packet (เท่ากับ recvfrom(65535) เดิม)
+BUFFER_SIZE = 65535
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.c_void_p),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+# struct sockaddr_in: family(2, byte order ของเครื่อง) + port(2, big-endian) + ip(4, big-endian) + zero(8)
+_SOCKADDR_IN = struct.Struct("=H2x4x8x")
+_SOCKADDR_FAMILY = struct.Struct("=H")
+_SOCKADDR_PORT_IP = struct.Struct(">HI")
+_UINT = struct.Struct("I")
+_SIZE_T = struct.Struct("N")
+_IOV_SIZE = ctypes.sizeof(_IOVec)
+_IOV_LEN_OFFSET = _IOVec.iov_len.offset
+_MSG_SIZE = ctypes.sizeof(_MMsgHdr)
+_MSG_LEN_OFFSET = _MMsgHdr.msg_len.offset
+_MSG_NAMELEN_OFFSET = _MsgHdr.msg_namelen.offset
+
+# recvmmsg / sendmmsg มีเฉพาะ Linux (glibc / musl)
+_libc = None
+if sys.platform.startswith("linux"):
+    try:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        _libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    except (OSError, AttributeError):
+        _libc = None
+
+HAVE_MMSG = _libc is not None
+
+
+def _buffer_address(buffer):
+    """ address ของ bytearray ในหน่วยความจำ (bytearray ถูกล็อกขนาดไว้ตราบที่ยังมี ctypes object อ้างถึง) """
+    return ctypes.addressof(ctypes.c_char.from_buffer(buffer))
+
+
+class _MMsgBuffers:
+    """
+    หน่วยความจำที่จองไว้ครั้งเดียวสำหรับ recvmmsg / sendmmsg: count ช่อง ช่องละ size bytes
+
+    โครงสร้าง iovec / mmsghdr อยู่ใน bytearray → แก้ความยาว / ที่อยู่รายช่องด้วย struct.pack_into
+    ได้โดยตรง (เร็วกว่าเข้าผ่าน attribute ของ ctypes ซึ่งสร้าง object ใหม่ทุกครั้ง)
+    """
+
+    def __init__(self, count, size):
+        self.count = count
+        self.size = size
+
+        self.buffer = bytearray(count * size)
+        self.view = memoryview(self.buffer)
+        self.names = bytearray(count * _SOCKADDR_IN.size)
+        self.iov = bytearray(count * _IOV_SIZE)
+        self.msgs = bytearray(count * _MSG_SIZE)
+
+        base = _buffer_address(self.buffer)
+        names = _buffer_address(self.names)
+        iov = (_IOVec * count).from_buffer(self.iov)
+        msgs = (_MMsgHdr * count).from_buffer(self.msgs)
+
+        for i in range(count):
+            iov[i].iov_base = base + i * size
+            iov[i].iov_len = size
+
+            hdr = msgs[i].msg_hdr
+            hdr.msg_name = names + i * _SOCKADDR_IN.size
+            hdr.msg_namelen = _SOCKADDR_IN.size
+            hdr.msg_iov = ctypes.addressof(iov[i])
+            hdr.msg_iovlen = 1
+
+        # ctypes view ต้องอยู่ตลอดอายุ object (ล็อก bytearray ไม่ให้ย้ายที่)
+        self._views = (iov, msgs)
+        self.address = ctypes.addressof(msgs)
+
+
+class RecvBatch(_MMsgBuffers):
+    """
+    รับหลาย packet ใน system call เดียวด้วย recvmmsg (Linux)
+
+    data(i) คืน memoryview ชี้เข้า buffer โดยตรง (ไม่ copy) ใช้ได้จนกว่าจะเรียก recv() ครั้งถัดไป
+    """
+
+    def __init__(self, count=32, size=BUFFER_SIZE):
+        super().__init__(count, size)
+        # (ip, port) ที่เคยเห็นแล้ว → ใช้ tuple เดิมซ้ำ ไม่ต้องแปลง IP เป็น str ทุก packet
+        self._addrs = {}
+
+    def recv(self, fd):
+        """ รับ packet ที่รออยู่ (non-blocking) สูงสุด count ตัว คืนจำนวนที่ได้ (0 = ว่าง / error) """
+        received = _libc.recvmmsg(fd, self.address, self.count, 0, None)
+        return received if received > 0 else 0
+
+    def data(self, i):
+        length = _UINT.unpack_from(self.msgs, i * _MSG_SIZE + _MSG_LEN_OFFSET)[0]
+        start = i * self.size
+        return self.view[start:start + length]
+
+    def addr(self, i):
+        key = _SOCKADDR_PORT_IP.unpack_from(self.names, i * _SOCKADDR_IN.size + 2)
+        addr = self._addrs.get(key)
+        if addr is None:
+            if len(self._addrs) > 4096:
+                self._addrs.clear()
+            port, ip = key
+            addr = self._addrs[key] = (socket.inet_ntoa(ip.to_bytes(4, "big")), port)
+        return addr
+
+
+class SendBatch(_MMsgBuffers):
+    """
+    รวม packet ขาออกที่ไปยัง socket เดียวกันแล้วส่งทีเดียวด้วย sendmmsg (Linux)
+
+    add() copy ข้อมูลลง buffer ที่จองไว้ (ข้อมูลต้นทางจึงนำไปใช้ต่อได้ทันที)
+    เปลี่ยน socket ปลายทาง / buffer เต็ม → ส่งชุดเดิมก่อนอัตโนมัติ
+    """
+
+    def __init__(self, count=32, size=BUFFER_SIZE):
+        super().__init__(count, size)
+        self.pending = 0
+        self.fd = -1
+        self.dropped = 0
+        # addr → sockaddr_in ที่ pack แล้ว (client ชุดเดิมส่งซ้ำตลอด)
+        self._sockaddrs = {}
+
+    def add(self, fd, data, addr=None):
+        """ เพิ่ม packet ไปยัง fd (addr = None สำหรับ socket ที่ connect แล้ว) """
+        if fd != self.fd or self.pending == self.count:
+            self.flush()
+            self.fd = fd
+
+        i = self.pending
+        length = len(data)
+        start = i * self.size
+        self.buffer[start:start + length] = data
+        _SIZE_T.pack_into(self.iov, i * _IOV_SIZE + _IOV_LEN_OFFSET, length)
+
+        if addr is None:
+            _UINT.pack_into(self.msgs, i * _MSG_SIZE + _MSG_NAMELEN_OFFSET, 0)
+        else:
+            sockaddr = self._sockaddrs.get(addr)
+            if sockaddr is None:
+                if len(self._sockaddrs) > 4096:
+                    self._sockaddrs.clear()
+                sockaddr = bytearray(_SOCKADDR_IN.size)
+                _SOCKADDR_FAMILY.pack_into(sockaddr, 0, socket.AF_INET)
+                _SOCKADDR_PORT_IP.pack_into(sockaddr, 2, addr[1], int.from_bytes(socket.inet_aton(addr[0]), "big"))
+                self._sockaddrs[addr] = sockaddr = bytes(sockaddr)
+
+            offset = i * _SOCKADDR_IN.size
+            self.names[offset:offset + _SOCKADDR_IN.size] = sockaddr
+            _UINT.pack_into(self.msgs, i * _MSG_SIZE + _MSG_NAMELEN_OFFSET, _SOCKADDR_IN.size)
+
+        self.pending = i + 1
+
+    def flush(self):
+        """ ส่ง packet ที่ค้างทั้งหมด (ส่งไม่ได้ → ทิ้งเหมือน UDP ปกติ) """
+        start = 0
+        pending = self.pending
+        self.pending = 0
+
+        while start < pending:
+            sent = _libc.sendmmsg(self.fd, self.address + start * _MSG_SIZE, pending - start, 0)
+            if sent > 0:
+                start += sent
+                continue
+
+            if ctypes.get_errno() in (errno.EAGAIN, errno.EWOULDBLOCK):
+                # buffer ขาออกเต็ม → ทิ้งส่วนที่เหลือ
+                self.dropped += pending - start
+                return
+            # packet นี้ส่งไม่ได้ (เช่น ICMP unreachable) → ข้ามไปตัวถัดไป
+            self.dropped += 1
+            start += 1
+
 
 class SampUDPProxy:
 
+    NAME = "threaded"
+
+    # ตรวจ session ที่หมดอายุทุก ๆ กี่วินาที
+    SWEEP_INTERVAL = 1.0
+
     def __init__(self,
                  local_host="127.0.0.1",
                  local_port=7777,
-                 real_server=("168.222.20.211", 7777)):
+                 real_server=("168.222.20.211", 7777),
+                 logger=None,
+                 idle_timeout=60.0,
+                 max_sessions=256,
+                 query_ttl=2.0,
+                 stats_port=None,
+                 upstreams=None,
+                 probe_interval=2.0,
+                 port_fallback=False,
+                 rate_limiter=None,
+                 max_packet=2048):
 
         self.LOCAL_HOST = local_host
         self.LOCAL_PORT = local_port
-        self.REAL_SERVER = real_server
+        # True = local_port ถูกใช้อยู่ → ใช้ port ว่างที่ระบบเลือกให้แทน (อ่านค่าจริงจาก LOCAL_PORT)
+        self.port_fallback = port_fallback
+        self.log = logger or PacketLogger()
+        # None เมื่อไม่ได้เปิด debug → hot path เช็คแค่ "is not None" ครั้งเดียว
+        self.packet_log = self.log.packet if self.log.enabled("debug") else None
+
+        # หลายปลายทาง → session ใหม่ไปตัวที่ RTT ต่ำสุด (REAL_SERVER = ตัวแรก)
+        self.upstream_pool = UpstreamPool(upstreams or [real_server], self.log, probe_interval)
+        self.REAL_SERVER = self.upstream_pool.upstreams[0].addr
 
         self.proxy = None
-        self.server = None
+        self.sessions = SessionTable(idle_timeout, max_sessions)
+        self._next_sweep = 0.0
+
+        # query_ttl <= 0 = ส่งต่อ query ทุกตัวเหมือนเดิม
+        self.query_cache = QueryAnswerCache(query_ttl) if query_ttl > 0 else None
+        # socket ฝั่งเซิร์ฟเวอร์ที่ proxy ใช้ถาม query เอง (ไม่อยู่ใน session table)
+        self.query_session = None
+
+        # สถิติที่ไม่ได้อยู่ใน session ที่เปิดอยู่: session ที่ปิดไปแล้ว + query ที่ตอบจาก cache
+        # (เขียนจาก thread ที่อ่านฝั่ง client เท่านั้น)
+        self.totals = {direction: TrafficStats() for direction in DIRECTIONS}
+        self.stats_port = stats_port
+        self.stats_server = None
+        self.started_at = None
+
+        # กัน flood: packet ขาเข้าจาก client ที่ใหญ่เกิน / ผิดรูปแบบ / เกินอัตรา → ทิ้งก่อนส่งต่อ
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.max_packet = max_packet
+        # ตัวนับ packet ที่ถูกทิ้ง แยกตามเหตุผล (เขียนจาก thread ที่อ่านฝั่ง client เท่านั้น)
+        self.filtered = dict.fromkeys(FILTER_REASONS, 0)
 
-        self.client_addr = None
         self.running = False
+        # set เมื่อ socket ฝั่งเกม bind แล้วและ thread เริ่มทำงาน (ใช้รอจาก thread อื่นได้)
+        self.ready = threading.Event()
 
         self.t1 = None
-        self.t2 = None
 
     # ======================
     # START
@@ -35,39 +945,57 @@ class SampUDPProxy:
     def start(self):
 
         if self.running:
-            print("Proxy already running")
+            self.log.info("Proxy already running")
             return
 
-        print("Starting SA-MP UDP Proxy...")
+        self.log.info("Starting SA-MP UDP Proxy...")
 
         self.running = True
 
         # Game side
-        self.proxy = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.proxy.bind((self.LOCAL_HOST, self.LOCAL_PORT))
+        self.bind_local()
 
-        # Internet side
-        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.server.connect(self.REAL_SERVER)
+        # timeout สั้น ๆ เพื่อให้ loop ได้ตรวจ session ที่หมดอายุแม้ไม่มี packet เข้า
+        self.proxy.settimeout(self.SWEEP_INTERVAL)
 
-        # buffer
-        self.proxy.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65535)
-        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65535)
+        # Internet side: เปิดแยกต่อ client ใน open_session()
 
         self.t1 = threading.Thread(
             target=self.client_to_server,
             daemon=True
         )
 
-        self.t2 = threading.Thread(
-            target=self.server_to_client,
-            daemon=True
-        )
-
         self.t1.start()
-        self.t2.start()
 
-        print("✅ Proxy Running")
+        self.start_stats()
+
+        self.upstream_pool.start()
+
+        self.ready.set()
+        self.log.info("✅ Proxy Running")
+
+    def bind_local(self):
+        """ เปิด socket ฝั่งเกม (bind ไม่ได้ เช่น port ถูกใช้อยู่ → คืนสถานะเป็นไม่ทำงาน แล้วโยน OSError ต่อ) """
+        self.proxy = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            try:
+                self.proxy.bind((self.LOCAL_HOST, self.LOCAL_PORT))
+            except OSError as e:
+                if not (self.port_fallback and self.LOCAL_PORT):
+                    raise
+                self.log.info(f"Port {self.LOCAL_PORT} ใช้ไม่ได้ ({e}) → ใช้ port ว่างแทน")
+                self.proxy.bind((self.LOCAL_HOST, 0))
+        except OSError as e:
+            self.proxy.close()
+            self.running = False
+            self.log.error(f"bind {self.LOCAL_HOST}:{self.LOCAL_PORT} ไม่สำเร็จ: {e}")
+            raise
+
+        # port 0 = ให้ระบบเลือก port ว่างให้ → อ่าน port จริงกลับมา
+        self.LOCAL_PORT = self.proxy.getsockname()[1]
+
+        # buffer
+        self.proxy.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65535)
 
     # ======================
     # STOP
@@ -75,11 +1003,12 @@ class SampUDPProxy:
     def stop(self):
 
         if not self.running:
-            print("Proxy not running")
+            self.log.info("Proxy not running")
             return
 
-        print("Stopping Proxy...")
+        self.log.info("Stopping Proxy...")
 
+        self.ready.clear()
         self.running = False
 
         try:
@@ -87,48 +1016,629 @@ class SampUDPProxy:
         except:
             pass
 
-        try:
-            self.server.close()
-        except:
-            pass
+        self.close_all_sessions()
 
-        self.client_addr = None
+        self.stop_stats()
+        self.upstream_pool.stop()
 
-        print("✅ Proxy Stopped")
+        self.log.info("✅ Proxy Stopped")
+        self.log.close()
 
     # ======================
     # CLIENT → SERVER
     # ======================
     def client_to_server(self):
 
+        # buffer ของ thread นี้ จองครั้งเดียว (ไม่สร้าง bytes ใหม่ทุก packet)
+        buffer = bytearray(BUFFER_SIZE)
+        view = memoryview(buffer)
+        recvfrom_into = self.proxy.recvfrom_into
+
         while self.running:
             try:
-                data, addr = self.proxy.recvfrom(65535)
+                size, addr = recvfrom_into(buffer)
+            except socket.timeout:
+                self.sweep_sessions()
+                continue
+            except ConnectionError:
+                # Windows: ICMP port unreachable จาก client เก่า → ข้ามไป
+                continue
+            except:
+                break
 
-                self.client_addr = addr
-                print("CLIENT → SERVER:", data)
+            try:
+                self.forward_to_server(view[:size], addr)
+            except OSError:
+                self.totals["c2s"].drops += 1
 
-                self.server.send(data)
+            self.sweep_sessions()
 
+    # ======================
+    # SERVER → CLIENT (1 thread ต่อ session)
+    # ======================
+    def server_to_client(self, session):
+
+        recv_into = session.sock.recv_into
+        buffer = bytearray(BUFFER_SIZE)
+        view = memoryview(buffer)
+
+        while self.running and not session.closed:
+            try:
+                size = recv_into(buffer)
+            except socket.timeout:
+                continue
+            except ConnectionError:
+                # ICMP port unreachable จากเซิร์ฟเวอร์ (เช่นเซิร์ฟเวอร์รีสตาร์ท) → รอรอบถัดไป
+                continue
             except:
                 break
 
+            try:
+                self.forward_to_client(view[:size], session)
+            except OSError:
+                session.s2c.drops += 1
+
     # ======================
-    # SERVER → CLIENT
+    # SESSION
     # ======================
-    def server_to_client(self):
+    def connect_upstream(self, addr, now):
+        """ เปิด socket ไปยังปลายทางที่ดีที่สุดตอนนี้ แล้วส่งให้ engine เริ่มอ่าน """
+        upstream = self.upstream_pool.best()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect(upstream.addr)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65535)
+
+        session = Session(addr, sock, upstream, now)
+        self.attach_session(session)
+        return session
+
+    def open_session(self, addr, now):
+        """ เปิด session ให้ client ใหม่ """
+        session = self.connect_upstream(addr, now)
+        for old in self.sessions.add(session):
+            self.close_session(old, "session table full")
+
+        self.log.info(f"Session opened {addr[0]}:{addr[1]} ({len(self.sessions)} active)")
+        return session
+
+    def attach_session(self, session):
+        """ engine threaded: 1 thread อ่านคำตอบจากเซิร์ฟเวอร์ต่อ session """
+        # timeout สั้น ๆ ให้ thread เห็นว่า session ถูกปิดแล้ว
+        session.sock.settimeout(0.5)
+        threading.Thread(
+            target=self.server_to_client,
+            args=(session,),
+            daemon=True
+        ).start()
+
+    def detach_session(self, session):
+        """ engine threaded: thread ของ session จะออกเองเมื่อเห็น session.closed """
+
+    def release_session(self, session):
+        """ หยุดอ่านและปิด socket ของ session """
+        session.closed = True
+        self.detach_session(session)
+
+        try:
+            session.sock.close()
+        except:
+            pass
+
+    def close_session(self, session, reason=None):
+        self.release_session(session)
+
+        # เก็บยอดของ session ไว้ในยอดรวม ก่อนที่ session จะหายไปจากตาราง
+        self.totals["c2s"].merge(session.c2s)
+        self.totals["s2c"].merge(session.s2c)
+
+        if reason:
+            self.log.info(f"Session closed {session.addr[0]}:{session.addr[1]} ({reason})")
+
+    def close_all_sessions(self):
+        for session in self.sessions.clear():
+            self.close_session(session)
+
+        if self.query_session is not None:
+            self.close_session(self.query_session)
+            self.query_session = None
+
+        if self.query_cache is not None:
+            self.query_cache.clear()
+
+    def sweep_sessions(self):
+        """ ปิด session ที่ไม่มี packet จาก client เกิน idle_timeout (ตรวจไม่เกิน 1 ครั้งต่อ SWEEP_INTERVAL) """
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.SWEEP_INTERVAL
+
+        for session in self.sessions.expired(now):
+            self.close_session(session, "idle")
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.sweep(now)
+
+        if self.upstream_pool.any_down():
+            self.failover_sessions(now)
+
+    def failover_sessions(self, now):
+        """ ย้าย session ที่อยู่บนปลายทางที่ไม่ตอบแล้วไปยังตัวที่ดีที่สุด (ไม่มีตัวที่ดีกว่า → ไม่ย้าย) """
+        best = self.upstream_pool.best()
+        if not best.healthy:
+            return
+
+        for session in self.sessions:
+            if session.upstream.healthy:
+                continue
+
+            moved = self.connect_upstream(session.addr, session.last_seen)
+            # สถิติ + bucket ย้ายตามไปด้วย (thread อ่านของ session เดิมจะออกเองเมื่อเห็น closed)
+            # ไม่ย้าย bucket = session ใหม่ไม่ถูกจำกัดอัตรา (bucket None คือไม่จำกัด)
+            moved.c2s, moved.s2c = session.c2s, session.s2c
+            moved.bucket = session.bucket
+            self.sessions.replace(moved)
+            self.release_session(session)
+            self.log.info(f"Session {session.addr[0]}:{session.addr[1]} moved {session.upstream} → {moved.upstream}")
+
+        if self.query_session is not None and not self.query_session.upstream.healthy:
+            self.release_session(self.query_session)
+            self.query_session = None   # query ถัดไปจะเปิดใหม่ไปยังตัวที่ดีที่สุด
+
+    # ======================
+    # FORWARD (ใช้ร่วมกันทุก engine)
+    # ======================
+    def forward_to_server(self, data, addr):
+
+        started = time.perf_counter_ns()
+        size = len(data)
+        now = time.monotonic()
+        session = self.sessions.get(addr, now)
+
+        # ---- ทางด่วน: client ที่มี session อยู่แล้ว (ผู้เล่นจริง) เช็คแค่ bucket + ขนาด ----
+        if session is not None:
+            bucket = session.bucket
+            if bucket is not None and not bucket.allow(now):
+                self.filtered["rate_source"] += 1
+                return
+            if size > self.max_packet:
+                self.filtered["oversized"] += 1
+                return
+            if size < 4 or data[0] != 0x53 or data[:4] != b"SAMP":
+                packet_log = self.packet_log
+                if packet_log is not None:
+                    packet_log("CLIENT → SERVER", data, addr)
+                self.send_to_server(session, data)
+                session.c2s.record(size, time.perf_counter_ns() - started)
+                return
+            limiter = None
+
+        # ---- แหล่งที่ยังไม่มี session: กรองก่อนทำอย่างอื่น packet ที่จะถูกทิ้งต้องเสียเวลาน้อยที่สุด ----
+        else:
+            if size > self.max_packet or size == 0:
+                self.filtered["oversized" if size else "malformed"] += 1
+                return
+            limiter = self.rate_limiter
+            if limiter is not None:
+                reason = limiter.allow_unknown(addr, now)
+                if reason is not None:
+                    self.filtered[reason] += 1
+                    return
+
+        is_query = size >= 4 and data[:4] == b"SAMP"
+        if is_query and (size < QUERY_HEADER_SIZE or size < QUERY_MIN_SIZE.get(data[10], size + 1)):
+            self.filtered["malformed"] += 1
+            return
+
+        packet_log = self.packet_log
+        if packet_log is not None:
+            packet_log("CLIENT → SERVER", data, addr)
+
+        # query i / r / c → ตอบจาก cache (ไม่ต้องเปิด session)
+        if is_query and self.query_cache is not None and data[10] in QUERY_OPCODES:
+            self.answer_query(data, addr, now)
+            self.totals["c2s"].record(size, time.perf_counter_ns() - started)
+            return
+
+        if session is None:
+            session = self.open_session(addr, now)
+            if limiter is not None:
+                session.bucket = limiter.claim(addr, now)
+
+        self.send_to_server(session, data)
+        session.c2s.record(size, time.perf_counter_ns() - started)
+
+    def forward_to_client(self, data, session):
+
+        started = time.perf_counter_ns()
+
+        packet_log = self.packet_log
+        if packet_log is not None:
+            packet_log("SERVER → CLIENT", data, session.addr)
+
+        if session is self.query_session:
+            self.deliver_query_answer(data)
+        else:
+            self.send_to_client(data, session.addr)
+
+        session.s2c.record(len(data), time.perf_counter_ns() - started)
+
+    # ======================
+    # QUERY (ตอบจาก cache)
+    # ======================
+    def answer_query(self, data, addr, now):
+
+        opcode = data[10]
+        # คำตอบต้องขึ้นต้นด้วย header ที่ client ส่งมาเอง (ip/port ที่ client ใช้อาจต่างกัน)
+        header = bytes(data[:QUERY_HEADER_SIZE])
+
+        body = self.query_cache.fresh(opcode, now)
+        if body is not None:
+            self.send_to_client(header + body, addr)
+            return
+
+        if self.query_cache.wait(opcode, addr, header, now):
+            if self.query_session is None:
+                self.query_session = self.connect_upstream(None, now)
+            self.send_to_server(self.query_session, data)
+
+    def deliver_query_answer(self, data):
+
+        stored = self.query_cache.store(data, time.monotonic())
+        if stored is None:
+            return
+
+        body, waiting = stored
+        for addr, header in waiting:
+            self.send_to_client(header + body, addr)
+
+    # ======================
+    # STATS
+    # ======================
+    def start_stats(self):
+
+        self.started_at = time.monotonic()
+
+        if self.stats_port is None:
+            return
+
+        try:
+            self.stats_server = StatsServer(self, self.stats_port)
+            self.log.info(f"Stats: http://127.0.0.1:{self.stats_server.port}/stats (JSON), /metrics (Prometheus)")
+        except OSError as e:
+            self.log.error(f"เปิด stats endpoint ไม่สำเร็จ: {e}")
+
+    def stop_stats(self):
+
+        if self.stats_server is not None:
+            self.stats_server.close()
+            self.stats_server = None
+
+    def snapshot(self):
+        """ สถิติรวมทั้งหมด ณ ตอนเรียก (อ่านได้จาก thread ใดก็ได้) """
+        sessions = list(self.sessions)
+        live = sessions + ([self.query_session] if self.query_session is not None else [])
+
+        directions = {}
+        for direction in DIRECTIONS:
+            total = TrafficStats().merge(self.totals[direction])
+            for session in live:
+                total.merge(getattr(session, direction))
+            directions[direction] = total.as_dict()
+
+        now = time.monotonic()
+        snapshot = {
+            "engine": self.NAME,
+            "uptime": now - self.started_at if self.started_at else 0.0,
+            "sessions": len(sessions),
+            "directions": directions,
+            "clients": [
+                {
+                    "addr": f"{session.addr[0]}:{session.addr[1]}",
+                    "idle": now - session.last_seen,
+                    "c2s": session.c2s.as_dict(),
+                    "s2c": session.s2c.as_dict(),
+                }
+                for session in sessions
+            ],
+        }
+
+        if self.query_cache is not None:
+            snapshot["query_cache"] = {"hits": self.query_cache.hits, "misses": self.query_cache.misses}
+
+        snapshot["filtered"] = dict(self.filtered)
+
+        snapshot["upstreams"] = [
+            {
+                "addr": str(upstream),
+                "healthy": upstream.healthy,
+                "rtt_ms": upstream.srtt * 1000 if upstream.srtt is not None else None,
+                "probes_sent": upstream.sent,
+                "probes_received": upstream.received,
+                "sessions": sum(1 for session in sessions if session.upstream is upstream),
+            }
+            for upstream in self.upstream_pool.upstreams
+        ]
+
+        return snapshot
+
+    # ======================
+    # SEND (engine แบบ batch override ได้)
+    # ======================
+    def send_to_server(self, session, data):
+        session.sock.send(data)
+
+    def send_to_client(self, data, addr):
+        self.proxy.sendto(data, addr)
+
+
+class SelectorUDPProxy(SampUDPProxy):
+    """
+    Engine แบบ thread เดียว ใช้ selectors (epoll บน Linux, select บน Windows)
+    ดูแลทั้ง socket ฝั่งเกมและ socket ฝั่งเซิร์ฟเวอร์ของทุก session ใน loop เดียว
+    → ไม่มีหลาย thread แย่ง GIL กัน ไม่ว่าจะมีกี่ client
+    """
+
+    NAME = "selectors"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.selector = None
+        # thread เดียว → ใช้ buffer รับ packet ร่วมกันได้ทั้งสองทิศทาง
+        self.buffer = bytearray(BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+
+    # ======================
+    # START
+    # ======================
+    def start(self):
+
+        if self.running:
+            self.log.info("Proxy already running")
+            return
+
+        self.log.info(f"Starting SA-MP UDP Proxy ({self.NAME})...")
+
+        self.running = True
+
+        self.bind_local()
+
+        self.proxy.setblocking(False)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.proxy, selectors.EVENT_READ, self.read_client)
+
+        self.t1 = threading.Thread(
+            target=self.event_loop,
+            daemon=True
+        )
+        self.t1.start()
+
+        self.start_stats()
+
+        self.upstream_pool.start()
+
+        self.ready.set()
+        self.log.info("✅ Proxy Running")
+
+    # ======================
+    # STOP
+    # ======================
+    def stop(self):
+
+        if not self.running:
+            self.log.info("Proxy not running")
+            return
+
+        self.log.info("Stopping Proxy...")
+
+        self.ready.clear()
+        self.running = False
+
+        # รอ loop ออกก่อนค่อยปิด socket (select มี timeout สั้น ๆ อยู่แล้ว)
+        if self.t1 and self.t1 is not threading.current_thread():
+            self.t1.join(2)
+
+        self.close_all_sessions()
+
+        try:
+            self.selector.close()
+        except:
+            pass
+
+        try:
+            self.proxy.close()
+        except:
+            pass
+
+        self.stop_stats()
+        self.upstream_pool.stop()
+
+        self.log.info("✅ Proxy Stopped")
+        self.log.close()
+
+    # ======================
+    # SESSION
+    # ======================
+    def attach_session(self, session):
+        session.sock.setblocking(False)
+        self.selector.register(session.sock, selectors.EVENT_READ, partial(self.read_server, session))
+
+    def detach_session(self, session):
+        try:
+            self.selector.unregister(session.sock)
+        except (KeyError, ValueError, RuntimeError):
+            pass  # selector ถูกปิดไปแล้ว (ตอน stop)
+
+    # ======================
+    # EVENT LOOP
+    # ======================
+    def event_loop(self):
+
+        select = self.selector.select
 
         while self.running:
             try:
-                data = self.server.recv(65535)
+                events = select(0.2)
+            except OSError:
+                break
 
-                print("SERVER → CLIENT:", data)
+            for key, _ in events:
+                key.data()
 
-                if self.client_addr:
-                    self.proxy.sendto(data, self.client_addr)
+            self.sweep_sessions()
+
+    def read_client(self):
+
+        # อ่านจนกว่า socket จะว่าง (ลดจำนวนรอบของ select เมื่อมี packet มาเป็นชุด)
+        recvfrom_into = self.proxy.recvfrom_into
+        buffer = self.buffer
+        view = self.view
+
+        while True:
+            try:
+                size, addr = recvfrom_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # Windows: ICMP port unreachable จาก client เก่า → ข้ามไป
+                return
+
+            try:
+                self.forward_to_server(view[:size], addr)
+            except OSError:
+                # buffer ขาออกเต็ม / ICMP error → ทิ้ง packet (เหมือน UDP ปกติ)
+                self.totals["c2s"].drops += 1
+
+    def read_server(self, session):
+
+        recv_into = session.sock.recv_into
+        buffer = self.buffer
+        view = self.view
+
+        while not session.closed:
+            try:
+                size = recv_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # ICMP port unreachable จากเซิร์ฟเวอร์ (เช่นเซิร์ฟเวอร์รีสตาร์ท) → รอรอบถัดไป
+                return
+
+            try:
+                self.forward_to_client(view[:size], session)
+            except OSError:
+                session.s2c.drops += 1
+
+
+class MMsgUDPProxy(SelectorUDPProxy):
+    """
+    Engine selectors + recvmmsg / sendmmsg (Linux เท่านั้น)
+    รับและส่งได้ครั้งละหลาย packet ต่อ 1 system call → ต้นทุนต่อ packet ลดลงเมื่อ packet มาเป็นชุด
+    buffer ทั้งหมดจองไว้ตั้งแต่ start
+    """
+
+    NAME = "mmsg"
+
+    def __init__(self, *args, batch_size=32, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size
+        self.recv_batch = None
+        self.send_batch = None
+
+    def start(self):
+
+        if not self.running:
+            self.recv_batch = RecvBatch(self.batch_size)
+            self.send_batch = SendBatch(self.batch_size)
+
+        super().start()
+
+    # ======================
+    # SESSION
+    # ======================
+    def release_session(self, session):
+        # ส่ง packet ที่ค้างก่อนปิด fd (fd อาจถูกนำไปใช้ซ้ำโดย session ใหม่)
+        self.send_batch.flush()
+        super().release_session(session)
+
+    # ======================
+    # EVENT LOOP
+    # ======================
+    def read_client(self):
+
+        batch = self.recv_batch
+        fd = self.proxy.fileno()
+
+        while True:
+            count = batch.recv(fd)
+
+            for i in range(count):
+                try:
+                    self.forward_to_server(batch.data(i), batch.addr(i))
+                except OSError:
+                    self.totals["c2s"].drops += 1
+
+            self.send_batch.flush()
+
+            # ได้ไม่เต็มชุด = socket ว่างแล้ว ไม่ต้องเรียก recvmmsg อีกรอบ
+            if count < batch.count:
+                return
+
+    def read_server(self, session):
+
+        batch = self.recv_batch
+        fd = session.sock.fileno()
+
+        while not session.closed:
+            count = batch.recv(fd)
+
+            for i in range(count):
+                try:
+                    self.forward_to_client(batch.data(i), session)
+                except OSError:
+                    session.s2c.drops += 1
+
+            self.send_batch.flush()
+
+            if count < batch.count:
+                return
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        # packet ที่ sendmmsg ส่งไม่ได้ (แยกทิศทางไม่ได้เพราะรวมอยู่ใน batch เดียวกัน)
+        snapshot["send_batch_drops"] = self.send_batch.dropped if self.send_batch else 0
+        return snapshot
+
+    # ======================
+    # SEND
+    # ======================
+    def send_to_server(self, session, data):
+        self.send_batch.add(session.sock.fileno(), data)
+
+    def send_to_client(self, data, addr):
+        self.send_batch.add(self.proxy.fileno(), data, addr)
+
+
+# engine ที่เลือกได้ผ่าน --engine
+ENGINES = {
+    "threaded": SampUDPProxy,
+    "selectors": SelectorUDPProxy,
+}
+
+if HAVE_MMSG:
+    ENGINES["mmsg"] = MMsgUDPProxy
+
+def notify_ready(addr, message):
+    """ แจ้งสถานะให้ process ที่สั่งเปิด proxy (launcher) ทาง UDP """
+    if not addr:
+        return
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.sendto(message.encode(), parse_endpoint(addr))
+        except OSError:
+            pass
 
-            except:
-                break
 
 def run_proxy():
     parser = argparse.ArgumentParser(
@@ -146,9 +1656,22 @@ def run_proxy():
         default=7777
     )
 
+    parser.add_argument(
+        "--port-fallback",
+        action="store_true",
+        help="ถ้า --local-port ถูกใช้อยู่ ให้ใช้ port ว่างที่ระบบเลือกแทน"
+    )
+
+    parser.add_argument(
+        "--ready-addr",
+        default=None,
+        metavar="IP:PORT",
+        help="ส่ง UDP \"READY <port>\" (หรือ \"ERROR <ข้อความ>\") ไปที่นี่เมื่อ proxy พร้อม (ใช้โดย launcher)"
+    )
+
     parser.add_argument(
         "--server-ip",
-        required=True
+        default=None
     )
 
     parser.add_argument(
@@ -157,15 +1680,156 @@ def run_proxy():
         default=7777
     )
 
+    parser.add_argument(
+        "--upstream",
+        action="append",
+        default=[],
+        metavar="IP:PORT",
+        help="ปลายทางเพิ่มเติม (ระบุซ้ำได้) proxy จะเลือกตัวที่ ping ต่ำสุดและย้าย session เมื่อตัวไหนไม่ตอบ"
+    )
+
+    parser.add_argument(
+        "--probe-interval",
+        type=float,
+        default=2.0,
+        help="ping ปลายทางทุกกี่วินาที (ใช้เมื่อมีมากกว่า 1 ตัว)"
+    )
+
+    parser.add_argument(
+        "--engine",
+        choices=sorted(ENGINES),
+        default="threaded",
+        help="threaded = thread แยกต่อทิศทาง, selectors = thread เดียวแบบ event loop, mmsg = selectors + recvmmsg/sendmmsg (Linux)"
+    )
+
+    parser.add_argument(
+        "--rate-per-source",
+        type=float,
+        default=1000.0,
+        help="packet/วินาที สูงสุดต่อ client (0 = ไม่จำกัด)"
+    )
+
+    parser.add_argument(
+        "--burst-per-source",
+        type=float,
+        default=2000.0,
+        help="จำนวน packet ที่ client ส่งรวดเดียวได้ก่อนถูกจำกัด"
+    )
+
+    parser.add_argument(
+        "--rate-global",
+        type=float,
+        default=20000.0,
+        help="packet/วินาที สูงสุดรวมจาก client ที่ยังไม่มี session (0 = ไม่จำกัด)"
+    )
+
+    parser.add_argument(
+        "--burst-global",
+        type=float,
+        default=40000.0
+    )
+
+    parser.add_argument(
+        "--max-packet",
+        type=int,
+        default=2048,
+        help="ทิ้ง packet จาก client ที่ใหญ่กว่านี้ (bytes)"
+    )
+
+    parser.add_argument(
+        "--session-timeout",
+        type=float,
+        default=60.0,
+        help="ปิด session ของ client ที่ไม่ส่ง packet เกินกี่วินาที"
+    )
+
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=256,
+        help="จำนวน client สูงสุดที่ proxy ดูแลพร้อมกัน"
+    )
+
+    parser.add_argument(
+        "--query-ttl",
+        type=float,
+        default=2.0,
+        help="อายุคำตอบ query i/r/c ที่ proxy ตอบแทนเซิร์ฟเวอร์ (วินาที, 0 = ส่งต่อทุก query)"
+    )
+
+    parser.add_argument(
+        "--stats-port",
+        type=int,
+        default=None,
+        help="เปิด stats endpoint ที่ http://127.0.0.1:<port>/stats (JSON) และ /metrics (Prometheus)"
+    )
+
+    parser.add_argument(
+        "--log-level",
+        choices=list(LOG_LEVELS),
+        default="info",
+        help="debug = log ราย packet (ใช้ตอนหาปัญหาเท่านั้น)"
+    )
+
+    parser.add_argument(
+        "--log-sample",
+        type=int,
+        default=1,
+        help="log ราย packet 1 ใน N packet"
+    )
+
+    parser.add_argument(
+        "--log-dump",
+        type=int,
+        default=64,
+        help="จำนวน bytes สูงสุดของ hex dump ต่อ packet"
+    )
+
+    parser.add_argument(
+        "--log-file",
+        default=None,
+        help="เขียน log ลงไฟล์แทน stdout"
+    )
+
     args = parser.parse_args()
 
-    proxy = SampUDPProxy(
+    upstreams = [(args.server_ip, args.server_port)] if args.server_ip else []
+    upstreams += [parse_endpoint(text, args.server_port) for text in args.upstream]
+    if not upstreams:
+        parser.error("ต้องระบุ --server-ip หรือ --upstream อย่างน้อย 1 ตัว")
+
+    stream = open(args.log_file, "a", encoding="utf-8") if args.log_file else None
+    logger = PacketLogger(
+        level=args.log_level,
+        sample_every=args.log_sample,
+        max_dump=args.log_dump,
+        stream=stream
+    )
+
+    proxy = ENGINES[args.engine](
         local_host=args.local_ip,
         local_port=args.local_port,
-        real_server=(args.server_ip, args.server_port)
+        real_server=upstreams[0],
+        upstreams=upstreams,
+        probe_interval=args.probe_interval,
+        logger=logger,
+        idle_timeout=args.session_timeout,
+        max_sessions=args.max_sessions,
+        query_ttl=args.query_ttl,
+        stats_port=args.stats_port,
+        port_fallback=args.port_fallback,
+        rate_limiter=RateLimiter(args.rate_per_source, args.burst_per_source, args.rate_global, args.burst_global),
+        max_packet=args.max_packet
     )
 
-    proxy.start()
+    try:
+        proxy.start()
+    except OSError as e:
+        notify_ready(args.ready_addr, f"ERROR {e}")
+        logger.close()
+        sys.exit(1)
+
+    notify_ready(args.ready_addr, f"READY {proxy.LOCAL_PORT}")
 
     try:
         while True:
@@ -0,0 +1,258 @@
+import asyncio
+import bisect
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+from . import check_server
+
+
+def parse_masterlist(text: str) -> list[tuple[str, int]]:
+    """
+    แปลงข้อความรูปแบบ masterlist (บรรทัดละ ip:port) เป็นรายการ (ip, port)
+    ข้ามบรรทัดว่าง / comment (# หรือ ;) / บรรทัดที่รูปแบบไม่ถูกต้อง และตัดรายการซ้ำ
+    """
+    servers = []
+    seen = set()
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] in "#;":
+            continue
+
+        host, _, port = line.partition(":")
+        try:
+            addr = (host.strip(), int(port or 7777))
+        except ValueError:
+            continue
+
+        if addr not in seen:
+            seen.add(addr)
+            servers.append(addr)
+
+    return servers
+
+
+def load_server_list(data: Optional[dict] = None, masterlist_path: Optional[str | Path] = None) -> list[tuple[str, int]]:
+    """
+    รวมรายชื่อเซิร์ฟเวอร์จาก launcher_setting.json และ/หรือไฟล์ masterlist
+
+    ใน config รองรับ:
+        "server_game": {"ip": "...", "port": "7777"}
+        "servers": [{"ip": "...", "port": 7777}, "1.2.3.4:7777", ...]
+    """
+    lines = []
+
+    if data:
+        entries = []
+        if data.get("server_game"):
+            entries.append(data["server_game"])
+        entries.extend(data.get("servers", []))
+
+        for entry in entries:
+            if isinstance(entry, dict):
+                lines.append(f"{entry.get('ip', '')}:{entry.get('port', 7777)}")
+            else:
+                lines.append(str(entry))
+
+    if masterlist_path:
+        try:
+            lines.append(Path(masterlist_path).read_text(encoding="utf-8", errors="replace"))
+        except OSError as e:
+            print(f"อ่านไฟล์ masterlist ไม่สำเร็จ: {e}")
+
+    return parse_masterlist("\n".join(lines))
+
+
+class SortedIndex:
+    """
+    index ที่เรียงตาม key เสมอ: list ของ (key, addr) ที่แบ่งเป็นก้อนเรียงกัน (ก้อนละ LOAD..2×LOAD รายการ)
+    + max ของแต่ละก้อนไว้ bisect หาก้อน
+
+    อัปเดต 1 รายการ = bisect หาก้อน O(log n) + แทรก/ลบในก้อนเดียว (เลื่อนไม่เกิน 2×LOAD ตัว)
+    ไม่ต้องเลื่อนทั้ง list เหมือน insort บน list เดียว (ซึ่งเป็น O(n) ต่อครั้ง)
+    """
+    LOAD = 256
+
+    def __init__(self):
+        self._lists: list[list[tuple]] = []
+        self._maxes: list[tuple] = []
+        self._keys: dict[tuple, object] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def update(self, addr: tuple, key):
+        old = self._keys.get(addr)
+        if old is not None:
+            if old == key:
+                return
+            self._delete((old, addr))
+
+        self._keys[addr] = key
+        self._insert((key, addr))
+
+    def remove(self, addr: tuple):
+        old = self._keys.pop(addr, None)
+        if old is not None:
+            self._delete((old, addr))
+
+    def ordered(self, reverse: bool = False) -> Iterable[tuple]:
+        """ คืน addr ตามลำดับ key """
+        if reverse:
+            return (addr for items in reversed(self._lists) for _, addr in reversed(items))
+        return (addr for items in self._lists for _, addr in items)
+
+    def between(self, low, high) -> list[tuple]:
+        """ คืน addr ที่ low <= key <= high (ค้นหาขอบด้วย bisect) """
+        start, end = (low,), (high, (chr(0x10FFFF), float("inf")))
+        result = []
+        for i in range(bisect.bisect_left(self._maxes, start), len(self._lists)):
+            items = self._lists[i]
+            if items[0] > end:
+                break
+            result.extend(addr for _, addr in items[bisect.bisect_left(items, start):bisect.bisect_right(items, end)])
+        return result
+
+    def _insert(self, item: tuple):
+        if not self._lists:
+            self._lists.append([item])
+            self._maxes.append(item)
+            return
+
+        i = bisect.bisect_left(self._maxes, item)
+        if i == len(self._maxes):
+            i -= 1          # มากกว่าทุกตัว → ต่อท้ายก้อนสุดท้าย
+        items = self._lists[i]
+        bisect.insort(items, item)
+        self._maxes[i] = items[-1]
+
+        if len(items) > 2 * self.LOAD:
+            # ก้อนใหญ่เกิน → แบ่งครึ่ง (เกิดไม่เกิน 1 ครั้งต่อ LOAD การแทรก)
+            self._lists.insert(i + 1, items[self.LOAD:])
+            del items[self.LOAD:]
+            self._maxes[i] = items[-1]
+            self._maxes.insert(i + 1, self._lists[i + 1][-1])
+
+    def _delete(self, item: tuple):
+        i = bisect.bisect_left(self._maxes, item)
+        items = self._lists[i]
+        del items[bisect.bisect_left(items, item)]
+        if items:
+            self._maxes[i] = items[-1]
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+
+
+class ServerEntry:
+    """ ข้อมูลล่าสุดของเซิร์ฟเวอร์หนึ่งตัวใน browser """
+    __slots__ = ("addr", "info", "ping")
+
+    def __init__(self, addr: tuple[str, int], info: check_server.ServerInfo, ping: Optional[float]):
+        self.addr = addr
+        self.info = info
+        self.ping = ping    # ms (None = ไม่ตอบ)
+
+
+class ServerBrowser:
+    """
+    ระบบ Server Browser: ถือรายชื่อเซิร์ฟเวอร์ + ผล query ล่าสุด
+    และ index สำหรับ sort/filter ตาม ping, จำนวนผู้เล่น, ชื่อเซิร์ฟเวอร์
+
+    ทุกครั้งที่ผล query ของเซิร์ฟเวอร์หนึ่งเข้ามา จะอัปเดตเฉพาะตำแหน่งของตัวนั้นในแต่ละ index
+    """
+    SORT_KEYS = ("ping", "players", "hostname")
+
+    def __init__(self, servers: Iterable[tuple[str, int]] = ()):
+        self.entries: dict[tuple[str, int], ServerEntry] = {}
+        self.indexes = {name: SortedIndex() for name in self.SORT_KEYS}
+        for addr in servers:
+            self.add(addr)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, addr: tuple[str, int]):
+        """ เพิ่มเซิร์ฟเวอร์ (ยังไม่ query) """
+        addr = (addr[0], int(addr[1]))
+        if addr not in self.entries:
+            self.update(addr, check_server.OFFLINE[check_server.QueryError.TIMEOUT], None)
+
+    def remove(self, addr: tuple[str, int]):
+        self.entries.pop(addr, None)
+        for index in self.indexes.values():
+            index.remove(addr)
+
+    def update(self, addr: tuple[str, int], info: check_server.ServerInfo, ping: Optional[float]):
+        """ อัปเดตผล query ของเซิร์ฟเวอร์หนึ่งตัว + ตำแหน่งใน index """
+        self.entries[addr] = ServerEntry(addr, info, ping)
+        # ไม่ตอบ → ping เป็น inf ให้ไปอยู่ท้ายสุดเมื่อเรียงจากน้อยไปมาก
+        self.indexes["ping"].update(addr, ping if ping is not None else float("inf"))
+        self.indexes["players"].update(addr, info.players)
+        self.indexes["hostname"].update(addr, info.hostname.casefold())
+
+    def sorted(
+        self,
+        by: str = "ping",
+        reverse: bool = False,
+        search: str = "",
+        online_only: bool = False,
+        limit: Optional[int] = None
+    ) -> list[ServerEntry]:
+        """
+        คืนรายการเซิร์ฟเวอร์ที่เรียงแล้ว (อ่านตาม index โดยตรง ไม่ sort ใหม่)
+
+        Parameters:
+            by          : "ping" | "players" | "hostname"
+            reverse     : เรียงจากมากไปน้อย
+            search      : กรองด้วยคำในชื่อเซิร์ฟเวอร์ (ไม่สนตัวพิมพ์เล็ก/ใหญ่)
+            online_only : แสดงเฉพาะเซิร์ฟเวอร์ที่ตอบ
+            limit       : จำนวนสูงสุดที่ต้องการ
+        """
+        search = search.casefold()
+        result = []
+
+        for addr in self.indexes[by].ordered(reverse):
+            entry = self.entries[addr]
+            if online_only and not entry.info.online:
+                continue
+            if search and search not in entry.info.hostname.casefold():
+                continue
+            result.append(entry)
+            if limit is not None and len(result) >= limit:
+                break
+
+        return result
+
+    def between(self, by: str, low, high) -> list[ServerEntry]:
+        """ คืนเซิร์ฟเวอร์ที่ค่า by อยู่ในช่วง [low, high] เช่น between("ping", 0, 80) """
+        return [self.entries[addr] for addr in self.indexes[by].between(low, high)]
+
+    # -------------------------------------------------------------------------
+
+    async def refresh_async(
+        self,
+        timeout: float = 1.5,
+        on_update: Optional[Callable[[ServerEntry], None]] = None
+    ):
+        """
+        query ทุกเซิร์ฟเวอร์พร้อมกัน (check_server.iter_query_many_timed) แล้วอัปเดตทีละตัวตามที่ตอบกลับ
+        ping คือ RTT ของแต่ละเซิร์ฟเวอร์ (นับจากตอนส่ง query ไปยังตัวนั้น ไม่ใช่ลำดับที่ตอบกลับ)
+        """
+        async for addr, info, rtt_ms in check_server.iter_query_many_timed(list(self.entries), timeout):
+            ping = rtt_ms if info.online else None
+            self.update(addr, info, ping)
+            if on_update:
+                on_update(self.entries[addr])
+
+    def refresh(self, timeout: float = 1.5, on_update: Optional[Callable[[ServerEntry], None]] = None):
+        """ เวอร์ชัน blocking ของ refresh_async() (เรียกจาก thread แยก ไม่ใช่ GUI thread) """
+        asyncio.run(self.refresh_async(timeout, on_update))
+
+
+# ตัวอย่างการใช้งาน
+if __name__ == "__main__":
+    browser = ServerBrowser(parse_masterlist("127.0.0.1:7777\n127.0.0.1:7778\n"))
+    browser.refresh(timeout=1.0)
+
+    for entry in browser.sorted(by="players", reverse=True):
+        print(entry.addr, entry.info.hostname, entry.info.players, entry.ping)
@@ -1,5 +1,12 @@
+import asyncio
+import os
 import socket
 import struct
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from enum import IntEnum
+from typing import AsyncIterator, Iterable, NamedTuple, Optional
 
 
 def build_packet(ip: str, port: int, opcode: bytes) -> bytes:
@@ -22,9 +29,565 @@ def build_packet(ip: str, port: int, opcode: bytes) -> bytes:
     return b"SAMP" + ip_bytes + port_bytes + opcode
 
 
-def query_server(ip: str, port: int, timeout: float = 1.5) -> dict:
+def build_query(ip: str, port: int, opcode: bytes) -> bytes:
+    """
+    สร้าง packet query ที่พร้อมส่ง (opcode 'p' ต้องต่อท้ายด้วย payload สุ่ม 4 bytes)
+    """
+    packet = build_packet(ip, port, opcode)
+    if opcode == b"p":
+        packet += os.urandom(4)
+    return packet
+
+
+class QueryError(IntEnum):
+    """ สาเหตุที่ query ไม่สำเร็จ (NONE = ได้คำตอบปกติ) """
+    NONE = 0
+    TIMEOUT = 1             # ไม่ได้คำตอบภายในเวลาที่กำหนด
+    BAD_REPLY = 2           # ได้คำตอบแต่ข้อมูลไม่สมบูรณ์
+    INVALID_ADDRESS = 3     # IP / port ไม่ถูกต้อง
+    NETWORK = 4             # ส่ง packet ไม่ได้ (เช่น network ไม่พร้อม)
+    CLOSED = 5              # transport ถูกปิดแล้ว
+    UNKNOWN = 6             # ข้อผิดพลาดอื่น ๆ ที่ไม่คาดคิด
+
+
+# ข้อความที่แสดงแทน hostname เมื่อออฟไลน์ (ตามสาเหตุ)
+ERROR_MESSAGES = {
+    QueryError.TIMEOUT: "หมดเวลา (timeout)",
+    QueryError.BAD_REPLY: "ตอบกลับไม่สมบูรณ์",
+    QueryError.INVALID_ADDRESS: "ข้อผิดพลาด: รูปแบบ IP ไม่ถูกต้อง ต้องเป็น IPv4 เช่น 127.0.0.1",
+    QueryError.NETWORK: "ข้อผิดพลาด: ไม่สามารถส่งข้อมูลได้",
+    QueryError.CLOSED: "ข้อผิดพลาด: transport ถูกปิดแล้ว",
+    QueryError.UNKNOWN: "เกิดข้อผิดพลาด",
+}
+
+
+class ServerInfo(NamedTuple):
+    """
+    ผลลัพธ์ของ opcode 'i' (immutable, ไม่มี __dict__ ต่อ object)
+
+    online      : bool          - ได้คำตอบจากเซิร์ฟเวอร์หรือไม่
+    passworded  : bool          - ต้องใช้รหัสผ่านหรือไม่
+    players     : int           - จำนวนผู้เล่นออนไลน์
+    max_players : int           - จำนวนผู้เล่นสูงสุด
+    hostname    : str           - ชื่อเซิร์ฟเวอร์ (ออฟไลน์ = ข้อความบอกสาเหตุ)
+    error       : QueryError    - สาเหตุที่ไม่สำเร็จ
+    loss        : float         - อัตรา packet loss ที่วัดได้ของเป้าหมาย (0.0 - 1.0)
+    """
+    online: bool
+    passworded: bool
+    players: int
+    max_players: int
+    hostname: str
+    error: QueryError = QueryError.NONE
+    loss: float = 0.0
+
+
+# ผลลัพธ์ออฟไลน์สร้างไว้ล่วงหน้าและใช้ร่วมกัน (ไม่ต้องสร้าง object ใหม่ทุกครั้ง)
+# timeout หมายถึงทุก packet ของ query นี้หาย → loss = 1.0
+OFFLINE = {
+    error: ServerInfo(False, False, 0, 0, message, error, 1.0 if error == QueryError.TIMEOUT else 0.0)
+    for error, message in ERROR_MESSAGES.items()
+}
+
+
+def _offline_result(error: QueryError) -> ServerInfo:
+    """ คืนผลลัพธ์ออฟไลน์ที่สร้างไว้แล้วตามสาเหตุ """
+    return OFFLINE[error]
+
+
+# โครงสร้างคงที่ของ protocol (compile ครั้งเดียว)
+_INFO_HEADER = struct.Struct("<BHHI")    # passworded, players, max_players, hostname_len
+_COUNT = struct.Struct("<H")             # จำนวนรายการ (uint16 LE)
+_SCORE = struct.Struct("<i")             # score (int32 LE)
+_SCORE_PING = struct.Struct("<iI")       # score (int32 LE), ping (uint32 LE)
+
+
+def parse_info(data: bytes, loss: float = 0.0) -> ServerInfo:
+    """
+    แปลงข้อมูลตอบกลับของ opcode 'i' เป็น ServerInfo
+    """
+    if len(data) < 11 + 1 + 2 + 2 + 4:
+        # ข้อมูลสั้นเกินไป → ถือว่าไม่สมบูรณ์
+        return _offline_result(QueryError.BAD_REPLY)
+
+    # อ่านผ่าน memoryview เพื่อไม่ให้เกิดการ copy bytes ระหว่างทาง
+    view = memoryview(data)
+
+    # ────────────────────────────────────────────────
+    #           โครงสร้างข้อมูล opcode 'i'
+    # ────────────────────────────────────────────────
+    # offset 11  → passworded     (1 byte)
+    # offset 12  → players        (2 bytes, uint16 LE)
+    # offset 14  → max_players    (2 bytes, uint16 LE)
+    # offset 16  → hostname_len   (4 bytes, uint32 LE)
+    # offset 20  → hostname       (ความยาวตาม hostname_len)
+
+    passworded, players, max_players, hostname_len = _INFO_HEADER.unpack_from(view, 11)
+    offset = 11 + _INFO_HEADER.size
+
+    # ตรวจสอบว่ามีข้อมูล hostname พอหรือไม่
+    if offset + hostname_len > len(view):
+        hostname = "[ชื่อเซิร์ฟเวอร์ถูกตัด]"
+    else:
+        # ถอดรหัส hostname (ใช้ errors="replace" จะปลอดภัยกว่า ignore)
+        hostname = str(view[offset:offset + hostname_len], "utf-8", "replace")
+
+    return ServerInfo(True, bool(passworded), players, max_players, hostname.strip(), QueryError.NONE, loss)
+
+
+# ────────────────────────────────────────────────
+#           Parser ของ opcode อื่น ๆ ('r', 'c', 'd', 'p')
+# ────────────────────────────────────────────────
+# ทุกตัวอ่านผ่าน memoryview + struct.unpack_from (ไม่ slice bytes ใหม่)
+# ถ้าข้อมูลถูกตัดกลางทางจะ raise ValueError
+
+def _read_count(view: memoryview) -> int:
+    if len(view) < 11 + _COUNT.size:
+        raise ValueError("ตอบกลับไม่สมบูรณ์")
+    return _COUNT.unpack_from(view, 11)[0]
+
+
+def parse_rules(data: bytes) -> dict[str, str]:
+    """
+    แปลงข้อมูลตอบกลับของ opcode 'r' (rules) เป็น dict ชื่อกฎ → ค่า
+    """
+    view = memoryview(data)
+    count = _read_count(view)
+    offset = 11 + _COUNT.size
+    rules = {}
+
+    try:
+        for _ in range(count):
+            # name_len(1) + name + value_len(1) + value
+            end = offset + 1 + view[offset]
+            name = str(view[offset + 1:end], "utf-8", "replace")
+            offset = end + 1 + view[end]
+            rules[name] = str(view[end + 1:offset], "utf-8", "replace")
+    except IndexError:
+        raise ValueError("ข้อมูล rules ถูกตัด")
+
+    if offset > len(view):
+        raise ValueError("ข้อมูล rules ถูกตัด")
+    return rules
+
+
+def parse_clients(data: bytes) -> list[tuple[str, int]]:
+    """
+    แปลงข้อมูลตอบกลับของ opcode 'c' (client list)
+
+    Returns:
+        list ของ (name, score)
+    """
+    view = memoryview(data)
+    count = _read_count(view)
+    offset = 11 + _COUNT.size
+    unpack_score = _SCORE.unpack_from
+    clients = []
+    append = clients.append
+
+    try:
+        for _ in range(count):
+            # name_len(1) + name + score(4)
+            end = offset + 1 + view[offset]
+            append((str(view[offset + 1:end], "utf-8", "replace"), unpack_score(view, end)[0]))
+            offset = end + 4
+    except (IndexError, struct.error):
+        raise ValueError("ข้อมูล client list ถูกตัด")
+
+    return clients
+
+
+def parse_players(data: bytes) -> list[tuple[int, str, int, int]]:
+    """
+    แปลงข้อมูลตอบกลับของ opcode 'd' (detailed players)
+
+    Returns:
+        list ของ (playerid, name, score, ping)
+    """
+    view = memoryview(data)
+    count = _read_count(view)
+    offset = 11 + _COUNT.size
+    unpack_score_ping = _SCORE_PING.unpack_from
+    players = []
+    append = players.append
+
+    try:
+        for _ in range(count):
+            # playerid(1) + name_len(1) + name + score(4) + ping(4)
+            end = offset + 2 + view[offset + 1]
+            score, ping = unpack_score_ping(view, end)
+            append((view[offset], str(view[offset + 2:end], "utf-8", "replace"), score, ping))
+            offset = end + 8
+    except (IndexError, struct.error):
+        raise ValueError("ข้อมูล players ถูกตัด")
+
+    return players
+
+
+def parse_ping(data: bytes) -> bytes:
+    """
+    แปลงข้อมูลตอบกลับของ opcode 'p' (ping) → คืน payload 4 bytes ที่เซิร์ฟเวอร์ส่งกลับมา
+    """
+    if len(data) < 15:
+        raise ValueError("ตอบกลับไม่สมบูรณ์")
+    return bytes(memoryview(data)[11:15])
+
+
+# opcode → parser (ใช้ dispatch ตาม byte ที่ offset 10 ของคำตอบ)
+PARSERS = {
+    ord("i"): parse_info,
+    ord("r"): parse_rules,
+    ord("c"): parse_clients,
+    ord("d"): parse_players,
+    ord("p"): parse_ping,
+}
+
+
+def parse_response(data: bytes):
+    """
+    แปลงข้อมูลตอบกลับตาม opcode ที่อยู่ใน header (offset 10)
+    """
+    if len(data) < 11 or data[:4] != b"SAMP":
+        raise ValueError("ไม่ใช่ packet ของ SA-MP")
+
+    parser = PARSERS.get(data[10])
+    if parser is None:
+        raise ValueError(f"ไม่รองรับ opcode: {chr(data[10])!r}")
+    return parser(data)
+
+
+def _no_reply(opcode: bytes, error: QueryError):
+    """ ผลลัพธ์เมื่อไม่ได้คำตอบ: opcode 'i' คืน ServerInfo ออฟไลน์, opcode อื่นคืน None """
+    return _offline_result(error) if opcode == b"i" else None
+
+
+def _parse_reply(opcode: bytes, data: bytes, loss: float = 0.0):
+    try:
+        if opcode == b"i":
+            return parse_info(data, loss)
+        return parse_response(data)
+    except ValueError:
+        return _no_reply(opcode, QueryError.BAD_REPLY)
+
+
+# ────────────────────────────────────────────────
+#           Transport กลาง: UDP socket เดียวสำหรับทุก query
+# ────────────────────────────────────────────────
+
+# นโยบาย retry: เริ่มด้วย timeout สั้น แล้วเพิ่มเป็นเท่าตัวทุกครั้งที่ไม่ได้คำตอบ
+# จนกว่าจะครบ timeout รวมของ request
+RETRY_INITIAL = 0.1     # timeout ของการส่งครั้งแรก (วินาที) ถ้ายังไม่รู้ RTT ของเป้าหมาย
+RETRY_BACKOFF = 2.0     # ตัวคูณ timeout ของการส่งครั้งถัดไป
+# เวลารอ Future เกิน timeout ของ request ได้อีกเท่าไร ก่อนถือว่า transport ค้าง (thread รับข้อมูลตาย ฯลฯ)
+RESULT_MARGIN = 1.0
+
+
+def _wait_result(future: Future, opcode: bytes, wait: float):
+    """ รอผลของ Future ไม่เกิน wait วินาที ไม่ได้ผล → ผลแบบหมดเวลา (ผู้เรียกไม่ค้างตลอดไป) """
+    try:
+        return future.result(max(0.0, wait))
+    except FutureTimeoutError:
+        return _no_reply(opcode, QueryError.TIMEOUT)
+
+
+class _Pending:
+    """ query ที่รอคำตอบอยู่ (ผู้ถามซ้ำ key เดียวกันจะรอ future ร่วมกัน) """
+    __slots__ = (
+        "key", "opcode", "packet", "addr", "target", "futures",
+        "expires_tick", "deadline", "rto", "attempts", "sent_at"
+    )
+
+    def __init__(self, key: bytes, opcode: bytes, packet: bytes, addr: tuple):
+        self.key = key
+        self.opcode = opcode
+        self.packet = packet
+        self.addr = addr
+        self.target = packet[4:10]      # IP + PORT ใน header ใช้ระบุเป้าหมาย
+        self.futures = []
+        self.expires_tick = 0
+        self.deadline = 0.0
+        self.rto = RETRY_INITIAL
+        self.attempts = 0
+        self.sent_at = 0.0
+
+
+class _TargetStats:
+    """
+    สถิติต่อเป้าหมาย: จำนวนครั้งที่ส่งแล้วรู้ผล / ที่หาย (ใช้คำนวณ loss) + RTT เฉลี่ยแบบ smoothed
+
+    นับว่าหายเฉพาะตอนต้องส่งซ้ำหรือหมดเวลาเท่านั้น packet ที่ยังรอคำตอบอยู่ไม่นับ
+    (ไม่อย่างนั้นตอนยิงหลาย opcode พร้อมกัน loss จะขึ้นทั้งที่ไม่มีอะไรหาย)
+    """
+    __slots__ = ("sent", "lost", "srtt")
+
+    def __init__(self):
+        self.sent = 0
+        self.lost = 0
+        self.srtt = None
+
+    @property
+    def loss(self) -> float:
+        if not self.sent:
+            return 0.0
+        return self.lost / self.sent
+
+
+def _reply_key(data: bytes) -> bytes:
+    """ key สำหรับจับคู่คำตอบ: IP + PORT + OPCODE (ping รวม payload 4 bytes ด้วย) """
+    return data[4:15] if data[10] == 0x70 else data[4:11]   # 0x70 = 'p'
+
+
+class QueryTransport:
+    """
+    Transport สำหรับ query SA-MP ที่ถือ UDP socket เดียวตลอดอายุโปรแกรม
+
+    - submit() คืน Future ต่อ request (ไม่ต้องเปิด/ปิด socket ทุกครั้ง)
+    - thread รับข้อมูลตัวเดียวแยกคำตอบตาม header (ip, port, opcode) ที่เซิร์ฟเวอร์ส่งกลับมา
+    - timeout ทั้งหมดจัดการด้วย timer wheel ตัวเดียว (ความละเอียด TICK วินาที)
+    - packet หาย → ส่งซ้ำด้วย timeout ที่ยาวขึ้นเรื่อย ๆ (exponential backoff) ภายใน timeout รวม
+      timeout ครั้งแรกปรับตาม RTT ที่วัดได้ของเป้าหมายนั้น (2 × srtt แต่ไม่ต่ำกว่า RETRY_INITIAL)
+    """
+    TICK = 0.01         # ความละเอียดของ timer wheel (วินาที)
+    WHEEL_SIZE = 512    # จำนวนช่อง (timeout ที่ยาวกว่า 1 รอบจะวนกลับมาเช็คซ้ำ)
+
+    def __init__(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self._sock.bind(("0.0.0.0", 0))
+        self._wake_addr = ("127.0.0.1", self._sock.getsockname()[1])
+
+        self._lock = threading.Lock()
+        self._pending: dict[bytes, _Pending] = {}
+        self._wheel = [set() for _ in range(self.WHEEL_SIZE)]
+        self._targets: dict[bytes, _TargetStats] = {}
+        self._epoch = time.monotonic()
+        self._tick = 0
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._loop, name="samp-query", daemon=True)
+        self._thread.start()
+
+    # -------------------------------------------------------------------------
+
+    def submit(self, ip: str, port: int, opcode: bytes = b"i", timeout: float = 1.5) -> Future:
+        """
+        ส่ง query แล้วคืน Future ทันที
+        ผลลัพธ์ของ Future เหมือนกับ _parse_reply() / _no_reply() (ไม่ raise exception)
+        ผลของ opcode 'i' เป็น ServerInfo ที่มี loss (อัตรา packet loss ที่วัดได้ของเป้าหมาย)
+
+        timeout คือเวลารวมทั้งหมด การส่งซ้ำทุกครั้งต้องอยู่ภายในเวลานี้
+        """
+        future = Future()
+        try:
+            packet = build_query(ip, int(port), opcode)
+        except ValueError:
+            future.set_result(_no_reply(opcode, QueryError.INVALID_ADDRESS))
+            return future
+
+        key = _reply_key(packet)
+        with self._lock:
+            if self._closed:
+                future.set_result(_no_reply(opcode, QueryError.CLOSED))
+                return future
+
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.futures.append(future)  # มีคนถามอยู่แล้ว → รอคำตอบเดียวกัน
+                return future
+
+            was_idle = not self._pending
+            pending = _Pending(key, opcode, packet, (ip, int(port)))
+            pending.futures.append(future)
+            pending.deadline = time.monotonic() + timeout
+
+            stats = self._targets.get(pending.target)
+            if stats is not None and stats.srtt is not None:
+                pending.rto = max(RETRY_INITIAL, 2 * stats.srtt)
+            self._pending[key] = pending
+            self._schedule(pending, min(pending.rto, timeout))
+
+        if was_idle:
+            self._wake()
+        self._send(pending)
+        return future
+
+    def query(self, ip: str, port: int, opcode: bytes = b"i", timeout: float = 1.5):
+        """ เวอร์ชัน blocking ของ submit() """
+        return _wait_result(self.submit(ip, port, opcode, timeout), opcode, timeout + RESULT_MARGIN)
+
+    def loss(self, ip: str, port: int) -> float:
+        """ อัตรา packet loss ที่วัดได้ของเป้าหมาย (0.0 - 1.0) """
+        try:
+            target = build_packet(ip, int(port), b"")[4:]
+        except ValueError:
+            return 0.0
+        with self._lock:
+            stats = self._targets.get(target)
+            return stats.loss if stats is not None else 0.0
+
+    def close(self):
+        """ ปิด transport: request ที่ค้างอยู่จะได้ผลเป็นหมดเวลา """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            leftover = list(self._pending.values())
+            self._pending.clear()
+            for slot in self._wheel:
+                slot.clear()
+
+        self._wake()
+        self._thread.join(1.0)
+        self._sock.close()
+        for pending in leftover:
+            self._resolve(pending, _no_reply(pending.opcode, QueryError.TIMEOUT))
+
+    # -------------------------------------------------------------------------
+
+    def _now_tick(self) -> int:
+        return int((time.monotonic() - self._epoch) / self.TICK)
+
+    def _schedule(self, pending: _Pending, delay: float):
+        """ วาง request ลงช่องของ timer wheel (ต้องถือ self._lock) """
+        ticks = max(1, int(-(-delay // self.TICK)))
+        pending.expires_tick = self._now_tick() + ticks
+        self._wheel[pending.expires_tick % self.WHEEL_SIZE].add(pending)
+
+    def _target_stats(self, target: bytes) -> _TargetStats:
+        """ (ต้องถือ self._lock) """
+        stats = self._targets.get(target)
+        if stats is None:
+            stats = self._targets[target] = _TargetStats()
+        elif stats.sent >= 200:
+            # ลดน้ำหนักข้อมูลเก่า ให้ loss สะท้อนสภาพเครือข่ายช่วงหลัง
+            stats.sent //= 2
+            stats.lost //= 2
+        return stats
+
+    def _send(self, pending: _Pending):
+        with self._lock:
+            pending.attempts += 1
+            pending.sent_at = time.monotonic()
+        try:
+            self._sock.sendto(pending.packet, pending.addr)
+        except OSError:
+            with self._lock:
+                if self._pending.pop(pending.key, None) is None:
+                    return
+                self._wheel[pending.expires_tick % self.WHEEL_SIZE].discard(pending)
+            self._resolve(pending, _no_reply(pending.opcode, QueryError.NETWORK))
+
+    def _wake(self):
+        """ ปลุก thread รับข้อมูลที่อาจหลับรอแบบไม่มี timeout """
+        try:
+            self._sock.sendto(b"", self._wake_addr)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _resolve(pending: _Pending, result):
+        for future in pending.futures:
+            if not future.done():
+                future.set_result(result)
+
+    def _loop(self):
+        """ thread รับข้อมูล: แยกคำตอบตาม header + หมุน timer wheel """
+        sock = self._sock
+        while not self._closed:
+            with self._lock:
+                idle = not self._pending
+            # ไม่มีงานค้าง → หลับจนกว่าจะถูกปลุก, มีงาน → ตื่นทุก TICK เพื่อหมุน wheel
+            sock.settimeout(None if idle else self.TICK)
+
+            try:
+                data, _ = sock.recvfrom(65535)
+            except socket.timeout:
+                data = None
+            except OSError:
+                # Windows: ICMP port unreachable จะโผล่เป็น ConnectionResetError
+                if self._closed:
+                    break
+                data = None
+
+            if data and len(data) >= 11 and data[:4] == b"SAMP":
+                with self._lock:
+                    pending = self._pending.pop(_reply_key(data), None)
+                    if pending is not None:
+                        self._wheel[pending.expires_tick % self.WHEEL_SIZE].discard(pending)
+                        stats = self._target_stats(pending.target)
+                        stats.sent += 1
+                        if pending.attempts == 1:
+                            # RTT ใช้ได้เฉพาะตอนส่งครั้งเดียว (ไม่รู้ว่าคำตอบเป็นของครั้งไหน)
+                            rtt = time.monotonic() - pending.sent_at
+                            stats.srtt = rtt if stats.srtt is None else 0.875 * stats.srtt + 0.125 * rtt
+                    else:
+                        # คำตอบที่มาช้า (ของครั้งที่ส่งซ้ำไปแล้ว) → ครั้งนั้นไม่ได้หายจริง
+                        stats = self._targets.get(data[4:10])
+                        if stats is not None and stats.lost:
+                            stats.lost -= 1
+                    loss = stats.loss if stats is not None else 0.0
+                if pending is not None:
+                    self._resolve(pending, _parse_reply(pending.opcode, data, loss))
+
+            self._advance()
+
+    def _advance(self):
+        """ หมุน timer wheel ไปถึง tick ปัจจุบัน แล้วส่งซ้ำ / ปิด request ที่หมดเวลา """
+        now_tick = self._now_tick()
+        now = time.monotonic()
+        expired = []
+        retries = []
+
+        with self._lock:
+            if now_tick <= self._tick:
+                return
+            if now_tick - self._tick >= self.WHEEL_SIZE:
+                ticks = range(self.WHEEL_SIZE)    # ตกหล่นเกิน 1 รอบ → เช็คทุกช่อง
+            else:
+                ticks = range(self._tick + 1, now_tick + 1)
+
+            for tick in ticks:
+                slot = self._wheel[tick % self.WHEEL_SIZE]
+                for pending in [p for p in slot if p.expires_tick <= now_tick]:
+                    slot.discard(pending)
+                    # ครั้งล่าสุดไม่ได้คำตอบภายใน rto → นับเป็น packet หาย
+                    stats = self._target_stats(pending.target)
+                    stats.sent += 1
+                    stats.lost += 1
+                    remaining = pending.deadline - now
+                    if remaining >= self.TICK:
+                        # ยังไม่ครบเวลารวม → ส่งซ้ำด้วย timeout ที่ยาวขึ้น
+                        pending.rto *= RETRY_BACKOFF
+                        self._schedule(pending, min(pending.rto, remaining))
+                        retries.append(pending)
+                    else:
+                        del self._pending[pending.key]
+                        expired.append(pending)
+            self._tick = now_tick
+
+        for pending in retries:
+            self._send(pending)
+        for pending in expired:
+            self._resolve(pending, _no_reply(pending.opcode, QueryError.TIMEOUT))
+
+
+_transport: Optional[QueryTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> QueryTransport:
+    """ คืน transport กลางของทั้ง process (สร้างเมื่อใช้ครั้งแรก) """
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = QueryTransport()
+        return _transport
+
+
+def query_server(ip: str, port: int, timeout: float = 1.5) -> ServerInfo:
     """
     สอบถามข้อมูลเซิร์ฟเวอร์ SA-MP (opcode 'i' = basic server info)
+    ส่งผ่าน transport กลาง (socket เดียวทั้งโปรแกรม)
 
     Parameters:
         ip      : str       - ที่อยู่ IP ของเซิร์ฟเวอร์
@@ -32,109 +595,314 @@ def query_server(ip: str, port: int, timeout: float = 1.5) -> dict:
         timeout : float     - เวลารอสูงสุด (วินาที)
 
     Returns:
-        dict ที่มีข้อมูลสถานะเซิร์ฟเวอร์
+        ServerInfo ที่มีข้อมูลสถานะเซิร์ฟเวอร์
     """
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.settimeout(timeout)
-
     try:
-        # สร้างและส่ง packet สำหรับ opcode 'i' (server info)
-        packet = build_packet(ip, port, b"i")
-        sock.sendto(packet, (ip, port))
-
-        # รับข้อมูลตอบกลับ
-        data, _ = sock.recvfrom(4096)
-
-        if len(data) < 11 + 1 + 2 + 2 + 4:
-            # ข้อมูลสั้นเกินไป → ถือว่าไม่สมบูรณ์
-            return {
-                "online": False,
-                "passworded": False,
-                "players": 0,
-                "max_players": 0,
-                "hostname": "ตอบกลับไม่สมบูรณ์"
-            }
-
-        offset = 11  # ข้ามส่วน header "SAMPxxxxxx"
-
-        # ────────────────────────────────────────────────
-        #           โครงสร้างข้อมูล opcode 'i'
-        # ────────────────────────────────────────────────
-        # offset 11  → passworded     (1 byte)
-        # offset 12  → players        (2 bytes, uint16 LE)
-        # offset 14  → max_players    (2 bytes, uint16 LE)
-        # offset 16  → hostname_len   (4 bytes, uint32 LE)
-        # offset 20  → hostname       (ความยาวตาม hostname_len)
-
-        passworded = data[offset]
-        offset += 1
-
-        players = struct.unpack_from("<H", data, offset)[0]
-        offset += 2
-
-        max_players = struct.unpack_from("<H", data, offset)[0]
-        offset += 2
-
-        hostname_len = struct.unpack_from("<I", data, offset)[0]
-        offset += 4
-
-        # ตรวจสอบว่ามีข้อมูล hostname พอหรือไม่
-        if offset + hostname_len > len(data):
-            hostname = "[ชื่อเซิร์ฟเวอร์ถูกตัด]"
-        else:
-            # ถอดรหัส hostname (ใช้ errors="replace" จะปลอดภัยกว่า ignore)
-            hostname = data[offset:offset + hostname_len].decode("utf-8", errors="replace")
+        return get_transport().query(ip, port, b"i", timeout)
 
-        return {
-            "online": True,
-            "passworded": bool(passworded),
-            "players": int(players),
-            "max_players": int(max_players),
-            "hostname": hostname.strip()
-        }
+    except Exception:
+        # จับข้อผิดพลาดอื่น ๆ ที่ไม่คาดคิด
+        return _offline_result(QueryError.UNKNOWN)
 
-    except socket.timeout:
-        return {
-            "online": False,
-            "passworded": False,
-            "players": 0,
-            "max_players": 0,
-            "hostname": "หมดเวลา (timeout)"
-        }
 
-    except socket.gaierror:
-        return {
-            "online": False,
-            "passworded": False,
-            "players": 0,
-            "max_players": 0,
-            "hostname": "IP/โดเมน ไม่ถูกต้อง"
-        }
+def query_server_multi(ip: str, port: int, opcodes: bytes = b"irc", timeout: float = 1.5) -> dict:
+    """
+    สอบถามหลาย opcode พร้อมกันในรอบเดียว (ส่งทุก packet ก่อนแล้วค่อยรอคำตอบ)
 
-    except ValueError as e:
-        return {
-            "online": False,
-            "passworded": False,
-            "players": 0,
-            "max_players": 0,
-            "hostname": f"ข้อผิดพลาด: {str(e)}"
-        }
+    Parameters:
+        ip      : str       - ที่อยู่ IP ของเซิร์ฟเวอร์
+        port    : int       - พอร์ต
+        opcodes : bytes     - opcode ที่ต้องการ เช่น b"irc" หรือ b"id"
+        timeout : float     - เวลารอสูงสุดของทั้งรอบ (วินาที)
 
-    except Exception as e:
-        # จับข้อผิดพลาดอื่น ๆ ที่ไม่คาดคิด
+    Returns:
+        dict ของ opcode (str) → ผลลัพธ์ที่ parse แล้ว
+        opcode ที่ไม่ได้คำตอบ: 'i' เป็น ServerInfo ออฟไลน์, อื่น ๆ เป็น None
+    """
+    transport = get_transport()
+    futures = {chr(op): transport.submit(ip, port, bytes([op]), timeout) for op in opcodes}
+    deadline = time.monotonic() + timeout + RESULT_MARGIN
+    return {
+        op: _wait_result(future, op.encode(), deadline - time.monotonic())
+        for op, future in futures.items()
+    }
+
+
+# ────────────────────────────────────────────────
+#           วัด Latency ด้วย opcode 'p' (ping)
+# ────────────────────────────────────────────────
+
+# ขอบบนของแต่ละช่อง histogram (ms) ช่องสุดท้ายคือ "มากกว่า 500 ms"
+LATENCY_BUCKETS_MS = (10, 20, 50, 100, 200, 500)
+
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    """ percentile แบบ nearest-rank (ข้อมูลต้องเรียงแล้ว) """
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def latency_stats(rtts_ms: list[float], sent: int) -> dict:
+    """
+    สรุปผล RTT เป็น min / avg / p95 / max / jitter / loss + histogram
+
+    jitter = ค่าเฉลี่ยของผลต่าง RTT ระหว่าง ping ที่ติดกัน
+    """
+    histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    for rtt in rtts_ms:
+        index = 0
+        while index < len(LATENCY_BUCKETS_MS) and rtt > LATENCY_BUCKETS_MS[index]:
+            index += 1
+        histogram[index] += 1
+
+    received = len(rtts_ms)
+    loss = (sent - received) / sent if sent else 0.0
+
+    if not rtts_ms:
         return {
-            "online": False,
-            "passworded": False,
-            "players": 0,
-            "max_players": 0,
-            "hostname": f"เกิดข้อผิดพลาด: {type(e).__name__}"
+            "sent": sent,
+            "received": 0,
+            "loss": loss,
+            "min": None,
+            "avg": None,
+            "p95": None,
+            "max": None,
+            "jitter": None,
+            "histogram": histogram
         }
 
+    ordered = sorted(rtts_ms)
+    diffs = [abs(b - a) for a, b in zip(rtts_ms, rtts_ms[1:])]
+
+    return {
+        "sent": sent,
+        "received": received,
+        "loss": loss,
+        "min": ordered[0],
+        "avg": sum(rtts_ms) / received,
+        "p95": _percentile(ordered, 95),
+        "max": ordered[-1],
+        "jitter": sum(diffs) / len(diffs) if diffs else 0.0,
+        "histogram": histogram
+    }
+
+
+def measure_latency(
+    ip: str,
+    port: int,
+    count: int = 10,
+    interval: float = 0.05,
+    timeout: float = 1.0
+) -> dict:
+    """
+    วัด RTT ไปยังเซิร์ฟเวอร์ด้วย ping (opcode 'p') จำนวน count ครั้ง
+
+    แต่ละครั้งใช้ payload สุ่ม 4 bytes เพื่อจับคู่คำตอบให้ถูกตัว
+    (คำตอบของ ping ที่หมดเวลาไปแล้วจะไม่ถูกนับซ้ำ)
+
+    Parameters:
+        ip       : str      - ที่อยู่ IP ของเซิร์ฟเวอร์
+        port     : int      - พอร์ต
+        count    : int      - จำนวน ping
+        interval : float    - ระยะห่างระหว่าง ping (วินาที)
+        timeout  : float    - เวลารอคำตอบของ ping แต่ละครั้ง (วินาที)
+
+    Returns:
+        dict ผลสรุปจาก latency_stats() (หน่วย ms)
+    """
+    rtts = []
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    try:
+        header = build_packet(ip, port, b"p")
+
+        for i in range(count):
+            if i:
+                time.sleep(interval)
+
+            payload = os.urandom(4)
+            sent_at = time.perf_counter_ns()
+            deadline = sent_at + int(timeout * 1e9)
+            sock.sendto(header + payload, (ip, port))
+
+            while True:
+                remaining = deadline - time.perf_counter_ns()
+                if remaining <= 0:
+                    break
+                sock.settimeout(remaining / 1e9)
+                try:
+                    data, _ = sock.recvfrom(64)
+                except socket.timeout:
+                    break
+
+                if data[:11] == header and data[11:15] == payload:
+                    rtts.append((time.perf_counter_ns() - sent_at) / 1e6)
+                    break
+
+    except (OSError, ValueError) as e:
+        print(f"วัด latency ไม่สำเร็จ ({ip}:{port}): {e}")
+
     finally:
         sock.close()
 
+    return latency_stats(rtts, count)
+
+
+# ────────────────────────────────────────────────
+#           Query หลายเซิร์ฟเวอร์พร้อมกัน (asyncio)
+# ────────────────────────────────────────────────
+
+class _QueryProtocol(asyncio.DatagramProtocol):
+    """
+    รับ packet ตอบกลับจาก socket เดียว แล้วจับคู่กับเป้าหมาย
+    โดยใช้ header IP(4) + PORT(2) + OPCODE(1) ที่เซิร์ฟเวอร์ส่งกลับมาเหมือนเดิม
+    """
+
+    def __init__(self, pending: dict, queue: asyncio.Queue):
+        self.pending = pending
+        self.queue = queue
+
+    def datagram_received(self, data: bytes, addr):
+        if len(data) < 11 or data[:4] != b"SAMP":
+            return  # ไม่ใช่ packet ของ SA-MP
+
+        key = data[4:11]
+        target = self.pending.pop(key, None)
+        if target is None:
+            return  # ตอบซ้ำ หรือไม่ได้ถามไป
+
+        # เวลาที่ได้รับจับตรงนี้ ไม่ใช่ตอนที่ผู้ใช้ดึงจาก queue (ซึ่งอาจรอคิวหลังคำตอบอื่น)
+        self.queue.put_nowait((key, target, data, time.perf_counter()))
+
+    def error_received(self, exc):
+        # ICMP port unreachable ของเป้าหมายหนึ่ง ไม่ควรทำให้ทั้ง batch ล้ม
+        pass
+
+
+async def iter_query_many(
+    targets: Iterable[tuple[str, int]],
+    timeout: float = 1.5,
+    opcode: bytes = b"i"
+) -> AsyncIterator[tuple[tuple[str, int], object]]:
+    """
+    ส่ง query ไปยังหลายเซิร์ฟเวอร์พร้อมกันจาก socket เดียว
+    แล้วคืนผลลัพธ์ทีละตัวตามลำดับที่ตอบกลับมา
+
+    Parameters:
+        targets : iterable  - รายการ (ip, port)
+        timeout : float     - เวลารอทั้งหมดของทั้ง batch (วินาที)
+        opcode  : bytes     - opcode ที่ต้องการ query (ค่าเริ่มต้น 'i')
+
+    Yields:
+        ((ip, port), ผลลัพธ์) - เป้าหมายที่ไม่ตอบภายใน timeout จะถูกคืนตอนท้าย
+        (opcode 'i' เป็น ServerInfo ออฟไลน์, opcode อื่นเป็น None)
+    """
+    async for target, result, _ in iter_query_many_timed(targets, timeout, opcode):
+        yield target, result
+
+
+async def iter_query_many_timed(
+    targets: Iterable[tuple[str, int]],
+    timeout: float = 1.5,
+    opcode: bytes = b"i"
+) -> AsyncIterator[tuple[tuple[str, int], object, Optional[float]]]:
+    """
+    เหมือน iter_query_many() แต่คืน RTT (ms) ของแต่ละเป้าหมายด้วย
+
+    RTT = เวลาที่ได้รับคำตอบ - เวลาที่ส่ง query ไปยังเป้าหมายนั้น (ไม่ใช่นับจากตอนเริ่ม batch)
+
+    Yields:
+        ((ip, port), ผลลัพธ์, rtt_ms) - rtt_ms เป็น None เมื่อไม่ได้คำตอบ
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    pending = {}
+    packets = []
+    for ip, port in targets:
+        port = int(port)
+        try:
+            packet = build_query(ip, port, opcode)
+        except ValueError:
+            yield (ip, port), _no_reply(opcode, QueryError.INVALID_ADDRESS), None
+            continue
+
+        key = packet[4:11]
+        if key in pending:
+            continue  # เป้าหมายซ้ำ ถามครั้งเดียวพอ
+        pending[key] = (ip, port)
+        packets.append((key, packet, (ip, port)))
+
+    if not packets:
+        return
+
+    # ขยาย buffer ขาเข้า เพราะคำตอบจากหลายร้อยเซิร์ฟเวอร์อาจมาถึงพร้อมกัน
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.setblocking(False)
+
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _QueryProtocol(pending, queue),
+        sock=sock
+    )
+
+    sent_at = {}
+
+    def reply(item):
+        key, target, data, received_at = item
+        return target, _parse_reply(opcode, data), (received_at - sent_at[key]) * 1000
+
+    try:
+        for key, packet, addr in packets:
+            sent_at[key] = time.perf_counter()
+            transport.sendto(packet, addr)
+
+        deadline = loop.time() + timeout
+        while pending or not queue.empty():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            yield reply(item)
+
+    finally:
+        transport.close()
+
+    # คำตอบที่มาถึงพร้อมกับ deadline
+    while not queue.empty():
+        yield reply(queue.get_nowait())
+
+    for target in list(pending.values()):
+        yield target, _no_reply(opcode, QueryError.TIMEOUT), None
+
+
+def query_many(targets: Iterable[tuple[str, int]], timeout: float = 1.5, opcode: bytes = b"i") -> dict:
+    """
+    Query หลายเซิร์ฟเวอร์พร้อมกัน (เวอร์ชัน blocking สำหรับเรียกจาก thread ปกติ)
+    ใช้เวลาประมาณ 1 timeout ไม่ว่าจะมีกี่เซิร์ฟเวอร์
+
+    Returns:
+        dict ของ (ip, port) → ผลลัพธ์ของ opcode ที่ขอ
+    """
+    async def collect():
+        return {target: result async for target, result in iter_query_many(targets, timeout, opcode)}
+
+    return asyncio.run(collect())
+
 
 # ตัวอย่างการใช้งาน
 if __name__ == "__main__":
     result = query_server("127.0.0.1", 7777, timeout=2.0)
-    print(result)
\ No newline at end of file
+    print(result)
+
+    results = query_many([("127.0.0.1", 7777), ("127.0.0.1", 7778)], timeout=2.0)
+    print(results)
+
+    details = query_server_multi("127.0.0.1", 7777, opcodes=b"ird", timeout=2.0)
+    print(details)
+
+    latency = measure_latency("127.0.0.1", 7777, count=20)
+    print(latency)
\ No newline at end of file
@@ -1,6 +1,10 @@
 import requests
 import certifi
 import hashlib
+import json
+import os
+import threading
+import time
 from pathlib import Path
 from typing import Callable, Optional
 from PyQt6.QtCore import QObject, pyqtSignal, QThread
@@ -33,21 +37,70 @@ class DownloadWorker(QObject):
     """
     Worker สำหรับดาวน์โหลดไฟล์ใน thread แยก
     รองรับการรายงานความคืบหน้า + ยกเลิกการดาวน์โหลด
+
+    ดาวน์โหลดต่อจากเดิมได้ (resume):
+    - ระหว่างโหลดเขียนลง <save_path>.part และบันทึก journal <save_path>.part.json
+      (url, ETag / Last-Modified, ขนาดทั้งหมด, จำนวน byte ที่ลงดิสก์แล้ว)
+    - เน็ตหลุด → ลองใหม่เองสูงสุด max_retries ครั้ง, ยกเลิก / ปิดโปรแกรม → เก็บ .part ไว้
+    - รอบถัดไปขอเฉพาะส่วนที่ขาดด้วย Range + If-Range
+      ถ้าไฟล์บนเซิร์ฟเวอร์เปลี่ยนหรือเซิร์ฟเวอร์ไม่รองรับ Range (ตอบ 200) → เริ่มจาก byte 0 ใหม่
+    - โหลดครบแล้วจึงเปลี่ยนชื่อ .part เป็น save_path
+
+    segments > 1 = โหลดแบบแบ่งช่วง (หลาย connection พร้อมกัน):
+    - แบ่งไฟล์เป็นก้อนขนาดคงที่, N thread หยิบก้อนถัดไปตามลำดับไฟล์ผ่าน connection pool เดียวกัน
+      แล้วเขียนลงไฟล์ที่จองขนาดไว้แล้วด้วย pwrite (ไม่ต้อง seek / lock ไฟล์)
+    - thread ที่ว่างจะแบ่งครึ่งช่วงที่คาดว่าจะเสร็จช้าที่สุดมาทำต่อ (work stealing)
+    - journal เก็บช่วงที่ยังขาด → ยกเลิก / เน็ตหลุดแล้วโหลดต่อได้เหมือนโหมดปกติ
+      (เปลี่ยนค่า segments ระหว่างรอบก็โหลดต่อได้ โหมด connection เดียวจะต่อจากส่วนต้นไฟล์ที่ครบต่อเนื่อง)
+    - เซิร์ฟเวอร์ไม่รองรับ Range หรือไฟล์เล็ก → กลับไปโหลด connection เดียวอัตโนมัติ
+
+    SHA-256 ถูกคำนวณระหว่างโหลด (_FileHasher) แล้วส่งมากับ finished
+    → ไม่ต้องอ่านไฟล์ทั้งไฟล์ซ้ำเพื่อตรวจสอบหลังโหลดเสร็จ
+    (โหมดแบ่งช่วงแจกงานเป็นก้อนเล็กตามลำดับไฟล์ ข้อมูลจึงมาเกือบเรียงกัน → hash จาก chunk ที่ได้รับ
+     อ่านจากดิสก์เฉพาะส่วนที่มาก่อนลำดับเกิน HASH_BUDGET หรือส่วนที่โหลดไว้แล้วตอนโหลดต่อ)
     """
     progress = pyqtSignal(int)          # ส่งเปอร์เซ็นต์ (0-100)
-    finished = pyqtSignal(str)          # ส่ง path ที่บันทึกสำเร็จ
+    finished = pyqtSignal(str, str)     # ส่ง path ที่บันทึกสำเร็จ + sha256 (hex)
     error = pyqtSignal(str)             # ส่งข้อความ error
     canceled = pyqtSignal()             # แจ้งเมื่อถูกยกเลิกโดยผู้ใช้
 
-    def __init__(self, url: str, save_path: str):
+    # โหมดแบ่งช่วง: พักข้อมูลที่มาก่อนลำดับไว้ hash ในหน่วยความจำได้ไม่เกินกี่ byte
+    # (เกินนี้ค่อยอ่านจากดิสก์) และเป็นเพดานการอ่านจากดิสก์ต่อรอบ progress ด้วย
+    HASH_BUDGET = 32 * 1024 * 1024
+
+    # error ที่ถือว่าเน็ตสะดุด → ลองต่อจากเดิม
+    RETRYABLE = (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+    )
+
+    def __init__(
+        self,
+        url: str,
+        save_path: str,
+        max_retries: int = 5,
+        chunk_size: int = 64 * 1024,
+        journal_every: int = 8 * 1024 * 1024,
+        segments: int = 1,
+        min_segment: int = 1024 * 1024
+    ):
         super().__init__()
         self.url = url
         self.save_path = save_path
+        self.part_path = Path(f"{save_path}.part")
+        self.journal_path = Path(f"{save_path}.part.json")
+        self.max_retries = max_retries
+        self.chunk_size = chunk_size
+        self.journal_every = journal_every      # บันทึก journal ทุก ๆ กี่ byte (fsync ทุกครั้ง)
+        self.segments = max(1, segments)
+        self.min_segment = min_segment          # ช่วงที่เล็กกว่านี้ไม่แบ่งต่อ
+        self._hasher: Optional[_FileHasher] = None
         self._running = True
         self._canceled = False
 
     def cancel(self):
-        """ เรียกเมื่อต้องการยกเลิกการดาวน์โหลด """
+        """ เรียกเมื่อต้องการยกเลิกการดาวน์โหลด (ไฟล์ .part ยังอยู่ ดาวน์โหลดต่อทีหลังได้) """
         self._running = False
         self._canceled = True
 
@@ -56,48 +109,33 @@ class DownloadWorker(QObject):
         ฟังก์ชันหลักที่ทำงานใน thread แยก
         """
         try:
-            # ใช้ streaming + timeout ที่เหมาะสม
-            with requests.get(
-                self.url,
-                stream=True,
-                timeout=(10, 30),           # connect=10s, read=30s
-                verify=certifi.where()
-            ) as response:
-
-                response.raise_for_status()
-
-                total_size = int(response.headers.get("Content-Length", 0))
-                downloaded = 0
-                last_percent = -1
-
-                # สร้าง parent directory ถ้ายังไม่มี
-                Path(self.save_path).parent.mkdir(parents=True, exist_ok=True)
-
-                with open(self.save_path, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if not self._running:
-                            # ถูกยกเลิก → ลบไฟล์ที่ดาวน์โหลดไม่ครบ
-                            try:
-                                Path(self.save_path).unlink(missing_ok=True)
-                            except:
-                                pass
-                            if self._canceled:
-                                self.canceled.emit()
-                            return
-
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-
-                            if total_size > 0:
-                                percent = int((downloaded / total_size) * 100)
-                                # ลดการ emit ซ้ำซ้อน (ป้องกัน UI กระตุก)
-                                if percent != last_percent:
-                                    self.progress.emit(percent)
-                                    last_percent = percent
+            # สร้าง parent directory ถ้ายังไม่มี
+            Path(self.save_path).parent.mkdir(parents=True, exist_ok=True)
+
+            attempt = 0
+            while True:
+                try:
+                    completed = self._fetch_segmented() if self.segments > 1 else self._fetch()
+                    break
+                except self.RETRYABLE as e:
+                    attempt += 1
+                    if attempt > self.max_retries or not self._running:
+                        raise
+                    delay = min(2 ** attempt, 30)
+                    print(f"ดาวน์โหลดสะดุด ({e}) → ลองต่อจากเดิมใน {delay} วินาที (ครั้งที่ {attempt})")
+                    self._sleep(delay)
+
+            if not completed:
+                if self._canceled:
+                    self.canceled.emit()
+                return
+
+            sha256 = self._hasher.hexdigest()
+            os.replace(self.part_path, self.save_path)
+            self.journal_path.unlink(missing_ok=True)
 
             # ดาวน์โหลดสำเร็จ
-            self.finished.emit(self.save_path)
+            self.finished.emit(self.save_path, sha256)
 
         except requests.exceptions.RequestException as e:
             self.error.emit(f"ข้อผิดพลาดการเชื่อมต่อ: {e}")
@@ -108,6 +146,532 @@ class DownloadWorker(QObject):
         except Exception as e:
             self.error.emit(f"เกิดข้อผิดพลาดไม่คาดคิด: {type(e).__name__} - {e}")
 
+    # -------------------------------------------------------------------------
+
+    def _fetch(self) -> bool:
+        """
+        ดาวน์โหลด 1 รอบ (ต่อจาก journal ถ้ามี) คืน True เมื่อครบ, False เมื่อถูกยกเลิก
+        """
+        journal = self._load_journal()
+        offset = journal["committed"] if journal else 0
+        if journal and "segments" in journal:
+            # journal ของโหมดแบ่งช่วง → ใช้ส่วนต้นไฟล์ที่ครบต่อเนื่อง (ถึงช่วงแรกที่ยังขาด) แล้วโหลดต่อจากตรงนั้น
+            offset = min((start for start, _ in journal.pop("segments")), default=journal["size"])
+            journal["committed"] = offset
+
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = journal["etag"] or journal["last_modified"]
+
+        # ใช้ streaming + timeout ที่เหมาะสม
+        with requests.get(
+            self.url,
+            stream=True,
+            timeout=(10, 30),           # connect=10s, read=30s
+            verify=certifi.where(),
+            headers=headers
+        ) as response:
+
+            if response.status_code == 416 and offset:
+                # ขอ Range เกินขนาดไฟล์ = ได้ครบไปแล้วในรอบก่อน (ถ้าขนาดตรงกับ Content-Range: */N ของเซิร์ฟเวอร์)
+                server_size = _content_range_total(response.headers.get("Content-Range"))
+                if offset == journal["size"] and server_size in (None, offset):
+                    self._hasher = _FileHasher(self.part_path, offset)
+                    return True
+                # ไฟล์บนเซิร์ฟเวอร์ไม่ตรงกับ .part → ลบทิ้งแล้วลองใหม่จาก byte 0 (ไม่งั้นจะได้ 416 ซ้ำทุกรอบ)
+                self._discard_partial()
+                raise requests.exceptions.ConnectionError(
+                    f"ขนาดไฟล์บนเซิร์ฟเวอร์ ({server_size}) ไม่ตรงกับส่วนที่โหลดไว้ ({offset}) → เริ่มใหม่"
+                )
+
+            response.raise_for_status()
+
+            length = int(response.headers.get("Content-Length", 0))
+
+            if offset and response.status_code == 206:
+                if _content_range_start(response.headers.get("Content-Range")) != offset:
+                    self._discard_partial()
+                    raise requests.exceptions.ConnectionError("Content-Range ไม่ตรงกับส่วนที่ขาด → เริ่มใหม่")
+                total_size = offset + length if length else journal["size"]
+            else:
+                # 200: เซิร์ฟเวอร์ไม่รองรับ Range หรือไฟล์เปลี่ยนไปแล้ว (If-Range ไม่ตรง) → เริ่มจาก 0
+                if offset:
+                    print("เซิร์ฟเวอร์ส่งไฟล์ทั้งไฟล์กลับมา → ดาวน์โหลดใหม่ตั้งแต่ต้น")
+                offset = 0
+                total_size = length
+                journal = {
+                    "url": self.url,
+                    "etag": _strong_etag(response.headers.get("ETag")),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "size": total_size,
+                    "committed": 0,
+                }
+
+            downloaded = offset
+            last_percent = -1
+
+            with open(self.part_path, "r+b" if offset else "wb") as f:
+                if offset:
+                    f.truncate(offset)      # ตัดส่วนที่เขียนเกิน journal ทิ้ง (ยังไม่ได้ fsync)
+                    f.seek(offset)
+                self._commit(f, journal, downloaded)
+
+                # โหลดต่อ → hash ส่วนที่มีอยู่แล้วใน thread เบื้องหลัง ส่วนใหม่ hash จากหน่วยความจำ
+                hasher = self._hasher = _FileHasher(self.part_path, offset)
+
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if not self._running:
+                        # ถูกยกเลิก → บันทึกส่วนที่ได้แล้ว ไว้ดาวน์โหลดต่อรอบหน้า
+                        self._commit(f, journal, downloaded)
+                        return False
+
+                    if chunk:
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        downloaded += len(chunk)
+
+                        if downloaded - journal["committed"] >= self.journal_every:
+                            self._commit(f, journal, downloaded)
+
+                        if total_size > 0:
+                            percent = int((downloaded / total_size) * 100)
+                            # ลดการ emit ซ้ำซ้อน (ป้องกัน UI กระตุก)
+                            if percent != last_percent:
+                                self.progress.emit(percent)
+                                last_percent = percent
+
+                self._commit(f, journal, downloaded)
+
+            if total_size and downloaded != total_size:
+                raise requests.exceptions.ConnectionError(
+                    f"ได้ข้อมูลไม่ครบ ({downloaded}/{total_size} bytes)"
+                )
+
+        return True
+
+    def _load_journal(self) -> Optional[dict]:
+        """ อ่าน journal ของ .part ที่ค้างอยู่ (คืน None ถ้าใช้ต่อไม่ได้ → เริ่มใหม่) """
+        try:
+            journal = json.loads(self.journal_path.read_text(encoding="utf-8"))
+            committed = int(journal["committed"])
+            usable = (
+                journal.get("url") == self.url
+                and (journal.get("etag") or journal.get("last_modified"))     # ไม่มีตัวตรวจ = ต่อไม่ปลอดภัย
+                and 0 < committed <= self.part_path.stat().st_size
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return journal if usable else None
+
+    def _commit(self, f, journal: dict, downloaded: int):
+        """ fsync ข้อมูลก่อน แล้วค่อยบันทึก journal → committed ไม่เคยเกินข้อมูลที่อยู่บนดิสก์จริง """
+        f.flush()
+        os.fsync(f.fileno())
+        journal["committed"] = downloaded
+        self._write_journal(journal)
+
+    def _write_journal(self, journal: dict):
+        tmp = self.journal_path.with_name(self.journal_path.name + ".tmp")
+        tmp.write_text(json.dumps(journal), encoding="utf-8")
+        os.replace(tmp, self.journal_path)
+
+    # ------------------------- โหมดแบ่งช่วง (segmented) -------------------------
+
+    def _fetch_segmented(self) -> bool:
+        """ เหมือน _fetch() แต่โหลดหลายช่วงพร้อมกัน (connection pool ขนาด segments) """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.segments)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        try:
+            return self._run_segments(session)
+        finally:
+            session.close()
+
+    def _run_segments(self, session) -> bool:
+        # ขอ 1 byte แรก เพื่อดูว่ารองรับ Range ไหม + ขนาดไฟล์ + ETag
+        with session.get(
+            self.url,
+            stream=True,
+            timeout=(10, 30),
+            verify=certifi.where(),
+            headers={"Range": "bytes=0-0"}
+        ) as probe:
+            probe.raise_for_status()
+            total_size = _content_range_total(probe.headers.get("Content-Range")) if probe.status_code == 206 else None
+            etag = _strong_etag(probe.headers.get("ETag"))
+            last_modified = probe.headers.get("Last-Modified")
+
+        # ไม่รองรับ Range / ไม่มีตัวตรวจว่าไฟล์เปลี่ยน / ไฟล์เล็กเกินกว่าจะแบ่ง → connection เดียว
+        if not total_size or not (etag or last_modified) or total_size < 2 * self.min_segment:
+            return self._fetch()
+
+        # ก้อนเล็กแจกตามลำดับไฟล์ (ไม่ใช่ N ช่วงใหญ่) → ข้อมูลที่มาก่อนลำดับไม่เกิน ~HASH_BUDGET / 2
+        # ทำให้ hash จาก chunk ในหน่วยความจำได้เกือบทั้งหมด
+        step = max(self.min_segment, min(-(-total_size // self.segments), self.HASH_BUDGET // (2 * self.segments)))
+
+        journal = self._load_journal()
+        resumable = (
+            journal is not None
+            and journal.get("size") == total_size
+            and journal.get("etag") == etag
+            and journal.get("last_modified") == last_modified
+        )
+
+        if resumable and "segments" in journal and self.part_path.stat().st_size == total_size:
+            ranges = journal["segments"]
+        elif resumable and "segments" not in journal:
+            # journal ของโหมด connection เดียว: ต้นไฟล์ถึง committed ครบแล้ว
+            # → ตัดส่วนที่ยังไม่ได้ fsync ทิ้ง, ขยายไฟล์เต็มขนาด แล้วแบ่งเฉพาะส่วนที่เหลือ
+            committed = journal["committed"]
+            with open(self.part_path, "r+b") as f:
+                f.truncate(committed)
+                f.truncate(total_size)
+            ranges = [[start, min(start + step, total_size)] for start in range(committed, total_size, step)]
+        else:
+            journal = {
+                "url": self.url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "size": total_size,
+                "committed": 0,
+            }
+            ranges = [[start, min(start + step, total_size)] for start in range(0, total_size, step)]
+            # จองขนาดไฟล์ไว้ก่อน → ทุก thread เขียนลงตำแหน่งของตัวเองได้ทันที
+            with open(self.part_path, "wb") as f:
+                f.truncate(total_size)
+
+        self._segment_list = [_Segment(start, end) for start, end in ranges if start < end]
+        self._segment_lock = threading.Lock()
+        self._segment_error = None
+        self._downloaded = total_size - sum(seg.end - seg.done for seg in self._segment_list)
+
+        validator = etag or last_modified
+        # hash จาก chunk ที่ได้รับ (offer) ส่วนที่ขาด (เกิน buffer / โหลดไว้แล้วรอบก่อน) อ่านจากดิสก์ (catch_up)
+        hasher = self._hasher = _FileHasher(self.part_path, buffer_limit=self.HASH_BUDGET)
+        fd = os.open(self.part_path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        try:
+            threads = [
+                threading.Thread(target=self._segment_loop, args=(session, fd, validator), daemon=True)
+                for _ in range(self.segments)
+            ]
+            for thread in threads:
+                thread.start()
+
+            last_percent = -1
+            last_commit = self._downloaded
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(0.1)
+                hasher.catch_up(self._written_prefix(total_size), budget=self.HASH_BUDGET)
+
+                percent = int(self._downloaded / total_size * 100)
+                if percent != last_percent:
+                    self.progress.emit(percent)
+                    last_percent = percent
+
+                if self._downloaded - last_commit >= self.journal_every:
+                    self._commit_segments(fd, journal, total_size)
+                    last_commit = self._downloaded
+
+            self._commit_segments(fd, journal, total_size)
+        finally:
+            os.close(fd)
+
+        if self._segment_error is not None:
+            raise self._segment_error
+        if not self._running:
+            return False
+        if journal["committed"] != total_size:
+            raise requests.exceptions.ConnectionError(
+                f"ได้ข้อมูลไม่ครบ ({journal['committed']}/{total_size} bytes)"
+            )
+        hasher.catch_up(total_size)
+        return True
+
+    def _segment_loop(self, session, fd: int, validator: str):
+        """ thread โหลดช่วง: ทำช่วงที่ยังไม่มีใครจับก่อน แล้วค่อยแบ่งงานจากช่วงที่ช้าที่สุด """
+        while self._running and self._segment_error is None:
+            segment = self._next_segment()
+            if segment is None:
+                return
+            try:
+                self._download_segment(session, fd, segment, validator)
+            except Exception as e:
+                with self._segment_lock:
+                    if self._segment_error is None:
+                        self._segment_error = e
+                return
+            finally:
+                segment.active = False
+
+    def _next_segment(self) -> Optional["_Segment"]:
+        with self._segment_lock:
+            for segment in self._segment_list:
+                if not segment.active and segment.pos < segment.end:
+                    segment.start_fetch()
+                    return segment
+
+            # ไม่มีช่วงว่างแล้ว → แบ่งครึ่งหลังของช่วงที่คาดว่าจะเสร็จช้าที่สุดมาทำเอง
+            now = time.monotonic()
+            victim = max(
+                (seg for seg in self._segment_list if seg.active and seg.end - seg.pos >= 2 * self.min_segment),
+                key=lambda seg: seg.eta(now),
+                default=None
+            )
+            if victim is None:
+                return None
+
+            middle = (victim.pos + victim.end) // 2
+            segment = _Segment(middle, victim.end)
+            victim.end = middle
+            self._segment_list.append(segment)
+            segment.start_fetch()
+            return segment
+
+    def _download_segment(self, session, fd: int, segment: "_Segment", validator: str):
+        with session.get(
+            self.url,
+            stream=True,
+            timeout=(10, 30),
+            verify=certifi.where(),
+            headers={"Range": f"bytes={segment.pos}-{segment.end - 1}", "If-Range": validator}
+        ) as response:
+            response.raise_for_status()
+            if response.status_code != 206 or _content_range_start(response.headers.get("Content-Range")) != segment.pos:
+                raise requests.exceptions.ConnectionError("เซิร์ฟเวอร์ไม่ส่งช่วงที่ขอ (ไฟล์อาจถูกเปลี่ยน) → เริ่มใหม่")
+
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                if not self._running or self._segment_error is not None:
+                    return
+
+                # จองตำแหน่งก่อนเขียน → ถ้าช่วงนี้ถูกแบ่งไประหว่างนั้น ตัดส่วนที่เกิน end ทิ้ง
+                with self._segment_lock:
+                    offset = segment.pos
+                    size = min(len(chunk), segment.end - offset)
+                    segment.pos += size
+                    self._downloaded += size
+
+                if size > 0:
+                    data = chunk if size == len(chunk) else chunk[:size]
+                    _pwrite(fd, memoryview(data), offset)
+                    # hash ก่อนขยับ done → catch_up ไม่ต้องอ่านส่วนนี้จากดิสก์ซ้ำ
+                    self._hasher.offer(offset, data)
+                    segment.done = offset + size
+                if segment.pos >= segment.end:
+                    return
+
+        # stream จบก่อนถึงปลายช่วงโดยไม่มี exception → ส่งเข้า retry / backoff ของ run()
+        # (ถ้าปล่อยให้ _segment_loop หยิบช่วงเดิมไปโหลดใหม่ทันที จะวนซ้ำไม่รู้จบ)
+        with self._segment_lock:
+            pos, end = segment.pos, segment.end
+        if pos < end and self._running and self._segment_error is None:
+            raise requests.exceptions.ConnectionError(f"ได้ข้อมูลช่วงไม่ครบ ({pos}/{end} bytes)")
+
+    def _written_prefix(self, total_size: int) -> int:
+        """ จำนวน byte จากต้นไฟล์ที่เขียนครบต่อเนื่องแล้ว (ตำแหน่งเขียนของช่วงแรกที่ยังไม่เสร็จ) """
+        with self._segment_lock:
+            return min((seg.done for seg in self._segment_list if seg.done < seg.end), default=total_size)
+
+    def _commit_segments(self, fd: int, journal: dict, total_size: int):
+        """ เก็บช่วงที่ยังขาด (จากตำแหน่งที่เขียนเสร็จจริง) → fsync → บันทึก journal """
+        with self._segment_lock:
+            ranges = [[seg.done, seg.end] for seg in self._segment_list if seg.done < seg.end]
+        os.fsync(fd)
+        journal["segments"] = ranges
+        journal["committed"] = total_size - sum(end - start for start, end in ranges)
+        self._write_journal(journal)
+
+    def _discard_partial(self):
+        self.journal_path.unlink(missing_ok=True)
+        self.part_path.unlink(missing_ok=True)
+
+    def _sleep(self, seconds: float):
+        """ รอแบบยกเลิกได้ """
+        deadline = time.monotonic() + seconds
+        while self._running and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+
+class _FileHasher:
+    """
+    SHA-256 ของไฟล์ที่กำลังโหลด (คำนวณตามลำดับ byte)
+
+    - update(chunk): ข้อมูลใหม่ที่ต่อท้ายพอดี → hash จากหน่วยความจำ ไม่ต้องอ่านดิสก์
+    - prefix > 0 (โหลดต่อ): อ่าน hash ส่วนที่อยู่บนดิสก์แล้วใน thread เบื้องหลัง
+      ระหว่างนั้น chunk ใหม่จะถูกพักไว้ แล้วต่อท้ายเมื่อ prefix เสร็จ
+    - read_to(limit): อ่าน hash จากดิสก์ต่อจนถึง limit
+
+    โหมดแบ่งช่วง (เรียกจากหลาย thread):
+    - offer(offset, chunk): chunk ที่ต่อพอดี → hash ทันที, มาก่อนลำดับ → พักไว้ (รวมไม่เกิน buffer_limit)
+      แล้ว hash ต่อเมื่อส่วนก่อนหน้ามาครบ, เกิน buffer_limit → ทิ้ง (catch_up อ่านจากดิสก์ให้)
+    - catch_up(limit): อ่านจากดิสก์เฉพาะส่วนก่อน limit ที่ยังไม่ได้ hash
+    """
+
+    def __init__(self, path: Path, prefix: int = 0, buffer_limit: int = 0):
+        self.path = path
+        self.position = 0
+        self.buffer_limit = buffer_limit
+        self._hash = hashlib.sha256()
+        self._lock = threading.Lock()
+        self._pending: list[bytes] = []
+        self._early: dict[int, bytes] = {}
+        self._early_size = 0
+        self._error: Optional[OSError] = None
+        self._prefix_thread = None
+
+        if prefix:
+            self._prefix_thread = threading.Thread(target=self._hash_prefix, args=(prefix,), daemon=True)
+            self._prefix_thread.start()
+
+    def update(self, chunk: bytes):
+        with self._lock:
+            if self._prefix_thread is not None:
+                self._pending.append(chunk)
+                return
+        self._hash.update(chunk)
+        self.position += len(chunk)
+
+    def read_to(self, limit: int, budget: Optional[int] = None):
+        """ hash จากดิสก์ตั้งแต่ position ถึง limit (budget = อ่านได้ไม่เกินกี่ byte ในครั้งนี้) """
+        if budget is not None:
+            limit = min(limit, self.position + budget)
+        if limit <= self.position:
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(self.position)
+            while self.position < limit:
+                data = f.read(min(1024 * 1024, limit - self.position))
+                if not data:
+                    raise OSError(f"ไฟล์สั้นกว่าที่คาด: {self.path}")
+                self._hash.update(data)
+                self.position += len(data)
+
+    def offer(self, offset: int, chunk: bytes):
+        with self._lock:
+            if offset > self.position:
+                if self._early_size + len(chunk) <= self.buffer_limit:
+                    self._early[offset] = chunk
+                    self._early_size += len(chunk)
+                return
+            self._consume(offset, chunk)
+            self._drain_early()
+
+    def catch_up(self, limit: int, budget: Optional[int] = None):
+        with self._lock:
+            self.read_to(limit, budget)
+            self._drain_early()
+
+    def _consume(self, offset: int, chunk: bytes):
+        """ hash ส่วนของ chunk ที่เลย position (ส่วนที่ hash ไปแล้วข้าม) """
+        skip = self.position - offset
+        if skip < len(chunk):
+            self._hash.update(memoryview(chunk)[skip:] if skip else chunk)
+            self.position = offset + len(chunk)
+
+    def _drain_early(self):
+        """ hash chunk ที่พักไว้ซึ่งต่อกับ position แล้ว + ทิ้งตัวที่ถูกอ่านจากดิสก์ไปแล้ว """
+        early = self._early
+        while early:
+            offset = min(early)
+            if offset > self.position:
+                return
+            chunk = early.pop(offset)
+            self._early_size -= len(chunk)
+            self._consume(offset, chunk)
+
+    def hexdigest(self) -> str:
+        """ รอ prefix (ถ้ายังไม่เสร็จ) แล้วคืน sha256 """
+        thread = self._prefix_thread
+        if thread is not None:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._hash.hexdigest()
+
+    def _hash_prefix(self, size: int):
+        try:
+            self.read_to(size)
+        except OSError as e:
+            self._error = e
+
+        with self._lock:
+            for chunk in self._pending:
+                self._hash.update(chunk)
+                self.position += len(chunk)
+            self._pending.clear()
+            self._prefix_thread = None
+
+
+class _Segment:
+    """ ช่วง byte ที่ต้องโหลด: done = เขียนลงไฟล์แล้ว, pos = จองไปแล้ว, end ถูกย่อเมื่อถูกแบ่งงาน """
+    __slots__ = ("done", "pos", "end", "active", "started", "started_pos")
+
+    def __init__(self, start: int, end: int):
+        self.done = start
+        self.pos = start
+        self.end = end
+        self.active = False
+        self.started = 0.0
+        self.started_pos = start
+
+    def start_fetch(self):
+        self.active = True
+        self.started = time.monotonic()
+        self.started_pos = self.pos
+
+    def eta(self, now: float) -> float:
+        """ เวลาที่คาดว่าจะเหลือ (ยังไม่มีข้อมูลความเร็ว → ใช้จำนวน byte ที่เหลือแทน) """
+        remaining = self.end - self.pos
+        fetched = self.pos - self.started_pos
+        if fetched <= 0:
+            return float(remaining)
+        return remaining * (now - self.started) / fetched
+
+
+def _pwrite(fd: int, data: memoryview, offset: int):
+    """ เขียนลงตำแหน่ง offset โดยไม่ย้าย file pointer (เขียนพร้อมกันหลาย thread ได้) """
+    while data:
+        written = os.pwrite(fd, data, offset)
+        data = data[written:]
+        offset += written
+
+
+if not hasattr(os, "pwrite"):
+    # Windows ไม่มี os.pwrite → seek + write ภายใต้ lock เดียวกัน
+    _pwrite_lock = threading.Lock()
+
+    def _pwrite(fd: int, data: memoryview, offset: int):
+        with _pwrite_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            while data:
+                data = data[os.write(fd, data):]
+
+
+def _content_range_total(value: Optional[str]) -> Optional[int]:
+    """ "bytes 0-0/1234" → 1234 ("*" = ไม่ทราบ → None) """
+    try:
+        return int(value.rsplit("/", 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _content_range_start(value: Optional[str]) -> Optional[int]:
+    """ "bytes 100-199/200" → 100 """
+    try:
+        unit, _, spec = value.partition(" ")
+        return int(spec.split("-", 1)[0]) if unit == "bytes" else None
+    except (AttributeError, ValueError):
+        return None
+
+
+def _strong_etag(value: Optional[str]) -> Optional[str]:
+    """ If-Range ใช้ได้เฉพาะ strong ETag (weak "W/..." → ใช้ Last-Modified แทน) """
+    if not value or value.startswith("W/"):
+        return None
+    return value
+
 
 class Downloader:
     """
@@ -124,18 +688,19 @@ class Downloader:
         url: str,
         save_path: str,
         on_progress: Callable[[int], None],
-        on_finished: Callable[[str], None],
+        on_finished: Callable[[str, str], None],
         on_error: Callable[[str], None],
-        on_canceled: Optional[Callable[[], None]] = None
+        on_canceled: Optional[Callable[[], None]] = None,
+        segments: int = 1
     ):
         """
-        เริ่มดาวน์โหลดไฟล์
+        เริ่มดาวน์โหลดไฟล์ (segments > 1 = โหลดหลาย connection พร้อมกัน)
         """
         if self.thread and self.thread.isRunning():
             return  # ยังมีงานเก่าอยู่ ห้ามเริ่มใหม่ซ้ำ
 
         self.thread = QThread()
-        self.worker = DownloadWorker(url, save_path)
+        self.worker = DownloadWorker(url, save_path, segments=segments)
 
         # ย้าย worker ไปทำงานใน thread แยก
         self.worker.moveToThread(self.thread)
@@ -191,8 +756,8 @@ downloader = Downloader()
 def on_progress(percent):
     print(f"ดาวน์โหลด {percent}%")
 
-def on_done(path):
-    print(f"ดาวน์โหลดสำเร็จ → {path}")
+def on_done(path, sha256):
+    print(f"ดาวน์โหลดสำเร็จ → {path} (sha256 {sha256})")
 
 def on_error(msg):
     print(f"เกิดข้อผิดพลาด: {msg}")
@@ -205,6 +770,6 @@ downloader.start_download(
     on_error=on_error
 )
 
-# ระหว่างดาวน์โหลด เรียกยกเลิกได้
+# ระหว่างดาวน์โหลด เรียกยกเลิกได้ (เรียก start_download ด้วย url / path เดิมอีกครั้ง = โหลดต่อจากเดิม)
 # downloader.cancel()
 """
\ No newline at end of file
@@ -0,0 +1,224 @@
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, Optional, Sequence
+
+
+# ────────────────────────────────────────────────
+#           โครงสร้างไฟล์ ring buffer
+# ────────────────────────────────────────────────
+# header : magic(4) + version(uint32) + capacity(uint32) + written(uint64)
+# record : timestamp(double) + players(uint16) + max_players(uint16) + rtt_ms(float32, NaN = ไม่ทราบ)
+
+_HEADER = struct.Struct("<4sIIQ")
+_RECORD = struct.Struct("<dHHf")
+_MAGIC = b"SPH1"
+_VERSION = 1
+
+
+class HistoryRecorder:
+    """
+    บันทึกประวัติจำนวนผู้เล่นลงไฟล์ขนาดคงที่แบบ ring buffer (memory-mapped)
+
+    - ไฟล์ไม่โตขึ้นเรื่อย ๆ: เมื่อเต็มจะเขียนทับรายการเก่าสุด
+    - การอ่านเป็น generator อ่านจาก mmap ทีละรายการ (ใช้หน่วยความจำคงที่)
+    - ขนาดกำหนดตามเวลา: เก็บ days วัน โดยบันทึกไม่เกิน 1 รายการต่อ interval วินาที
+      (append ที่ถี่กว่านั้นถูกข้าม เช่น poller ที่ poll ทุก 5 วินาทีตอน focus)
+      ค่าเริ่มต้น 30 วัน × ทุก 30 วินาที = 86,400 รายการ (≈ 1.4 MB)
+    """
+
+    def __init__(self, path: str | Path, days: float = 30, interval: float = 30.0):
+        self.path = Path(path)
+        self.interval = interval
+        self._lock = threading.Lock()
+
+        capacity = max(1, int(days * 24 * 60 * 60 / interval))
+
+        size = _HEADER.size + capacity * _RECORD.size
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+        try:
+            current = os.fstat(fd).st_size
+            if current < _HEADER.size:
+                os.ftruncate(fd, size)
+                self._mm = mmap.mmap(fd, size)
+                _HEADER.pack_into(self._mm, 0, _MAGIC, _VERSION, capacity, 0)
+            else:
+                self._mm = mmap.mmap(fd, current)
+                magic, version, stored_capacity, _ = _HEADER.unpack_from(self._mm, 0)
+                if magic != _MAGIC or version != _VERSION or current != _HEADER.size + stored_capacity * _RECORD.size:
+                    # ไฟล์เสียหรือคนละรูปแบบ → เริ่มใหม่
+                    self._mm.close()
+                    os.ftruncate(fd, size)
+                    self._mm = mmap.mmap(fd, size)
+                    _HEADER.pack_into(self._mm, 0, _MAGIC, _VERSION, capacity, 0)
+                else:
+                    capacity = stored_capacity
+        finally:
+            os.close(fd)  # mmap ถือ handle ของตัวเองแล้ว
+
+        self.capacity = capacity
+
+    @property
+    def written(self) -> int:
+        """ จำนวนรายการที่เคยเขียนทั้งหมด (รวมที่ถูกเขียนทับไปแล้ว) """
+        return _HEADER.unpack_from(self._mm, 0)[3]
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+    def due(self, timestamp: Optional[float] = None) -> bool:
+        """ ถึงเวลาบันทึกรายการถัดไปแล้วหรือยัง (ห่างจากรายการล่าสุดครบ interval วินาที) """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            return self._due(self.written, timestamp)
+
+    def _due(self, written: int, timestamp: float) -> bool:
+        """ (ต้องถือ self._lock) """
+        if not written:
+            return True
+        offset = _HEADER.size + ((written - 1) % self.capacity) * _RECORD.size
+        # นาฬิกาถูกปรับย้อนหลัง (timestamp < รายการล่าสุด) → บันทึกตามปกติ
+        return not 0 <= timestamp - _RECORD.unpack_from(self._mm, offset)[0] < self.interval
+
+    def append(self, players: int, max_players: int, rtt_ms: Optional[float] = None,
+               timestamp: Optional[float] = None) -> bool:
+        """
+        เพิ่มรายการใหม่ 1 รายการ (เขียนทับรายการเก่าสุดเมื่อเต็ม)
+        คืน False ถ้าข้ามเพราะห่างจากรายการล่าสุดไม่ถึง interval วินาที
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        rtt = math.nan if rtt_ms is None else rtt_ms
+
+        with self._lock:
+            written = self.written
+            if not self._due(written, timestamp):
+                return False
+            offset = _HEADER.size + (written % self.capacity) * _RECORD.size
+            _RECORD.pack_into(self._mm, offset, timestamp, players, max_players, rtt)
+            # อัปเดตตัวนับหลังเขียนข้อมูลเสร็จ → ผู้อ่านไม่เห็นรายการที่เขียนไม่ครบ
+            _HEADER.pack_into(self._mm, 0, _MAGIC, _VERSION, self.capacity, written + 1)
+        return True
+
+    def record(self, index: int) -> tuple[float, int, int, Optional[float]]:
+        """ อ่านรายการที่ index (0 = เก่าสุด) → (timestamp, players, max_players, rtt_ms) """
+        written = self.written
+        count = min(written, self.capacity)
+        if not 0 <= index < count:
+            raise IndexError(index)
+
+        start = written - count
+        offset = _HEADER.size + ((start + index) % self.capacity) * _RECORD.size
+        timestamp, players, max_players, rtt = _RECORD.unpack_from(self._mm, offset)
+        return timestamp, players, max_players, None if math.isnan(rtt) else rtt
+
+    def __iter__(self) -> Iterator[tuple[float, int, int, Optional[float]]]:
+        """ อ่านทุกรายการจากเก่าไปใหม่ (generator, ไม่โหลดทั้งไฟล์) """
+        for index in range(len(self)):
+            yield self.record(index)
+
+    def first_index_since(self, timestamp: float) -> int:
+        """ index แรกที่ timestamp >= ค่าที่ระบุ (binary search เพราะเรียงตามเวลาอยู่แล้ว) """
+        low, high = 0, len(self)
+        while low < high:
+            mid = (low + high) // 2
+            if self.record(mid)[0] < timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def series(self, since: Optional[float] = None, field: int = 1) -> "SeriesView":
+        """ มุมมอง (timestamp, ค่า) แบบเข้าถึงด้วย index ตั้งแต่เวลา since (field 1=players, 3=rtt) """
+        start = self.first_index_since(since) if since is not None else 0
+        return SeriesView(self, start, len(self), field)
+
+    def downsample(self, threshold: int = 300, since: Optional[float] = None, field: int = 1) -> list[tuple[float, float]]:
+        """ ลดจำนวนจุดสำหรับวาดกราฟ (LTTB) """
+        return lttb(self.series(since, field), threshold)
+
+    def close(self):
+        with self._lock:
+            self._mm.flush()
+            self._mm.close()
+
+
+class SeriesView:
+    """ Sequence ของ (timestamp, ค่า) ที่อ่านจาก mmap ตอนเข้าถึง (ไม่ copy ข้อมูล) """
+
+    def __init__(self, recorder: HistoryRecorder, start: int, end: int, field: int):
+        self.recorder = recorder
+        self.start = start
+        self.end = end
+        self.field = field
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __getitem__(self, index: int) -> tuple[float, float]:
+        if index < 0:
+            index += len(self)
+        record = self.recorder.record(self.start + index)
+        value = record[self.field]
+        return record[0], (math.nan if value is None else float(value))
+
+
+def lttb(points: Sequence[tuple[float, float]], threshold: int) -> list[tuple[float, float]]:
+    """
+    Largest-Triangle-Three-Buckets: ลดจำนวนจุดของกราฟโดยยังคงรูปทรงยอด/ร่องไว้
+
+    points ต้องรองรับ len() และ index (list หรือ SeriesView)
+    แต่ละจุดถูกอ่านไม่เกิน 2 ครั้ง และใช้หน่วยความจำเท่ากับผลลัพธ์เท่านั้น
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return [points[i] for i in range(n)]
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a_x, a_y = points[0]
+
+    for i in range(threshold - 2):
+        # ค่าเฉลี่ยของ bucket ถัดไป (จุด C)
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        avg_x = avg_y = 0.0
+        for j in range(next_start, next_end):
+            x, y = points[j]
+            avg_x += x
+            avg_y += y
+        count = next_end - next_start
+        avg_x /= count
+        avg_y /= count
+
+        # เลือกจุดใน bucket ปัจจุบันที่ทำสามเหลี่ยม A-B-C ได้พื้นที่มากที่สุด
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        best_area = -1.0
+        best = points[start]
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((a_x - avg_x) * (y - a_y) - (a_x - x) * (avg_y - a_y))
+            if area > best_area:
+                best_area = area
+                best = (x, y)
+
+        sampled.append(best)
+        a_x, a_y = best
+
+    sampled.append(points[n - 1])
+    return sampled
+
+
+# ตัวอย่างการใช้งาน
+if __name__ == "__main__":
+    recorder = HistoryRecorder("player_history.dat", days=1, interval=60)
+    recorder.append(12, 100, rtt_ms=45.2)
+    print(len(recorder), list(recorder)[-1])
+    print(recorder.downsample(threshold=50))
+    recorder.close()
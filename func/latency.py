@@ -0,0 +1,49 @@
+from PyQt6.QtCore import QThread, pyqtSignal
+from . import check_server
+
+
+class LatencyThread(QThread):
+    """
+    Thread สำหรับวัด ping จริง (opcode 'p') โดยไม่ทำให้ UI ค้าง
+    วัดทั้งเส้นทางผ่าน proxy (fake_server) และเส้นทางตรงไปยังเซิร์ฟเวอร์จริง
+    เพื่อให้ผู้เล่นเปรียบเทียบได้ว่า proxy เพิ่ม latency เท่าไร
+    """
+    # สัญญาณ: (ผลวัดผ่าน proxy, ผลวัดแบบตรง) → dict จาก check_server.latency_stats()
+    measured = pyqtSignal(dict, dict)
+
+    def __init__(
+        self,
+        proxy_addr: tuple[str, int],
+        direct_addr: tuple[str, int],
+        count: int = 10,
+        interval: float = 0.05,
+        timeout: float = 1.0
+    ):
+        super().__init__()
+        self.proxy_addr = proxy_addr
+        self.direct_addr = direct_addr
+        self.count = count
+        self.interval = interval
+        self.timeout = timeout
+
+    def run(self):
+        """
+        ทำงานใน thread แยก → วัดทีละเส้นทาง (ไม่วัดพร้อมกันเพื่อไม่ให้ผลรบกวนกัน)
+        """
+        proxy = check_server.measure_latency(
+            self.proxy_addr[0], int(self.proxy_addr[1]),
+            self.count, self.interval, self.timeout
+        )
+        direct = check_server.measure_latency(
+            self.direct_addr[0], int(self.direct_addr[1]),
+            self.count, self.interval, self.timeout
+        )
+        self.measured.emit(proxy, direct)
+
+
+# ตัวอย่างการใช้งาน (comment เท่านั้น)
+"""
+probe = LatencyThread(("127.0.0.1", 7777), ("168.222.20.137", 7777))
+probe.measured.connect(lambda proxy, direct: print(proxy["avg"], direct["avg"]))
+probe.start()
+"""
@@ -0,0 +1,153 @@
+import threading
+from typing import Optional
+from PyQt6.QtCore import QThread, pyqtSignal
+from . import check_server
+from .query_cache import get_cache
+from .history import HistoryRecorder
+
+
+class StatusPoller(QThread):
+    """
+    Thread สำหรับ query สถานะเซิร์ฟเวอร์ซ้ำเป็นระยะ (ไม่ทำงานบน GUI thread)
+
+    - หน้าต่าง focus อยู่   → poll ถี่ (focused_interval)
+    - หน้าต่างไม่ได้ focus  → poll ปกติ (background_interval)
+    - หน้าต่างถูกย่อ        → poll ช้า (minimized_interval)
+    - เซิร์ฟเวอร์ออฟไลน์     → เพิ่มระยะห่างเป็นเท่าตัว (สูงสุด max_backoff)
+
+    ส่งสัญญาณเฉพาะฟิลด์ที่เปลี่ยนจากรอบก่อน → GUI thread แทบไม่มีงานเพิ่ม
+
+    ถ้าระบุ recorder จะบันทึกผลลงประวัติไม่เกิน 1 รายการต่อ recorder.interval วินาที
+    และคำนวณกราฟย่อ (LTTB) ใน thread นี้ แล้วส่งให้ GUI ทุก history_every รายการที่บันทึก
+    """
+    # สัญญาณ: dict เฉพาะฟิลด์ที่เปลี่ยน เช่น {"players": 12}
+    changed = pyqtSignal(dict)
+    # สัญญาณ: list ของ (timestamp, players) ที่ลดจำนวนจุดแล้ว
+    history = pyqtSignal(list)
+
+    MODES = ("focused", "background", "minimized")
+    # ฟิลด์ที่ UI แสดงผล (ฟิลด์อื่นเช่น loss เปลี่ยนทุกรอบ ไม่ต้องส่งให้ GUI)
+    FIELDS = ("online", "passworded", "players", "max_players", "hostname")
+
+    def __init__(
+        self,
+        ip: str,
+        port: int,
+        last: Optional[check_server.ServerInfo] = None,
+        focused_interval: float = 5.0,
+        background_interval: float = 15.0,
+        minimized_interval: float = 60.0,
+        max_backoff: float = 120.0,
+        timeout: float = 1.5,
+        recorder: Optional[HistoryRecorder] = None,
+        history_points: int = 300,
+        history_every: int = 2
+    ):
+        super().__init__()
+        self.ip = ip
+        self.port = int(port)
+        self.last = last._asdict() if last else {}
+        self.intervals = {
+            "focused": focused_interval,
+            "background": background_interval,
+            "minimized": minimized_interval,
+        }
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.recorder = recorder
+        self.history_points = history_points
+        self.history_every = history_every
+
+        self.mode = "focused"
+        self._failures = 0
+        self._wake = threading.Event()
+        self._running = True
+
+    def set_mode(self, mode: str):
+        """ เปลี่ยนโหมดตามสถานะหน้าต่าง (เรียกจาก GUI thread ได้) """
+        if mode not in self.MODES or mode == self.mode:
+            return
+        faster = self.intervals[mode] < self.intervals[self.mode]
+        self.mode = mode
+        if faster:
+            self._wake.set()  # กลับมา focus → poll ทันทีไม่ต้องรอรอบเดิม
+
+    def poll_now(self):
+        """ บังคับ poll รอบถัดไปทันที """
+        self._wake.set()
+
+    def stop(self):
+        """ หยุด thread (คืนค่าทันที ใช้ wait() ถ้าต้องการรอให้จบ) """
+        self._running = False
+        self._wake.set()
+
+    def next_interval(self) -> float:
+        """ ระยะเวลาก่อน poll รอบถัดไป (ออฟไลน์ติดกัน → backoff แบบ exponential) """
+        interval = self.intervals[self.mode]
+        if self._failures:
+            interval = min(interval * (2 ** self._failures), max(self.max_backoff, interval))
+        return interval
+
+    def run(self):
+        """
+        ทำงานใน thread แยก → poll, เทียบกับรอบก่อน, ส่งเฉพาะส่วนที่เปลี่ยน
+        """
+        recorded = 0
+        self._emit_history()
+
+        while self._running:
+            self._wake.wait(self.next_interval())
+            self._wake.clear()
+            if not self._running:
+                break
+
+            result = check_server.query_server(self.ip, self.port, self.timeout)
+            # เก็บผลลง cache กลาง ให้ส่วนอื่นของ launcher ใช้ค่าล่าสุดได้โดยไม่ query ซ้ำ
+            get_cache().put(self.ip, self.port, b"i", result)
+
+            self._failures = 0 if result.online else min(self._failures + 1, 16)
+
+            diff = {k: getattr(result, k) for k in self.FIELDS if self.last.get(k) != getattr(result, k)}
+            if diff:
+                self.last.update(diff)
+                self.changed.emit(diff)
+
+            # poll ถี่กว่า interval ของประวัติ (เช่นตอน focus) → ไม่ต้องบันทึกและไม่ต้อง ping
+            if self.recorder is not None and self.recorder.due():
+                rtt_ms = self._probe_rtt() if result.online else None
+                if self.recorder.append(result.players, result.max_players, rtt_ms):
+                    recorded += 1
+                    if recorded % self.history_every == 0:
+                        self._emit_history()
+
+    def _probe_rtt(self) -> Optional[float]:
+        """
+        RTT (ms) จาก ping 'p' 1 ครั้ง (None = ping หาย)
+
+        ไม่ใช้เวลาของ query 'i' เพราะรวม backoff ตอนส่งซ้ำ และถ้าผ่าน proxy จะเป็นคำตอบจาก cache
+        ('p' ถูกส่งต่อถึงเซิร์ฟเวอร์จริงเสมอ)
+        """
+        return check_server.measure_latency(self.ip, self.port, count=1, timeout=self.timeout)["min"]
+
+    def _emit_history(self):
+        if self.recorder is None:
+            return
+        try:
+            self.history.emit(self.recorder.downsample(self.history_points))
+        except Exception as e:
+            print(f"อ่านประวัติผู้เล่นไม่สำเร็จ: {e}")
+
+
+# ตัวอย่างการใช้งาน (comment เท่านั้น)
+"""
+poller = StatusPoller("127.0.0.1", 7777, last=resp)
+poller.changed.connect(lambda diff: print("เปลี่ยน:", diff))
+poller.start()
+
+# เมื่อย่อหน้าต่าง
+poller.set_mode("minimized")
+
+# ตอนปิดโปรแกรม
+poller.stop()
+poller.wait(2000)
+"""
@@ -0,0 +1,194 @@
+import threading
+import time
+from typing import Callable, Optional
+from . import check_server
+
+
+def _default_fetch(ip: str, port: int, opcode: bytes, timeout: float):
+    """ query จริงผ่าน UDP (opcode 'i' ใช้ query_server, opcode อื่นใช้ query_server_multi) """
+    if opcode == b"i":
+        return check_server.query_server(ip, port, timeout)
+    return check_server.query_server_multi(ip, port, opcode, timeout)[opcode.decode()]
+
+
+def _is_offline(value) -> bool:
+    """ ผลที่บอกว่าเซิร์ฟเวอร์ไม่ตอบ (ServerInfo.online = False) """
+    return getattr(value, "online", True) is False
+
+
+class _Entry:
+    """ ค่าที่ cache ไว้ + เวลาที่ดึงมา (monotonic) + เป็นผลออฟไลน์หรือไม่ """
+    __slots__ = ("value", "fetched_at", "offline")
+
+    def __init__(self, value, fetched_at: float):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.offline = _is_offline(value)
+
+
+class _Flight:
+    """ request ที่กำลังวิ่งอยู่ ผู้เรียกคนอื่นรอ event เดียวกันแทนการยิงซ้ำ """
+    __slots__ = ("done", "value")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+class QueryCache:
+    """
+    Cache ผล query เซิร์ฟเวอร์ SA-MP แบบ TTL + stale-while-revalidate
+    key คือ (ip, port, opcode)
+
+    - อายุ < ttl                 → คืนค่าทันที (fresh)
+    - ttl <= อายุ < ttl + stale  → คืนค่าเก่าทันที แล้ว refresh เบื้องหลัง
+    - เก่ากว่านั้น / ไม่มีค่า     → query ใหม่
+      (block=False จะคืนค่าเดิมที่มี หรือ None แล้ว query เบื้องหลังแทน)
+    - ผลออฟไลน์ (online=False) ใช้ได้แค่ offline_ttl และไม่มีช่วง stale
+      → เซิร์ฟเวอร์กลับมาออนไลน์แล้วจะเห็นในรอบถัดไป ไม่ค้างค่าออฟไลน์ไว้ทั้ง ttl
+
+    ผู้เรียกพร้อมกันหลายคนสำหรับ key เดียวกันจะถูกรวมเป็น request เดียว
+    """
+
+    def __init__(
+        self,
+        ttl: float = 5.0,
+        stale_ttl: float = 30.0,
+        timeout: float = 1.5,
+        fetcher: Optional[Callable] = None,
+        offline_ttl: float = 1.0
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.offline_ttl = offline_ttl
+        self.timeout = timeout
+        self.fetcher = fetcher or _default_fetch
+
+        self._lock = threading.Lock()
+        self._entries: dict[tuple, _Entry] = {}
+        self._flights: dict[tuple, _Flight] = {}
+
+    def get(self, ip: str, port: int, opcode: bytes = b"i", block: bool = True):
+        """
+        ดึงผล query จาก cache
+
+        Parameters:
+            ip     : str    - ที่อยู่ IP ของเซิร์ฟเวอร์
+            port   : int    - พอร์ต
+            opcode : bytes  - opcode ที่ต้องการ
+            block  : bool   - False = ห้ามรอ network (เหมาะกับ UI loop)
+                              คืนค่าที่มีอยู่ (หรือ None) แล้ว query เบื้องหลังแทน
+        """
+        key = (ip, int(port), opcode)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.fetched_at
+                if entry.offline:
+                    if age < self.offline_ttl:
+                        return entry.value
+                elif age < self.ttl:
+                    return entry.value
+                elif age < self.ttl + self.stale_ttl:
+                    self._start_flight(key, background=True)
+                    return entry.value
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._start_flight(key, background=not block)
+
+        if not block:
+            return entry.value if entry is not None else None
+
+        if leader:
+            self._run_flight(key, flight)
+        else:
+            flight.done.wait()
+        return flight.value
+
+    def peek(self, ip: str, port: int, opcode: bytes = b"i"):
+        """ คืนค่าใน cache (ไม่สนอายุ) โดยไม่แตะ network """
+        with self._lock:
+            entry = self._entries.get((ip, int(port), opcode))
+            return entry.value if entry is not None else None
+
+    def put(self, ip: str, port: int, opcode: bytes, value):
+        """ บันทึกค่าที่ query มาเอง (เช่นจาก poller) ลง cache (ผลออฟไลน์มีอายุแค่ offline_ttl) """
+        with self._lock:
+            self._entries[(ip, int(port), opcode)] = _Entry(value, time.monotonic())
+
+    def invalidate(self, ip: Optional[str] = None, port: Optional[int] = None):
+        """ ลบค่าใน cache (ไม่ระบุ ip = ลบทั้งหมด) """
+        with self._lock:
+            if ip is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] == ip and (port is None or k[1] == int(port))]:
+                del self._entries[key]
+
+    # -------------------------------------------------------------------------
+
+    def _start_flight(self, key: tuple, background: bool) -> _Flight:
+        """ ต้องเรียกขณะถือ self._lock อยู่ """
+        flight = self._flights.get(key)
+        if flight is not None:
+            return flight  # มี request วิ่งอยู่แล้ว ไม่ยิงซ้ำ
+
+        flight = _Flight()
+        self._flights[key] = flight
+        if background:
+            threading.Thread(target=self._run_flight, args=(key, flight), daemon=True).start()
+        return flight
+
+    def _run_flight(self, key: tuple, flight: _Flight):
+        ip, port, opcode = key
+        try:
+            value = self.fetcher(ip, port, opcode, self.timeout)
+        except Exception as e:
+            print(f"query {ip}:{port} ({opcode!r}) ล้มเหลว: {e}")
+            value = None
+
+        with self._lock:
+            if value is not None:
+                self._entries[key] = _Entry(value, time.monotonic())
+            else:
+                # ไม่มีค่าใหม่ → ใช้ค่าเดิม (ถ้ามี) ให้ผู้ที่รออยู่
+                entry = self._entries.get(key)
+                value = entry.value if entry is not None else None
+            del self._flights[key]
+
+        flight.value = value
+        flight.done.set()
+
+
+# cache กลางของทั้ง process
+_cache = QueryCache()
+
+
+def configure(ttl: float = 5.0, stale_ttl: float = 30.0, timeout: float = 1.5, offline_ttl: float = 1.0):
+    """ ปรับค่า TTL / stale window / timeout / TTL ของผลออฟไลน์ ของ cache กลาง """
+    _cache.ttl = ttl
+    _cache.stale_ttl = stale_ttl
+    _cache.timeout = timeout
+    _cache.offline_ttl = offline_ttl
+
+
+def get_cache() -> QueryCache:
+    """ คืน cache กลางของทั้ง process """
+    return _cache
+
+
+def cached_query(ip: str, port: int, opcode: bytes = b"i", block: bool = True):
+    """ query ผ่าน cache กลาง (ดู QueryCache.get) """
+    return _cache.get(ip, port, opcode, block)
+
+
+# ตัวอย่างการใช้งาน
+if __name__ == "__main__":
+    configure(ttl=2.0, stale_ttl=10.0)
+    print(cached_query("127.0.0.1", 7777))                # query จริง
+    print(cached_query("127.0.0.1", 7777))                # จาก cache ทันที
+    print(cached_query("127.0.0.1", 7777, b"r", block=False))  # None + query เบื้องหลัง
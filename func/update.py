@@ -0,0 +1,546 @@
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import Callable, Iterable, Iterator, Optional
+from urllib.parse import quote, urljoin
+
+import certifi
+import requests
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from .request import get_config
+
+
+# ไฟล์ index ของเครื่องผู้เล่น (เก็บไว้ในโฟลเดอร์เกม)
+INDEX_NAME = ".launcher_index.json"
+
+
+class ManifestEntry:
+    """
+    ไฟล์หนึ่งตัวใน manifest
+
+    ดึงได้ 3 แบบ:
+    - url ของไฟล์ตรง ๆ
+    - ช่วง byte ใน archive (offset, length) → member แบบ stored หรือ deflate (raw) ใน zip เดิม
+    - member ของ zip ระยะไกล (local_header=True): ช่วงเริ่มที่ local file header
+      ข้อมูลจริงยาว compressed byte ถัดจาก header
+
+    ตรวจความถูกต้องด้วย sha256 (manifest) หรือ crc32 (central directory ของ zip)
+    """
+    __slots__ = ("path", "size", "sha256", "url", "offset", "length", "deflate", "crc32", "local_header", "compressed")
+
+    def __init__(self, path: str, size: int, sha256: Optional[str], url: str,
+                 offset: Optional[int] = None, length: Optional[int] = None, deflate: bool = False,
+                 crc32: Optional[int] = None, local_header: bool = False, compressed: Optional[int] = None):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256.lower() if sha256 else None
+        self.url = url
+        self.offset = offset
+        self.length = length
+        self.deflate = deflate
+        self.crc32 = crc32
+        self.local_header = local_header
+        self.compressed = compressed
+
+    def matches(self, digest: dict) -> bool:
+        """ เทียบกับ digest ของไฟล์ในเครื่อง ({"sha256", "crc32"}) """
+        if self.sha256:
+            return digest["sha256"] == self.sha256
+        return digest["crc32"] == self.crc32
+
+    @property
+    def transfer_size(self) -> int:
+        """ จำนวน byte ที่ต้องโหลดจริง """
+        return self.length if self.length is not None else self.size
+
+
+def _safe_relpath(path: str) -> str:
+    """ path ใน manifest ต้องเป็น path ย่อยของโฟลเดอร์เกม (ห้าม absolute / ..) """
+    parts = PurePosixPath(path.replace("\\", "/")).parts
+    if not parts or parts[0] == "/" or ".." in parts or ":" in parts[0]:
+        raise ValueError(f"path ใน manifest ไม่ปลอดภัย: {path}")
+    return "/".join(parts)
+
+
+def load_manifest(spec: dict | str, archive_url: Optional[str] = None) -> list[ManifestEntry]:
+    """
+    อ่าน manifest จาก launcher_setting.json ("game": {"manifest": ...})
+
+    spec เป็น dict หรือ URL ของไฟล์ JSON ที่มีรูปแบบเดียวกัน:
+        {
+            "base_url": "https://yourdomain.com/update/v1.3/",        (ไม่บังคับ)
+            "archive_url": "https://yourdomain.com/update/v1.3.zip",  (ไม่บังคับ, ค่าเริ่มต้น = download_url)
+            "files": [
+                {"path": "samp.dll", "size": 123, "sha256": "...", "url": "..."},
+                {"path": "models/gta3.img", "size": 456, "sha256": "...", "range": [1024, 400], "deflate": true}
+            ]
+        }
+    ไม่ระบุทั้ง url และ range → ใช้ base_url + path
+    """
+    if isinstance(spec, str):
+        url = spec
+        spec = get_config(url)
+        if spec is None:
+            raise ValueError(f"ดึง manifest ไม่สำเร็จ: {url}")
+
+    base_url = spec.get("base_url", "")
+    archive_url = spec.get("archive_url") or archive_url
+
+    entries = []
+    for item in spec["files"]:
+        path = _safe_relpath(item["path"])
+        offset = length = None
+
+        if item.get("range"):
+            offset, length = (int(v) for v in item["range"])
+            url = item.get("url") or archive_url
+        else:
+            url = item.get("url") or urljoin(base_url, quote(path))
+
+        if not url:
+            raise ValueError(f"ไม่รู้ว่าจะโหลด {path} จากที่ไหน (ไม่มี url / base_url / archive_url)")
+
+        entries.append(ManifestEntry(
+            path, int(item["size"]), item["sha256"], url, offset, length, bool(item.get("deflate"))
+        ))
+    return entries
+
+
+class InstallIndex:
+    """
+    index ของไฟล์ที่ติดตั้งแล้ว: path → {size, mtime_ns, sha256, crc32}
+
+    ไฟล์ที่ size + mtime ตรงกับที่บันทึกไว้ ถือว่า sha256 เดิม → ไม่ต้อง hash ใหม่ทุกครั้งที่เช็คอัปเดต
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self.path = self.root / INDEX_NAME
+        self._lock = threading.Lock()
+        try:
+            files = json.loads(self.path.read_text(encoding="utf-8"))["files"]
+            self.files: dict[str, dict] = {k: v for k, v in files.items() if isinstance(v, dict)}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            self.files = {}
+
+    def local_digest(self, relpath: str) -> Optional[dict]:
+        """ {"size", "mtime_ns", "sha256", "crc32"} ของไฟล์ในเครื่อง (None = ไม่มีไฟล์) hash ใหม่เฉพาะเมื่อไฟล์เปลี่ยน """
+        try:
+            stat = (self.root / relpath).stat()
+        except OSError:
+            return None
+
+        with self._lock:
+            cached = self.files.get(relpath)
+        if cached and cached.get("size") == stat.st_size and cached.get("mtime_ns") == stat.st_mtime_ns:
+            return cached
+
+        sha256, crc32 = _digest_file(self.root / relpath)
+        return self.record(relpath, sha256, crc32)
+
+    def record(self, relpath: str, sha256: str, crc32: int) -> dict:
+        stat = (self.root / relpath).stat()
+        digest = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256, "crc32": crc32}
+        with self._lock:
+            self.files[relpath] = digest
+        return digest
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({"files": self.files})
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(data, encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+def plan_update(index: InstallIndex, entries: Iterable[ManifestEntry]) -> list[ManifestEntry]:
+    """ คืนเฉพาะไฟล์ที่ไม่มีในเครื่อง หรือ size / sha256 (crc32) ไม่ตรงกับ manifest """
+    changed = []
+    for entry in entries:
+        local = index.local_digest(entry.path) if _size_matches(index.root / entry.path, entry.size) else None
+        if local is None or not entry.matches(local):
+            changed.append(entry)
+    return changed
+
+
+def _digest_file(path: Path, chunk: int = 1024 * 1024) -> tuple[str, int]:
+    """ sha256 + crc32 ของไฟล์ในการอ่านรอบเดียว """
+    sha256 = hashlib.sha256()
+    crc32 = 0
+    with path.open("rb") as f:
+        while True:
+            data = f.read(chunk)
+            if not data:
+                break
+            sha256.update(data)
+            crc32 = zlib.crc32(data, crc32)
+    return sha256.hexdigest(), crc32
+
+
+def _size_matches(path: Path, size: int) -> bool:
+    try:
+        return path.stat().st_size == size
+    except OSError:
+        return False
+
+
+def fetch_entry(
+    session: requests.Session,
+    root: Path,
+    entry: ManifestEntry,
+    on_bytes: Callable[[int], None],
+    should_stop: Callable[[], bool],
+    chunk_size: int = 64 * 1024
+) -> tuple[str, int]:
+    """
+    โหลดไฟล์หนึ่งตัวลง <path>.part → ตรวจ size + sha256 / crc32 → แทนที่ไฟล์เดิม
+    คืน (sha256, crc32) (raise ValueError ถ้าไม่ตรง manifest)
+    """
+    target = root / entry.path
+    part = target.with_name(target.name + ".part")
+    target.parent.mkdir(parents=True, exist_ok=True)
+
+    headers = {}
+    if entry.offset is not None:
+        headers["Range"] = f"bytes={entry.offset}-{entry.offset + entry.length - 1}"
+
+    digest = hashlib.sha256()
+    crc32 = 0
+    written = 0
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS) if entry.deflate else None
+
+    try:
+        with session.get(entry.url, stream=True, timeout=(10, 30), verify=certifi.where(), headers=headers) as response:
+            response.raise_for_status()
+            if entry.offset is not None and response.status_code != 206:
+                raise ValueError(f"เซิร์ฟเวอร์ไม่รองรับ Range สำหรับ {entry.path}")
+
+            stream = response.iter_content(chunk_size=chunk_size)
+            if entry.local_header:
+                # member ของ zip: ข้าม local file header แล้วอ่านเฉพาะข้อมูลของ member (ไม่เอา data descriptor)
+                stream = _limit(_skip_local_header(stream, entry.path), entry.compressed)
+
+            with open(part, "wb") as f:
+                for chunk in stream:
+                    if should_stop():
+                        raise InterruptedError("ยกเลิกการอัปเดต")
+                    if not chunk:
+                        continue
+                    on_bytes(len(chunk))
+                    data = inflater.decompress(chunk) if inflater else chunk
+                    f.write(data)
+                    digest.update(data)
+                    crc32 = zlib.crc32(data, crc32)
+                    written += len(data)
+
+                if inflater:
+                    data = inflater.flush()
+                    f.write(data)
+                    digest.update(data)
+                    crc32 = zlib.crc32(data, crc32)
+                    written += len(data)
+
+        sha256 = digest.hexdigest()
+        if written != entry.size or not entry.matches({"sha256": sha256, "crc32": crc32}):
+            raise ValueError(f"ไฟล์ {entry.path} ไม่ตรงกับ manifest (size {written}/{entry.size})")
+
+        os.replace(part, target)
+        return sha256, crc32
+
+    finally:
+        part.unlink(missing_ok=True)
+
+
+def _skip_local_header(stream: Iterable[bytes], name: str) -> Iterator[bytes]:
+    """ ตัด local file header (30 byte + ชื่อ + extra) ออกจากต้น stream """
+    buffer = b""
+    skip = None
+    for chunk in stream:
+        if skip is None:
+            buffer += chunk
+            if len(buffer) < _LOCAL_HEADER.size:
+                continue
+            signature, *_, name_length, extra_length = _LOCAL_HEADER.unpack_from(buffer)
+            if signature != b"PK\x03\x04":
+                raise ValueError(f"ไม่พบ local file header ของ {name}")
+            skip = _LOCAL_HEADER.size + name_length + extra_length
+            chunk, buffer = buffer, b""
+
+        if skip:
+            cut = min(skip, len(chunk))
+            chunk = chunk[cut:]
+            skip -= cut
+        if chunk:
+            yield chunk
+
+
+def _limit(stream: Iterable[bytes], size: int) -> Iterator[bytes]:
+    """ ส่งต่อไม่เกิน size byte แล้วหยุดอ่าน """
+    for chunk in stream:
+        if size <= 0:
+            return
+        if len(chunk) > size:
+            chunk = chunk[:size]
+        size -= len(chunk)
+        yield chunk
+
+
+# ────────────────────────────────────────────────
+#       อ่าน central directory ของ zip ระยะไกล
+# ────────────────────────────────────────────────
+_EOCD = struct.Struct("<4sHHHHIIH")
+_ZIP64_LOCATOR = struct.Struct("<4sIQI")
+_ZIP64_EOCD = struct.Struct("<4sQHHIIQQQQ")
+_CENTRAL_HEADER = struct.Struct("<4sHHHHHHIIIHHHHHII")
+_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+_EOCD_SEARCH = _EOCD.size + 0xFFFF      # EOCD + comment ยาวสุด
+
+
+class RemoteZip:
+    """
+    อ่านรายการไฟล์ของ zip บน HTTP server ผ่าน Range request (ไม่โหลดทั้งไฟล์)
+    ขอแค่ส่วนท้ายไฟล์ (EOCD) + central directory → ได้ชื่อ, CRC32, ขนาด, ตำแหน่งของทุก member
+    """
+
+    def __init__(self, url: str, session: Optional[requests.Session] = None):
+        self.url = url
+        self.session = session or requests.Session()
+
+    def _get_range(self, range_spec: str) -> tuple[bytes, int]:
+        """ ขอช่วง byte → (ข้อมูล, ขนาดไฟล์ทั้งหมด) """
+        response = self.session.get(self.url, timeout=(10, 30), verify=certifi.where(), headers={"Range": f"bytes={range_spec}"})
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise ValueError("เซิร์ฟเวอร์ไม่รองรับ Range → อ่าน zip ระยะไกลไม่ได้")
+        total = response.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+        return response.content, int(total)
+
+    def entries(self) -> list[ManifestEntry]:
+        """ member ทั้งหมด (ไม่รวมโฟลเดอร์) เป็น ManifestEntry ที่ชี้ไปยังช่วง byte ของแต่ละ member """
+        tail, total = self._get_range(f"-{_EOCD_SEARCH}")
+        tail_start = total - len(tail)
+
+        pos = tail.rfind(b"PK\x05\x06")
+        if pos < 0:
+            raise ValueError("ไม่พบ end of central directory (ไฟล์ไม่ใช่ zip?)")
+        _, _, _, _, count, cd_size, cd_offset, _ = _EOCD.unpack_from(tail, pos)
+
+        if count == 0xFFFF or cd_size == 0xFFFFFFFF or cd_offset == 0xFFFFFFFF:
+            # ZIP64: ตำแหน่งจริงอยู่ใน zip64 end of central directory
+            locator = tail[pos - _ZIP64_LOCATOR.size:pos]
+            signature, _, zip64_offset, _ = _ZIP64_LOCATOR.unpack(locator)
+            if signature != b"PK\x06\x07":
+                raise ValueError("zip64 locator เสียหาย")
+            record = self._slice(tail, tail_start, zip64_offset, _ZIP64_EOCD.size)
+            _, _, _, _, _, _, _, count, cd_size, cd_offset = _ZIP64_EOCD.unpack(record)
+
+        directory = self._slice(tail, tail_start, cd_offset, cd_size)
+        return self._parse_directory(directory, count, cd_offset)
+
+    def _slice(self, tail: bytes, tail_start: int, offset: int, size: int) -> bytes:
+        """ ใช้ข้อมูลจากส่วนท้ายที่โหลดมาแล้ว ถ้าไม่พอจึงขอ Range เพิ่ม """
+        if offset >= tail_start:
+            return tail[offset - tail_start:offset - tail_start + size]
+        return self._get_range(f"{offset}-{offset + size - 1}")[0]
+
+    def _parse_directory(self, directory: bytes, count: int, cd_offset: int) -> list[ManifestEntry]:
+        members = []
+        pos = 0
+        for _ in range(count):
+            (signature, _, _, flags, method, _, _, crc32, compressed, size,
+             name_length, extra_length, comment_length, _, _, _, header_offset) = _CENTRAL_HEADER.unpack_from(directory, pos)
+            if signature != b"PK\x01\x02":
+                raise ValueError("central directory เสียหาย")
+
+            start = pos + _CENTRAL_HEADER.size
+            raw_name = directory[start:start + name_length]
+            extra = directory[start + name_length:start + name_length + extra_length]
+            pos = start + name_length + extra_length + comment_length
+
+            name = raw_name.decode("utf-8" if flags & 0x800 else "cp437")
+            size, compressed, header_offset = _zip64_values(extra, size, compressed, header_offset)
+            members.append((header_offset, name, flags, method, crc32, compressed, size))
+
+        # member ถัดไป (หรือ central directory) = จุดสิ้นสุดของช่วงที่ต้องขอ
+        members.sort()
+        entries = []
+        for i, (header_offset, name, flags, method, crc32, compressed, size) in enumerate(members):
+            if name.endswith("/"):
+                continue
+            if flags & 0x1:
+                raise ValueError(f"ไม่รองรับ member ที่เข้ารหัส: {name}")
+            if method not in (0, 8):
+                raise ValueError(f"ไม่รองรับวิธีบีบอัด {method}: {name}")
+
+            end = members[i + 1][0] if i + 1 < len(members) else cd_offset
+            entries.append(ManifestEntry(
+                _safe_relpath(name), size, None, self.url,
+                offset=header_offset, length=end - header_offset, deflate=method == 8,
+                crc32=crc32, local_header=True, compressed=compressed
+            ))
+        return entries
+
+
+def _zip64_values(extra: bytes, size: int, compressed: int, offset: int) -> tuple[int, int, int]:
+    """ ค่าที่เป็น 0xFFFFFFFF ใน central header อยู่จริงใน zip64 extra field (id 0x0001) """
+    pos = 0
+    while pos + 4 <= len(extra):
+        tag, length = struct.unpack_from("<HH", extra, pos)
+        if tag == 0x0001:
+            values = iter(struct.unpack_from(f"<{length // 8}Q", extra, pos + 4))
+            if size == 0xFFFFFFFF:
+                size = next(values)
+            if compressed == 0xFFFFFFFF:
+                compressed = next(values)
+            if offset == 0xFFFFFFFF:
+                offset = next(values)
+            break
+        pos += 4 + length
+    return size, compressed, offset
+
+
+def load_zip_entries(url: str, game_dir: str | Path, session: Optional[requests.Session] = None) -> tuple[Path, list[ManifestEntry]]:
+    """
+    อ่าน zip ระยะไกล (download_url) แล้วจับคู่กับโฟลเดอร์เกมในเครื่อง
+
+    zip อาจมีโฟลเดอร์ครอบ gta_sa.exe อยู่ (เช่น "GTA San Andreas/gta_sa.exe")
+    → ใช้ตำแหน่งของ gta_sa.exe ใน zip หาโฟลเดอร์ที่ถูกแตกไฟล์ไว้ในเครื่อง
+    คืน (โฟลเดอร์ราก, รายการไฟล์)
+    """
+    remote = RemoteZip(url, session)
+    entries = remote.entries()
+    game_dir = Path(game_dir)
+
+    gta = next((e for e in entries if PurePosixPath(e.path).name.lower() == "gta_sa.exe"), None)
+    depth = len(PurePosixPath(gta.path).parts) - 1 if gta else 0
+    root = game_dir
+    for _ in range(depth):
+        root = root.parent
+    return root, entries
+
+
+class DeltaUpdateThread(QThread):
+    """
+    Thread อัปเดตแบบ delta: เทียบ manifest กับไฟล์ในโฟลเดอร์เกม แล้วโหลดเฉพาะไฟล์ที่เปลี่ยน / ขาด
+    (โหลดพร้อมกันไม่เกิน workers ไฟล์ ผ่าน connection pool เดียวกัน)
+
+    ไม่มี manifest → อ่าน central directory ของ archive_url (zip) ผ่าน Range แทน
+    แล้วเทียบ CRC32 / ขนาดของแต่ละ member กับไฟล์ในเครื่อง (ไม่ต้องเปลี่ยนวิธี publish)
+    """
+    progress = pyqtSignal(int)              # เปอร์เซ็นต์ (0-100) ตามจำนวน byte ที่ต้องโหลด
+    # สัญญาณ: (สำเร็จหรือไม่, ข้อความผลลัพธ์หรือ error)
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, root: str | Path, manifest: Optional[dict | str], archive_url: Optional[str] = None, workers: int = 4):
+        super().__init__()
+        self.root = Path(root)
+        self.manifest = manifest
+        self.archive_url = archive_url
+        self.workers = workers
+        self._running = True
+
+        self._lock = threading.Lock()
+        self._received = 0
+        self._total = 0
+        self._last_percent = -1
+
+    def cancel(self):
+        self._running = False
+
+    def run(self):
+        index = None
+        try:
+            if self.manifest:
+                entries = load_manifest(self.manifest, self.archive_url)
+            else:
+                self.root, entries = load_zip_entries(self.archive_url, self.root)
+            index = InstallIndex(self.root)
+            changed = plan_update(index, entries)
+            self._total = sum(entry.transfer_size for entry in changed) or 1
+
+            if changed:
+                self._download_all(index, changed)
+
+            total_size = sum(entry.size for entry in entries)
+            self.finished.emit(
+                True,
+                f"อัปเดต {len(changed)}/{len(entries)} ไฟล์ "
+                f"(โหลด {_format_size(self._received)} จากทั้งหมด {_format_size(total_size)})"
+            )
+
+        except requests.exceptions.RequestException as e:
+            self.finished.emit(False, f"ข้อผิดพลาดการเชื่อมต่อ: {e}")
+
+        except Exception as e:
+            self.finished.emit(False, f"อัปเดตไม่สำเร็จ: {type(e).__name__} - {e}")
+
+        finally:
+            try:
+                if index is not None:
+                    index.save()    # ไฟล์ที่โหลดเสร็จแล้วไม่ต้อง hash ใหม่รอบหน้า
+            except OSError as e:
+                print(f"บันทึก index ไม่สำเร็จ: {e}")
+
+    def _download_all(self, index: InstallIndex, changed: list[ManifestEntry]):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        def fetch(entry):
+            sha256, crc32 = fetch_entry(session, self.root, entry, self._on_bytes, lambda: not self._running)
+            index.record(entry.path, sha256, crc32)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(fetch, entry) for entry in changed]
+                for future in futures:
+                    error = future.exception()
+                    if error is not None:
+                        # ไฟล์หนึ่งพัง → หยุดไฟล์อื่นด้วย
+                        self._running = False
+                        for pending in futures:
+                            pending.cancel()
+                        raise error
+        finally:
+            session.close()
+
+    def _on_bytes(self, count: int):
+        with self._lock:
+            self._received += count
+            percent = min(100, self._received * 100 // self._total)
+            if percent == self._last_percent:
+                return
+            self._last_percent = percent
+        self.progress.emit(percent)
+
+
+def build_manifest(root: str | Path, base_url: str) -> dict:
+    """ สร้าง manifest จากโฟลเดอร์เกม (สำหรับเจ้าของเซิร์ฟเวอร์ ใช้ตอนเตรียมอัปเดต) """
+    root = Path(root)
+    files = []
+    for path in sorted(p for p in root.rglob("*") if p.is_file() and p.name != INDEX_NAME):
+        relpath = path.relative_to(root).as_posix()
+        files.append({"path": relpath, "size": path.stat().st_size, "sha256": _digest_file(path)[0]})
+    return {"base_url": base_url, "files": files}
+
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+# ตัวอย่างการใช้งาน: สร้าง manifest จากโฟลเดอร์เกม
+# python -m func.update "C:/Games/GTA San Andreas" https://yourdomain.com/update/v1.3/ > manifest.json
+if __name__ == "__main__":
+    print(json.dumps(build_manifest(sys.argv[1], sys.argv[2]), ensure_ascii=False, indent=4))
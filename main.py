@@ -11,16 +11,23 @@ from PyQt6.QtWidgets import (
     QFrame, QProgressBar
 )
 import subprocess
+import socket
 import atexit
 import signal
 import time
-from PyQt6.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, QPoint
-from PyQt6.QtGui import QPalette, QColor, QPainter, QLinearGradient, QBrush, QPixmap, QIcon
+from PyQt6.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, QPoint, QPointF
+from PyQt6.QtGui import QPalette, QColor, QPainter, QLinearGradient, QBrush, QPixmap, QIcon, QPen, QPolygonF
 from func import check_server
-from func.download import Downloader, file_hash
+from func.query_cache import cached_query
+from func.download import Downloader
 from func.request import get_config, save_image_from_url, download_file
 from func.registry import SampRegistry
 from func.file import clean_assets, ExtractThread, find_gta_sa, launch_samp
+from func.update import DeltaUpdateThread
+from func.latency import LatencyThread
+from func.poller import StatusPoller
+from func.history import HistoryRecorder
+import fake_server
 
 # คลาสสำหรับวาดพื้นหลังแบบ gradient
 class GradientWidget(QWidget):
@@ -163,6 +170,44 @@ class NewsCard(QFrame):
 
 
 
+# คลาสสำหรับวาดกราฟประวัติจำนวนผู้เล่น
+class HistoryChart(QWidget):
+    """Widget สำหรับวาดกราฟเส้นจำนวนผู้เล่นย้อนหลัง"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.points = []
+        self.setFixedHeight(60)
+        self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
+
+    # ตั้งค่าจุดของกราฟ (list ของ (timestamp, players))
+    def set_points(self, points):
+        self.points = [(x, y) for x, y in points if y == y]  # ตัด NaN
+        self.update()
+
+    # ฟังก์ชันสำหรับวาดกราฟ
+    def paintEvent(self, event):
+        if len(self.points) < 2:
+            return
+
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+
+        x0, x1 = self.points[0][0], self.points[-1][0]
+        y1 = max(y for _, y in self.points) or 1
+        span = (x1 - x0) or 1
+        w, h = self.width() - 2, self.height() - 2
+
+        polygon = QPolygonF([
+            QPointF(1 + (x - x0) / span * w, 1 + h - y / y1 * h)
+            for x, y in self.points
+        ])
+
+        pen = QPen(QColor("#ff0000"))
+        pen.setWidthF(1.5)
+        painter.setPen(pen)
+        painter.drawPolyline(polygon)
+
+
 # คลาสสำหรับแผงแก้วโปร่งแสง
 class GlassPanel(QFrame):
     def __init__(self, parent=None):
@@ -336,7 +381,7 @@ class TitleBar(QWidget):
         layout.setContentsMargins(15, 0, 15, 0)
         
         # Title
-        title = QLabel(f"{resp['hostname']} Launcher", self)
+        title = QLabel(f"{resp.hostname} Launcher", self)
         title.setStyleSheet("color: #ff0000; font-size: 14px; font-weight: bold; background: transparent; border: none;")
         
         layout.addWidget(title)
@@ -423,7 +468,7 @@ class MainWindow(QMainWindow):
         self.is_updating = False  # แก้ไข: ตั้งค่าเริ่มต้นเป็น False เพื่อหลีกเลี่ยง logic สับสน
         self.has_update = is_update
         self.current_notification = None
-        self.setWindowTitle(f"{resp['hostname']} Launcher")
+        self.setWindowTitle(f"{resp.hostname} Launcher")
         self.setFixedSize(1280, 720)
         self.setWindowFlags(Qt.WindowType.FramelessWindowHint)
         self.downloader = Downloader(self)
@@ -465,6 +510,10 @@ class MainWindow(QMainWindow):
         
         # Start player counter animation
         self.animate_player_count()
+        # วัด ping จริง (ผ่าน proxy เทียบกับเชื่อมต่อตรง)
+        self.start_latency_probe()
+        # อัปเดตสถานะเซิร์ฟเวอร์เบื้องหลังเป็นระยะ
+        self.start_status_poller()
         if self.has_update:
             self.on_check_update()  # แก้ไข: ลบ self.is_updating = False เพราะตั้งเป็น False อยู่แล้ว
     
@@ -613,11 +662,11 @@ class MainWindow(QMainWindow):
         right_layout.setSpacing(12)
         
         # Connect button
-        connect_btn = QPushButton("▶ เข้าเกม", right_widget)
-        connect_btn.setMinimumHeight(70)
-        connect_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.connect_btn = QPushButton("▶ เข้าเกม", right_widget)
+        self.connect_btn.setMinimumHeight(70)
+        self.connect_btn.setCursor(Qt.CursorShape.PointingHandCursor)
 
-        connect_btn.setStyleSheet("""
+        self.connect_btn.setStyleSheet("""
             QPushButton {
                 background: qlineargradient(x1:0,y1:0,x2:1,y2:1,
                 stop:0 #ff0000, stop:1 #7c3aed);
@@ -639,9 +688,9 @@ class MainWindow(QMainWindow):
             }
             """)
 
-        connect_btn.clicked.connect(self.on_connect)
-        if not self.resp.get("online", False):  # แก้ไข: ใช้ self.resp แทน resp เพื่อความสอดคล้อง
-            connect_btn.setEnabled(False)
+        self.connect_btn.clicked.connect(self.on_connect)
+        if not self.resp.online:  # แก้ไข: ใช้ self.resp แทน resp เพื่อความสอดคล้อง
+            self.connect_btn.setEnabled(False)
         # Secondary buttons
         update_btn = self.create_secondary_button("↻  ตรวจสอบการอัปเดต", right_widget)
         update_btn.clicked.connect(self.on_check_update)
@@ -682,7 +731,7 @@ class MainWindow(QMainWindow):
         status_v.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
         # ---- Status Text ----
-        online = self.resp.get("online", False)  # แก้ไข: ใช้ self.resp
+        online = self.resp.online  # แก้ไข: ใช้ self.resp
 
         status_text = "ออนไลท์" if online else "ออฟไลน์"
         status_color = "#00ff9c" if online else "#ff4b4b"
@@ -750,26 +799,48 @@ class MainWindow(QMainWindow):
         servers_layout = QVBoxLayout(servers_widget)
         servers_layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
         
-        server_count_label = QLabel(f"{self.resp['max_players']}", servers_widget)  # แก้ไข: ใช้ self.resp
-        server_count_label.setStyleSheet(self.player_count_label.styleSheet())
-        server_count_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.max_players_label = QLabel(f"{self.resp.max_players}", servers_widget)  # แก้ไข: ใช้ self.resp
+        self.max_players_label.setStyleSheet(self.player_count_label.styleSheet())
+        self.max_players_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         
         servers_label = QLabel("ผู้เล่นสูงสุด", servers_widget)
         servers_label.setStyleSheet(players_label.styleSheet())
         servers_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         
-        servers_layout.addWidget(server_count_label)
+        servers_layout.addWidget(self.max_players_label)
         servers_layout.addWidget(servers_label)
         
         stats_layout.addWidget(players_widget, 1)
         stats_layout.addWidget(divider)
         stats_layout.addWidget(servers_widget, 1)
+
+        # Ping panel
+        ping_panel = GlassPanel(right_widget)
+        ping_layout = QVBoxLayout(ping_panel)
+        ping_layout.setContentsMargins(20, 12, 20, 12)
+        ping_layout.setSpacing(4)
+
+        self.ping_label = QLabel("-- ms", ping_panel)
+        self.ping_label.setStyleSheet("color: #a0a0b0; font-size: 20px; font-weight: bold; background: transparent; border: none;")
+        self.ping_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+
+        self.ping_detail_label = QLabel("กำลังวัด ping...", ping_panel)
+        self.ping_detail_label.setStyleSheet(players_label.styleSheet())
+        self.ping_detail_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+
+        ping_layout.addWidget(self.ping_label)
+        ping_layout.addWidget(self.ping_detail_label)
+
+        # กราฟจำนวนผู้เล่นย้อนหลัง 30 วัน
+        self.history_chart = HistoryChart(ping_panel)
+        ping_layout.addWidget(self.history_chart)
         
-        right_layout.addWidget(connect_btn)
+        right_layout.addWidget(self.connect_btn)
         right_layout.addWidget(update_btn)
         right_layout.addWidget(discord_btn)
         right_layout.addWidget(icon_server)
         right_layout.addStretch()
+        right_layout.addWidget(ping_panel)
         right_layout.addWidget(stats_panel)
         
         main_layout.addWidget(right_widget, 0, 2, 1, 1)
@@ -841,20 +912,122 @@ class MainWindow(QMainWindow):
     # เริ่ม animation นับจำนวนผู้เล่น
     def animate_player_count(self):
         self.current_count = 0
-        self.target_count = self.resp['players']  # แก้ไข: ใช้ self.resp
+        self.target_count = self.resp.players  # แก้ไข: ใช้ self.resp
         
         self.counter_timer = QTimer(self)
         self.counter_timer.timeout.connect(self.update_player_count)
         self.counter_timer.start(25)
     
-    # อัพเดทจำนวนผู้เล่นใน animation
+    # อัพเดทจำนวนผู้เล่นใน animation (นับขึ้นหรือลงเข้าหา target)
     def update_player_count(self):
-        self.current_count += 21
-        if self.current_count >= self.target_count:
-            self.current_count = self.target_count
+        if self.current_count < self.target_count:
+            self.current_count = min(self.current_count + 21, self.target_count)
+        else:
+            self.current_count = max(self.current_count - 21, self.target_count)
+        if self.current_count == self.target_count:
             self.counter_timer.stop()
         self.player_count_label.setText(str(self.current_count))
+
+    # เริ่ม poll สถานะเซิร์ฟเวอร์ใน thread แยก
+    def start_status_poller(self):
+        try:
+            recorder = HistoryRecorder(resource_path("player_history.dat"))
+        except OSError as e:
+            print("เปิดไฟล์ประวัติผู้เล่นไม่สำเร็จ:", e)
+            recorder = None
+
+        try:
+            address = server_address(self.data)
+        except ProxyUnavailable as e:
+            # proxy ล้มเหลว → ไม่แอบ query / เข้าเกมตรง ให้ผู้เล่นรู้และห้ามกดเชื่อมต่อ
+            self.show_notification(f"เปิด proxy ไม่สำเร็จ: {e}", "error")
+            self.connect_btn.setEnabled(False)
+            return
+
+        self.status_poller = StatusPoller(*address, last=self.resp, recorder=recorder)
+        self.status_poller.changed.connect(self.on_status_changed)
+        self.status_poller.history.connect(self.history_chart.set_points)
+        self.status_poller.start()
+
+    # รับเฉพาะค่าที่เปลี่ยน แล้วอัปเดตเฉพาะ label ที่เกี่ยวข้อง
+    def on_status_changed(self, diff):
+        self.resp = self.resp._replace(**diff)
+
+        if "online" in diff:
+            online = diff["online"]
+            status_color = "#00ff9c" if online else "#ff4b4b"
+            self.server_status_label.setText("ออนไลท์" if online else "ออฟไลน์")
+            self.server_status_label.setStyleSheet(f"""
+                color: {status_color};
+                font-size: 20px;
+                font-weight: bold;
+                background: transparent;
+                border: none;
+            """)
+            self.connect_btn.setEnabled(online)
+
+        if "players" in diff:
+            self.target_count = diff["players"]
+            if not self.counter_timer.isActive():
+                self.counter_timer.start(25)
+
+        if "max_players" in diff:
+            self.max_players_label.setText(str(diff["max_players"]))
+
+    # ปรับความถี่การ poll ตามสถานะหน้าต่าง (focus / ย่อ)
+    def changeEvent(self, event):
+        if hasattr(self, "status_poller"):
+            if self.isMinimized():
+                self.status_poller.set_mode("minimized")
+            elif self.isActiveWindow():
+                self.status_poller.set_mode("focused")
+            else:
+                self.status_poller.set_mode("background")
+        super().changeEvent(event)
+
+    # หยุด thread เบื้องหลังก่อนปิดหน้าต่าง
+    def closeEvent(self, event):
+        if hasattr(self, "status_poller"):
+            self.status_poller.stop()
+            if self.status_poller.wait(2000) and self.status_poller.recorder:
+                self.status_poller.recorder.close()
+        super().closeEvent(event)
     
+    # เริ่มวัด ping ใน thread แยก
+    def start_latency_probe(self):
+        try:
+            address = server_address(self.data)
+        except ProxyUnavailable:
+            self.ping_label.setText("-- ms")
+            self.ping_detail_label.setText("proxy ไม่ทำงาน")
+            return
+
+        self.latency_thread = LatencyThread(
+            address,
+            (self.data['server_game']['ip'], int(self.data['server_game']['port']))
+        )
+        self.latency_thread.measured.connect(self.on_latency_measured)
+        self.latency_thread.start()
+
+    # แสดงผล ping ที่วัดได้
+    def on_latency_measured(self, proxy, direct):
+        if proxy["avg"] is None:
+            self.ping_label.setText("-- ms")
+            self.ping_label.setStyleSheet("color: #ff4b4b; font-size: 20px; font-weight: bold; background: transparent; border: none;")
+            self.ping_detail_label.setText("ไม่ได้รับการตอบกลับ")
+            return
+
+        avg = proxy["avg"]
+        color = "#00ff9c" if avg < 80 else "#f59e0b" if avg < 150 else "#ff4b4b"
+        self.ping_label.setText(f"{avg:.0f} ms")
+        self.ping_label.setStyleSheet(f"color: {color}; font-size: 20px; font-weight: bold; background: transparent; border: none;")
+
+        direct_text = f"{direct['avg']:.0f} ms" if direct["avg"] is not None else "--"
+        self.ping_detail_label.setText(
+            f"ผ่าน Proxy {avg:.0f} ms · ตรง {direct_text}\n"
+            f"p95 {proxy['p95']:.0f} ms · jitter {proxy['jitter']:.1f} ms · loss {proxy['loss'] * 100:.0f}%"
+        )
+
     # เริ่มดาวน์โหลดไฟล์
     def start_download(self):
         url = self.data['game']['download_url']
@@ -870,11 +1043,48 @@ class MainWindow(QMainWindow):
             save_path=self.save,
             on_progress=self.on_dl_progress,
             on_finished=self.on_dl_done,
-            on_error=self.on_dl_error
+            on_error=self.on_dl_error,
+            # โหลดหลาย connection พร้อมกัน (เซิร์ฟเวอร์ไม่รองรับ Range → กลับเป็น connection เดียวเอง)
+            segments=int(self.data['game'].get('segments', 4))
         )
 
 
 
+    # อัปเดตเฉพาะไฟล์ที่เปลี่ยน (เคยติดตั้งเกมแล้ว)
+    # มี game.manifest → ใช้ manifest, ไม่มี → อ่าน central directory ของ download_url (.zip) ผ่าน Range
+    def start_delta_update(self):
+        manifest = self.data['game'].get('manifest')
+        gta_path = self.registry.get_gta_path()
+        if not gta_path or not os.path.isfile(gta_path):
+            return False
+        if not manifest and not urlparse(self.data['game']['download_url']).path.lower().endswith(".zip"):
+            return False
+
+        self.show_notification("พบการอัปเดตใหม่! กำลังดาวน์โหลดเฉพาะไฟล์ที่เปลี่ยน...", "info")
+        self.delta_thread = DeltaUpdateThread(
+            os.path.dirname(gta_path),
+            manifest,
+            archive_url=self.data['game']['download_url']
+        )
+        self.delta_thread.progress.connect(self.on_dl_progress)
+        self.delta_thread.finished.connect(self.on_delta_done)
+        self.delta_thread.start()
+        return True
+
+    # เมื่ออัปเดตแบบ delta เสร็จ
+    def on_delta_done(self, ok, result):
+        if ok:
+            self.has_update = False
+            self.is_updating = False
+            self.registry.set_version(self.data['version'])
+            self.show_notification(result, "success")
+            self.reset_progress()
+        else:
+            # delta ล้มเหลว → กลับไปโหลดไฟล์เต็มแบบเดิม
+            print("Delta update error:", result)
+            self.show_notification("อัปเดตบางส่วนไม่สำเร็จ — กำลังดาวน์โหลดไฟล์เต็ม...", "warning")
+            self.start_download()
+
     # อัพเดท progress การดาวน์โหลด
     def on_dl_progress(self, p):
         self.progress_bar.setValue(p)
@@ -882,11 +1092,10 @@ class MainWindow(QMainWindow):
         self.progress_text.setText("Downloading...")
 
     # เมื่อดาวน์โหลดเสร็จ
-    def on_dl_done(self, path):
+    def on_dl_done(self, path, sha256):
         self.show_notification("ดาวน์โหลดเสร็จสมบูรณ์ — กำลังตรวจสอบไฟล์", "info")
 
-        sha256 = file_hash(path)
-
+        # sha256 คำนวณระหว่างดาวน์โหลดแล้ว (ไม่ต้องอ่านไฟล์ซ้ำบน GUI thread)
         if sha256 == self.data['game']['sha256']:
 
             self.show_notification("ตรวจสอบความถูกต้องของไฟล์สำเร็จ", "success")
@@ -993,13 +1202,19 @@ class MainWindow(QMainWindow):
             self.username_input.setFocus()
             return
         
+        # เข้าเกมผ่าน proxy (port ที่ proxy bind ได้จริง) proxy ล้มเหลว → ไม่ให้เข้าเกม
+        try:
+            address = server_address(self.data)
+        except ProxyUnavailable as e:
+            self.show_notification(f"เปิด proxy ไม่สำเร็จ: {e}", "error")
+            return
+
         self.show_notification(f"กำลังเชื่อมต่อกับเซิร์ฟเวอร์ในฐานะ {username}", "info")
         self.animate_progress(1500, lambda: self.show_notification("เชื่อมต่อสำเร็จ!", "success"))
         get_gta_path = self.registry.get_gta_path()
         launch_samp(
             get_gta_path,
-            data['server_game']['ip'],
-            data['server_game']['port']
+            *address
         )
     # เมื่อกด check update (แก้ไข logic เพื่อ re-check version จริงๆ และลบ code ซ้ำ)
     def on_check_update(self):
@@ -1019,8 +1234,9 @@ class MainWindow(QMainWindow):
         
         def check_complete():
             if self.has_update:
-                self.show_notification("พบการอัปเดตใหม่! กำลังดาวน์โหลด...", "info")
-                self.start_download()
+                if not self.start_delta_update():
+                    self.show_notification("พบการอัปเดตใหม่! กำลังดาวน์โหลด...", "info")
+                    self.start_download()
             else:
                 self.is_updating = False
                 self.show_notification("คุณใช้เวอร์ชันล่าสุดแล้ว!", "success")
@@ -1077,6 +1293,31 @@ def main(ctx):
     sys.exit(exit_code)
 
 proxy_process = None
+# proxy ที่รันใน process ของ launcher เอง (proxy_mode = "inprocess")
+proxy_server = None
+# port ที่ proxy bind ได้จริง (ลอง PROXY_PORT ก่อน ถ้าถูกใช้อยู่จะได้ port ว่างอื่นแทน)
+# None = proxy ไม่ทำงาน
+PROXY_PORT = 7777
+proxy_port = None
+# สาเหตุที่ proxy เปิดไม่สำเร็จ (แสดงให้ผู้เล่นเห็น)
+proxy_error = None
+
+
+class ProxyUnavailable(RuntimeError):
+    """ proxy เปิดไม่สำเร็จ และไม่ได้ตั้ง proxy_mode = "direct" """
+
+
+def server_address(data):
+    """
+    ที่อยู่ที่ launcher / เกมควรเชื่อมต่อ: ผ่าน proxy เสมอ
+    เชื่อมต่อเซิร์ฟเวอร์จริงตรง ๆ เฉพาะเมื่อตั้ง proxy_mode = "direct" ไว้เอง
+    proxy ไม่ทำงาน → raise ProxyUnavailable (ไม่แอบเลี่ยง proxy)
+    """
+    if data.get("proxy_mode") == "direct":
+        return data['server_game']['ip'], int(data['server_game']['port'])
+    if proxy_port is None:
+        raise ProxyUnavailable(proxy_error or "proxy ไม่ทำงาน")
+    return "127.0.0.1", proxy_port
 
 
 def resource_path(path):
@@ -1088,27 +1329,72 @@ def resource_path(path):
     return os.path.join(base_path, path)
 
 
-# ==============================
-# 🔥 Kill process ที่ใช้ PORT
-# ==============================
-def kill_port(port):
-    try:
-        cmd = f'for /f "tokens=5" %a in (\'netstat -ano ^| findstr :{port}\') do taskkill /PID %a /F'
-        subprocess.call(cmd, shell=True,
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL)
-    except:
-        pass
-
-
 # ==============================
 # 🚀 START PROXY
 # ==============================
 def start_proxy(data):
-    global proxy_process
+    """
+    เปิด proxy ตาม data["proxy_mode"]
+        "inprocess" (ค่าเริ่มต้น) : รัน proxy เป็น thread ใน launcher → พร้อมใช้ในไม่กี่ ms
+        "process"                 : รัน func/fake_server.exe แยก (แบบเดิม)
+        "direct"                  : ไม่ใช้ proxy เชื่อมต่อเซิร์ฟเวอร์จริงตรง ๆ
+
+    data["proxy_engine"] เลือก engine ของ proxy (fake_server.ENGINES) ค่าเริ่มต้น "threaded"
+    (selectors / mmsg ยังไม่ได้วัดว่าเร็วกว่าบน Windows จึงไม่เปิดเป็นค่าเริ่มต้น)
+    """
+    global proxy_server
+
+    mode = data.get("proxy_mode", "inprocess")
+    if mode == "direct":
+        print("proxy_mode = direct → ไม่เปิด proxy")
+        return
+
+    if mode == "inprocess":
+        try:
+            start_proxy_inprocess(data)
+            return
+        except OSError as e:
+            print("เปิด proxy ในตัวไม่สำเร็จ ใช้ fake_server.exe แทน:", e)
+            if proxy_server is not None:
+                proxy_server.stop()     # stop() ซ้ำได้ (start() ที่ล้มเหลวก็ปิดของตัวเองแล้ว)
+            proxy_server = None
+
+    start_proxy_process(data)
+
+
+def start_proxy_inprocess(data):
+    global proxy_server, proxy_port
+
+    engine = fake_server.ENGINES.get(data.get("proxy_engine", "threaded"), fake_server.SampUDPProxy)
+    proxy_server = engine(
+        local_host="127.0.0.1",
+        local_port=PROXY_PORT,
+        real_server=(data['server_game']['ip'], int(data['server_game']['port'])),
+        logger=fake_server.PacketLogger("error"),
+        port_fallback=True
+    )
+
+    proxy_server.start()
+
+    if not proxy_server.ready.wait(1.0):
+        # ปิด socket / thread ที่เปิดไปแล้ว ไม่ให้ค้างถือ port ไว้ตอน fake_server.exe จะ bind ต่อ
+        proxy_server.stop()
+        raise OSError("proxy ไม่พร้อมทำงาน")
+
+    proxy_port = proxy_server.LOCAL_PORT
+    print("Proxy running in-process on port", proxy_port)
+
+
+def start_proxy_process(data, timeout=10.0):
+    """
+    เปิด fake_server.exe แล้วรอข้อความ READY <port> ทาง UDP (ไม่ต้องเดาเวลาด้วย sleep)
+    """
+    global proxy_process, proxy_port, proxy_error
 
-    print("Cleaning port 7777...")
-    kill_port(7777)
+    # socket รับสัญญาณพร้อมจาก proxy (port ว่างที่ระบบเลือกให้)
+    ready = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    ready.bind(("127.0.0.1", 0))
+    ready.settimeout(0.05)
 
     proxy_path = resource_path("func/fake_server.exe")
 
@@ -1116,9 +1402,12 @@ def start_proxy(data):
         [
             proxy_path,
             "--local-ip", "127.0.0.1",
-            "--local-port", "7777",
+            "--local-port", str(PROXY_PORT),
+            "--port-fallback",
+            "--ready-addr", "127.0.0.1:%d" % ready.getsockname()[1],
             "--server-ip", data['server_game']['ip'],
-            "--server-port", str(data['server_game']['port'])
+            "--server-port", str(data['server_game']['port']),
+            "--engine", data.get("proxy_engine", "threaded")
         ],
         creationflags=(
             subprocess.CREATE_NO_WINDOW #DEBUG: หาก server ไม่ทำงาน ให้ลอง comment บรรทัดนี้ออกเพื่อดู error
@@ -1128,14 +1417,60 @@ def start_proxy(data):
 
     print("Proxy PID:", proxy_process.pid)
 
-    time.sleep(1.5)
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            try:
+                packet, sender = ready.recvfrom(256)
+            except socket.timeout:
+                if proxy_process.poll() is not None:
+                    proxy_error = f"fake_server.exe ปิดตัวลง (exit code {proxy_process.returncode})"
+                    print("Proxy exited:", proxy_process.returncode)
+                    return
+                continue
+
+            # รับเฉพาะจากเครื่องนี้ (fake_server.exe ส่งจาก 127.0.0.1 เสมอ) ที่อื่น → ทิ้งแล้วรอต่อ
+            if sender[0] != "127.0.0.1":
+                print("ข้าม packet READY จาก", sender)
+                continue
+
+            status, _, detail = packet.decode(errors="replace").partition(" ")
+            if status == "READY":
+                try:
+                    port = int(detail)
+                except ValueError:
+                    port = 0
+                if not 0 < port < 65536:
+                    # ข้อความเสีย / ไม่ใช่ของ proxy → รอข้อความที่ถูกต้องจนกว่าจะหมดเวลา
+                    print("ข้ามข้อความ READY ที่ไม่ถูกต้อง:", packet[:64])
+                    continue
+                proxy_port = port
+                print("Proxy ready on port", proxy_port)
+            elif status == "ERROR":
+                proxy_error = detail or "fake_server.exe แจ้ง error"
+                print("Proxy error:", detail)
+            else:
+                print("ข้ามข้อความที่ไม่รู้จัก:", packet[:64])
+                continue
+            return
+
+        proxy_error = f"fake_server.exe ไม่ตอบกลับภายใน {timeout:g} วินาที"
+        print("Proxy ไม่ตอบกลับภายใน", timeout, "วินาที")
+    finally:
+        ready.close()
 
 
 # ==============================
 # 🛑 STOP PROXY (KILL TREE)
 # ==============================
 def stop_proxy():
-    global proxy_process
+    global proxy_process, proxy_server, proxy_port
+
+    proxy_port = None
+
+    if proxy_server is not None:
+        proxy_server.stop()
+        proxy_server = None
 
     if not proxy_process:
         return
@@ -1167,12 +1502,17 @@ if __name__ == "__main__":
 
     start_proxy(data)
 
-    resp = check_server.query_server(
-        '127.0.0.1',
-        7777
-    )
+    # query ผ่าน cache กลาง → ส่วนอื่นที่ถามซ้ำภายใน TTL จะได้ค่าทันที
+    try:
+        resp = cached_query(
+            *server_address(data)
+        )
+    except ProxyUnavailable as e:
+        # ไม่ query ตรงแทน → แสดงเป็นออฟไลน์ แล้ว MainWindow จะแจ้ง error และห้ามเข้าเกม
+        print("Proxy unavailable:", e)
+        resp = check_server.OFFLINE[check_server.QueryError.NETWORK]
 
-    registry = SampRegistry(resp['hostname'])
+    registry = SampRegistry(resp.hostname)
 
     is_update = False
 